@@ -1,12 +1,17 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional, List
-import os
 import logging
 from datetime import datetime
 
+from ids import next_id
+from settings import settings
+from catalog import Catalog, ACTIVE_GAMES, ACTIVE_APPS, ALL_PRODUCTS
+from vault import DeliveryVault
+from pricing import CRYPTO_CURRENCIES, CURRENCY, PricingError, from_minor, rate_table
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -38,7 +43,6 @@ class Product(BaseModel):
     image_url: str
     game_id: Optional[int] = None
     app_id: Optional[int] = None
-    delivery_data: str
 
 class Game(BaseModel):
     id: int
@@ -50,26 +54,24 @@ class OrderCreate(BaseModel):
     payment_method: str
 
 # Имитация базы данных (в реальном проекте используйте PostgreSQL)
-db = {
-    "users": [],
-    "games": [
+catalog = Catalog(
+    games=[
         {"id": 1, "name": "Genshin Impact", "icon_url": "https://via.placeholder.com/100"},
         {"id": 2, "name": "Honkai: Star Rail", "icon_url": "https://via.placeholder.com/100"},
         {"id": 3, "name": "Mobile Legends", "icon_url": "https://via.placeholder.com/100"},
     ],
-    "apps": [
+    apps=[
         {"id": 1, "name": "Продвижение", "icon_url": "https://via.placeholder.com/100"},
         {"id": 2, "name": "Дизайн", "icon_url": "https://via.placeholder.com/100"},
     ],
-    "products": [
+    products=[
         {
             "id": 1,
             "game_id": 1,
             "name": "Аккаунт AR60",
             "description": "Аккаунт с полным прохождением",
             "price": 5000,
-            "image_url": "https://via.placeholder.com/300",
-            "delivery_data": "Логин: genshin123\nПароль: pass123"
+            "image_url": "https://via.placeholder.com/300"
         },
         {
             "id": 2,
@@ -77,10 +79,23 @@ db = {
             "name": "Пакет Jade",
             "description": "10000 Jade и премиум предметы",
             "price": 2500,
-            "image_url": "https://via.placeholder.com/300",
-            "delivery_data": "Код: STAR-RAIL-CODE-123"
+            "image_url": "https://via.placeholder.com/300"
         },
-    ]
+    ],
+)
+
+# Данные для выдачи - отдельно от каталога, в зашифрованном виде
+delivery_vault = DeliveryVault()
+SEED_DELIVERY_DATA = {
+    1: "Логин: genshin123\nПароль: pass123",
+    2: "Код: STAR-RAIL-CODE-123",
+}
+for _product_id, _delivery_data in SEED_DELIVERY_DATA.items():
+    delivery_vault.put(_product_id, _delivery_data)
+
+db = {
+    "users": [],
+    "orders": []
 }
 
 # Middleware для проверки токена Telegram
@@ -88,7 +103,7 @@ def verify_telegram_token(token: str):
     # В реальном проекте здесь должна быть проверка WebApp токена
     return True
 
-def get_current_user(authorization: str = Depends()):
+def get_current_user(authorization: str = Header(...)):
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid token format")
     
@@ -101,7 +116,7 @@ def get_current_user(authorization: str = Depends()):
         telegram_id=token[:10],
         first_name="Test",
         username="test_user",
-        is_admin=os.getenv("ADMIN_ID", "896706118") in token
+        is_admin=settings.current.admin_id in token
     )
 
 @app.get("/")
@@ -111,19 +126,19 @@ async def root():
 @app.get("/api/dashboard")
 async def get_dashboard(current_user: User = Depends(get_current_user)):
     """Получить данные для дашборда"""
+    all_products = catalog.listing(ALL_PRODUCTS)
     return {
         "user": current_user.dict(),
-        "games": db["games"],
-        "apps": db["apps"],
-        "last_viewed": db["products"][0] if db["products"] else None,
-        "all_products": db["products"]
+        "games": catalog.listing(ACTIVE_GAMES),
+        "apps": catalog.listing(ACTIVE_APPS),
+        "last_viewed": next(iter(all_products), None),
+        "all_products": all_products
     }
 
 @app.get("/api/games/{game_id}/products")
 async def get_game_products(game_id: int):
     """Получить товары для конкретной игры"""
-    products = [p for p in db["products"] if p.get("game_id") == game_id]
-    return products
+    return catalog.game_products(game_id)
 
 @app.post("/api/products/{product_id}/view")
 async def track_product_view(product_id: int, current_user: User = Depends(get_current_user)):
@@ -136,40 +151,50 @@ async def create_order(order_data: OrderCreate, current_user: User = Depends(get
     """Создать новый заказ"""
     
     # Найти товар
-    product = next((p for p in db["products"] if p["id"] == order_data.product_id), None)
+    product = catalog.get_product(order_data.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    # Крипта: сумма в монетах по закэшированному курсу, фиксируется в заказе
+    quote = None
+    if order_data.payment_method in CRYPTO_CURRENCIES:
+        try:
+            quote = rate_table.quote(order_data.payment_method, product.price_minor)
+        except PricingError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    
     # Создать заказ
-    order_id = len(db.get("orders", [])) + 1
+    order_id = next_id()
     order = {
         "id": order_id,
         "user_id": current_user.telegram_id,
         "product_id": order_data.product_id,
         "payment_method": order_data.payment_method,
-        "amount": product["price"],
+        "amount_minor": product.price_minor,
+        "currency": CURRENCY,
+        **(quote or {}),
         "status": "pending",
         "created_at": datetime.now().isoformat()
     }
+    db["orders"].append(order)
     
     # Отправить уведомление в группу Telegram
     await send_telegram_notification(order, product, current_user)
     
     # Вернуть ответ в зависимости от метода оплаты
-    if order_data.payment_method in ["ton", "usdt"]:
+    if quote:
         return {
             "order_id": order_id,
             "payment_url": f"https://t.me/CryptoBot?start=payment_{order_id}",
-            "requires_manual_payment": False
+            "requires_manual_payment": False,
+            "crypto_amount": quote["pay_amount"],
+            "crypto_currency": quote["pay_currency"],
+            "rate": quote["rate"]
         }
     else:  # bank_transfer
         return {
             "order_id": order_id,
-            "bank_details": {
-                "bank_name": "Тинькофф",
-                "card_number": "5536 9137 7373 9191",
-                "account_holder": "Иван Иванов"
-            },
+            "bank_details": settings.bank_details,
             "requires_manual_payment": True
         }
 
@@ -177,7 +202,7 @@ async def send_telegram_notification(order, product, user):
     """Отправить уведомление в Telegram группу"""
     # В реальном проекте здесь будет отправка через Telegram Bot API
     logger.info(f"Order notification for order #{order['id']}")
-    logger.info(f"User: {user.first_name}, Product: {product['name']}, Amount: {order['amount']}")
+    logger.info(f"User: {user.first_name}, Product: {product.name}, Amount: {from_minor(order['amount_minor'])}")
 
 @app.post("/api/webhook/crypto")
 async def crypto_webhook(data: dict):
@@ -198,14 +223,13 @@ async def create_game(game_data: dict, current_user: User = Depends(get_current_
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    game_id = len(db["games"]) + 1
-    game = {
+    game_id = next_id()
+    game = catalog.add_game({
         "id": game_id,
         "name": game_data.get("name"),
         "icon_url": game_data.get("icon_url", "")
-    }
-    db["games"].append(game)
-    return game
+    })
+    return game.to_dict()
 
 @app.post("/api/admin/products")
 async def create_product(product_data: dict, current_user: User = Depends(get_current_user)):
@@ -213,19 +237,18 @@ async def create_product(product_data: dict, current_user: User = Depends(get_cu
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    product_id = len(db["products"]) + 1
-    product = {
+    product_id = next_id()
+    product = catalog.add_product({
         "id": product_id,
         "name": product_data.get("name"),
         "description": product_data.get("description"),
         "price": product_data.get("price"),
         "image_url": product_data.get("image_url", ""),
-        "delivery_data": product_data.get("delivery_data"),
         "game_id": product_data.get("game_id"),
         "app_id": product_data.get("app_id")
-    }
-    db["products"].append(product)
-    return product
+    })
+    delivery_vault.put(product.id, product_data.get("delivery_data") or "")
+    return product.to_dict()
 
 # Health check для Vercel
 @app.get("/health")
@@ -1,15 +1,18 @@
 import os
 import logging
-from telegram import Bot, Update
+from telegram import Update
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler
 import asyncio
 
+from bot_gateway import bot_gateway
+from pricing import from_minor
+from settings import settings
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "8317412011:AAGopoDYX69WeeDo7YpqXRkCHKkmjoTR9eg")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "896706118"))
-ORDER_GROUP_ID = int(os.getenv("ORDER_GROUP_ID", "3605074724"))
 
 async def start_command(update: Update, context):
     """Обработчик команды /start"""
@@ -18,7 +21,7 @@ async def start_command(update: Update, context):
     # Создаем кнопку для открытия мини-приложения
     keyboard = [[{
         "text": "🎮 Открыть магазин",
-        "web_app": {"url": os.getenv("FRONTEND_URL", "https://your-domain.com")}
+        "web_app": {"url": settings.current.frontend_url}
     }]]
     
     await update.message.reply_text(
@@ -32,22 +35,21 @@ async def start_command(update: Update, context):
 async def send_order_notification(order_data: dict):
     """Отправить уведомление о заказе в группу"""
     try:
-        bot = Bot(token=TELEGRAM_BOT_TOKEN)
-        
         message = f"""
 🛒 НОВЫЙ ЗАКАЗ #{order_data['id']}
 
 👤 Покупатель: {order_data['user_name']}
 📦 Товар: {order_data['product_name']}
-💰 Сумма: {order_data['amount']} руб.
+💰 Сумма: {from_minor(order_data['amount_minor'])} руб.
 💳 Оплата: {order_data['payment_method']}
         """
         
-        await bot.send_message(
-            chat_id=ORDER_GROUP_ID,
-            text=message
-        )
-        logger.info(f"Order notification sent to group {ORDER_GROUP_ID}")
+        # Через общий шлюз с пулом соединений вместо нового Bot на каждый вызов
+        result = await bot_gateway.call("sendMessage", {"chat_id": settings.current.order_group_id, "text": message})
+        if not result.get("ok"):
+            logger.error(f"Failed to send notification: {result.get('description')}")
+            return
+        logger.info(f"Order notification sent to group {settings.current.order_group_id}")
         
     except Exception as e:
         logger.error(f"Failed to send notification: {e}")
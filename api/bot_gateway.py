@@ -0,0 +1,156 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import os
+import re
+
+import httpx
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# Одновременных запросов к Bot API и соединений в пуле
+BOT_GATEWAY_CONCURRENCY = int(os.getenv("BOT_GATEWAY_CONCURRENCY", "20"))
+BOT_GATEWAY_MAX_CONNECTIONS = int(os.getenv("BOT_GATEWAY_MAX_CONNECTIONS", "20"))
+BOT_GATEWAY_TIMEOUT = float(os.getenv("BOT_GATEWAY_TIMEOUT", "10"))
+BOT_GATEWAY_MAX_BATCH = int(os.getenv("BOT_GATEWAY_MAX_BATCH", "100"))
+# Методы, доступные снаружи через /api/bot/batch; внутренние вызовы не ограничены
+BOT_GATEWAY_METHODS = frozenset(
+    m.strip() for m in os.getenv(
+        "BOT_GATEWAY_METHODS",
+        "sendMessage,sendPhoto,editMessageText,editMessageReplyMarkup,deleteMessage,"
+        "answerCallbackQuery,answerWebAppQuery,sendChatAction",
+    ).split(",") if m.strip()
+)
+
+# Вызовы, которые можно склеивать: повтор с теми же параметрами ничего не меняет.
+# sendMessage, sendPhoto и т.п. сюда не входят - два одинаковых вызова должны дать два сообщения
+BOT_GATEWAY_DEDUP_METHODS = frozenset(
+    m.strip() for m in os.getenv("BOT_GATEWAY_DEDUP_METHODS", "answerCallbackQuery,answerWebAppQuery").split(",")
+    if m.strip()
+)
+
+_METHOD_NAME = re.compile(r"^[A-Za-z]+$")
+
+class BotGateway:
+    """Единая точка вызовов Bot API.
+
+    Один пул соединений httpx на процесс, пакеты вызовов выполняются
+    параллельно (не больше concurrency сразу). Одинаковые идемпотентные
+    вызовы (BOT_GATEWAY_DEDUP_METHODS), пока первый ещё в полёте, не
+    отправляются повторно - ждут его результат (повторные
+    answerCallbackQuery от двойных нажатий и т.п.).
+    Ошибки не бросаются: каждый вызов возвращает ответ Bot API
+    ({"ok": true, "result": ...} или {"ok": false, "description": ...}).
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        base_url: str = TELEGRAM_API_URL,
+        concurrency: int = BOT_GATEWAY_CONCURRENCY,
+        max_connections: int = BOT_GATEWAY_MAX_CONNECTIONS,
+        timeout: float = BOT_GATEWAY_TIMEOUT,
+    ):
+        # None - токен из settings.py: после перечитывания настроек вызовы идут уже с новым
+        self._token = token
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.requests = 0
+        self.deduplicated = 0
+        # Клиент, семафор и задачи привязаны к циклу событий, в котором созданы
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # (метод, параметры в каноническом JSON) -> задача первого такого вызова
+        self._in_flight: Dict[Tuple[str, str], asyncio.Task] = {}
+        # Закрытие клиентов прежних циклов событий, чтобы задачи не собрал GC
+        self._closing: Set[asyncio.Future] = set()
+
+    @property
+    def token(self) -> str:
+        return self._token if self._token is not None else settings.current.telegram_bot_token
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._close_stale(self._client, self._loop)
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._in_flight = {}
+
+    def _close_stale(self, client: Optional[httpx.AsyncClient], loop: Optional[asyncio.AbstractEventLoop]):
+        """Закрыть клиент прежнего цикла событий; его соединения привязаны к тому циклу"""
+        if client is None:
+            return
+        if loop is not None and loop.is_running():
+            # Цикл ещё работает в другом потоке - закрываем в нём
+            closing = asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.aclose(), loop))
+        else:
+            closing = asyncio.ensure_future(self._aclose_client(client))
+        self._closing.add(closing)
+        closing.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _aclose_client(client: httpx.AsyncClient):
+        try:
+            await client.aclose()
+        except RuntimeError:
+            # Цикл клиента уже закрыт: пул закрыт для новых запросов, сокеты освободит GC
+            logger.debug("Bot API client of a closed event loop released")
+
+    async def call(self, method: str, params: Optional[dict] = None) -> dict:
+        """Один вызов Bot API"""
+        if not _METHOD_NAME.match(method):
+            return {"ok": False, "description": f"Некорректный метод: {method!r}"}
+        if not self.token:
+            return {"ok": False, "description": "TELEGRAM_BOT_TOKEN не задан"}
+        self._bind()
+        params = params or {}
+        if method not in BOT_GATEWAY_DEDUP_METHODS:
+            return await self._send(method, params)
+        key = (method, json.dumps(params, sort_keys=True, ensure_ascii=False, default=str))
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.deduplicated += 1
+        else:
+            task = self._in_flight[key] = asyncio.ensure_future(self._send(method, params))
+            task.add_done_callback(lambda _, key=key: self._in_flight.pop(key, None))
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return await asyncio.shield(task)
+
+    async def batch(self, calls: Iterable[Tuple[str, Optional[dict]]]) -> List[dict]:
+        """Пакет вызовов параллельно; результаты в порядке вызовов"""
+        return list(await asyncio.gather(*(self.call(method, params) for method, params in calls)))
+
+    async def _send(self, method: str, params: dict) -> dict:
+        async with self._semaphore:
+            self.requests += 1
+            try:
+                response = await self._client.post(f"/bot{self.token}/{method}", json=params)
+                return response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                # Текст ошибки без URL: в нём токен бота
+                logger.error(f"Bot API {method} не выполнен: {type(e).__name__}")
+                return {"ok": False, "description": f"{type(e).__name__}: запрос к Bot API не выполнен"}
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+bot_gateway = BotGateway()
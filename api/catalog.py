@@ -0,0 +1,267 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+import os
+import sys
+import time
+
+from pricing import from_minor, to_minor
+from responses import dumps
+
+# Изменений в одной дельте каталога; при большем числе клиент перезагружает /api/dashboard
+CATALOG_DELTA_LIMIT = int(os.getenv("CATALOG_DELTA_LIMIT", "500"))
+# Закодированных представлений в памяти (LRU); сброшенное пересобирается по индексу категории
+CATALOG_VIEW_CACHE_SIZE = int(os.getenv("CATALOG_VIEW_CACHE_SIZE", "1000"))
+
+@dataclass(frozen=True, slots=True)
+class CatalogEntry:
+    """Игра или приложение в каталоге"""
+    id: int
+    name: str
+    icon_url: str
+    is_active: bool = True
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "icon_url": self.icon_url, "is_active": self.is_active}
+
+@dataclass(frozen=True, slots=True)
+class ProductRecord:
+    """Товар в каталоге: без per-instance __dict__, неизменяемый; данные для выдачи - в vault.py"""
+    id: int
+    name: str
+    description: str
+    price_minor: int  # копейки
+    image_url: str
+    game_id: Optional[int] = None
+    app_id: Optional[int] = None
+    is_active: bool = True
+
+    @property
+    def price(self):
+        return from_minor(self.price_minor)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "game_id": self.game_id,
+            "app_id": self.app_id,
+            "name": self.name,
+            "description": self.description,
+            # Рубли числом, как и раньше ждёт фронтенд
+            "price": float(self.price),
+            "image_url": self.image_url,
+            "is_active": self.is_active,
+        }
+
+def view_key(kind: str, category_id: Optional[int] = None) -> tuple:
+    return (kind, category_id)
+
+ALL_PRODUCTS = view_key("products")
+ACTIVE_GAMES = view_key("games")
+ACTIVE_APPS = view_key("apps")
+
+def _optional_int(value) -> Optional[int]:
+    return int(value) if value not in (None, "") else None
+
+def make_entry(data: dict) -> CatalogEntry:
+    return CatalogEntry(
+        id=int(data["id"]),
+        name=data.get("name") or "",
+        icon_url=sys.intern(data.get("icon_url") or ""),
+        is_active=data.get("is_active", True),
+    )
+
+def make_product(data: dict) -> ProductRecord:
+    return ProductRecord(
+        id=int(data["id"]),
+        name=data.get("name") or "",
+        description=data.get("description") or "",
+        price_minor=to_minor(data.get("price") or 0),
+        # Картинки часто общие для целой партии товаров
+        image_url=sys.intern(data.get("image_url") or ""),
+        game_id=_optional_int(data.get("game_id")),
+        app_id=_optional_int(data.get("app_id")),
+        is_active=data.get("is_active", True),
+    )
+
+class Catalog:
+    """Каталог in-memory движка с готовыми отфильтрованными представлениями"""
+
+    def __init__(
+        self,
+        games: Iterable[dict] = (),
+        apps: Iterable[dict] = (),
+        products: Iterable[dict] = (),
+        change_log_size: int = CATALOG_DELTA_LIMIT,
+        view_cache_size: int = CATALOG_VIEW_CACHE_SIZE,
+    ):
+        self.games: Dict[int, CatalogEntry] = {}
+        self.apps: Dict[int, CatalogEntry] = {}
+        self.products: Dict[int, ProductRecord] = {}
+        # Индекс товаров по категории: ("game", id) / ("app", id) -> {product_id: record}
+        self._by_category: Dict[tuple, Dict[int, ProductRecord]] = {}
+        # Ключ представления -> его JSON (пересобирается только при изменениях). Кэшируются
+        # только байты: кортеж и словари были бы второй и третьей копией тех же записей.
+        # Порядок - LRU, не больше view_cache_size представлений (0 - без кэша)
+        if view_cache_size < 0:
+            raise ValueError("view_cache_size must not be negative")
+        self.view_cache_size = view_cache_size
+        self._views: "OrderedDict[tuple, bytes]" = OrderedDict()
+        # Попадания и промахи listing_json - ответов API из готового JSON
+        self.hits = 0
+        self.misses = 0
+        # Версия каталога (мс, строго растёт) и журнал последних изменений:
+        # ("games"/"apps"/"products", id) -> версия, от старых к новым, по одной записи на объект.
+        # Дельта длиннее журнала не нужна (клиент всё равно перезагрузит каталог), поэтому он ограничен
+        self.version = 0
+        self.change_log_size = change_log_size
+        self._changes: "OrderedDict[tuple, int]" = OrderedDict()
+        # Версия последней вытесненной записи: изменения до неё уже не восстановить
+        self._log_floor = 0
+
+        for game in games:
+            self.add_game(game)
+        for app in apps:
+            self.add_app(app)
+        self.add_products(products)
+
+    def get_product(self, product_id: int) -> Optional[ProductRecord]:
+        return self.products.get(product_id)
+
+    def add_game(self, data: dict) -> CatalogEntry:
+        entry = make_entry(data)
+        self.games[entry.id] = entry
+        self._invalidate(ACTIVE_GAMES)
+        self._touch("games", entry.id)
+        return entry
+
+    def add_app(self, data: dict) -> CatalogEntry:
+        entry = make_entry(data)
+        self.apps[entry.id] = entry
+        self._invalidate(ACTIVE_APPS)
+        self._touch("apps", entry.id)
+        return entry
+
+    def add_product(self, data: dict) -> ProductRecord:
+        record = make_product(data)
+        previous = self._store_product(record)
+        self._touch("products", record.id)
+        self._invalidate_product(record)
+        if previous is not None:
+            self._invalidate_product(previous)
+        return record
+
+    def add_products(self, datas: Iterable[dict]) -> List[ProductRecord]:
+        """Пакетное добавление: представления сбрасываются один раз на пачку"""
+        records = []
+        touched = set()
+        for data in datas:
+            record = make_product(data)
+            previous = self._store_product(record)
+            self._touch("products", record.id)
+            records.append(record)
+            touched.update(self._category_keys(record))
+            if previous is not None:
+                touched.update(self._category_keys(previous))
+        if records:
+            self._invalidate(ALL_PRODUCTS)
+            for key in touched:
+                self._invalidate(key)
+        return records
+
+    def changes_since(self, since: int) -> Optional[dict]:
+        """Игры, приложения и товары, изменённые после версии since (неактивные тоже).
+
+        None - изменения уже вытеснены из журнала или версия неизвестна: клиенту нужен полный /api/dashboard.
+        """
+        if since > self.version or since < self._log_floor:
+            return None
+        changes = {"games": [], "apps": [], "products": []}
+        tables = {"games": self.games, "apps": self.apps, "products": self.products}
+        for (kind, record_id), version in reversed(self._changes.items()):
+            if version <= since:
+                break
+            changes[kind].append(tables[kind][record_id].to_dict())
+        return changes
+
+    def _touch(self, kind: str, record_id: int):
+        self.version = max(self.version + 1, int(time.time() * 1000))
+        self._changes[(kind, record_id)] = self.version
+        self._changes.move_to_end((kind, record_id))
+        while len(self._changes) > self.change_log_size:
+            self._log_floor = self._changes.popitem(last=False)[1]
+
+    def view(self, key: tuple) -> Tuple:
+        """Неизменяемое представление: кортеж записей каталога, собранный по индексу"""
+        return self._build_view(key)
+
+    def listing(self, key: tuple) -> List[dict]:
+        """Представление в виде ответа API; новый список на каждый вызов, вызывающий может его менять"""
+        return [record.to_dict() for record in self._build_view(key)]
+
+    def listing_json(self, key: tuple) -> bytes:
+        """Представление, закодированное в JSON один раз на версию каталога"""
+        encoded = self._views.get(key)
+        if encoded is None:
+            self.misses += 1
+            encoded = dumps(self.listing(key))
+            if self.view_cache_size:
+                self._views[key] = encoded
+                while len(self._views) > self.view_cache_size:
+                    self._views.popitem(last=False)
+        else:
+            self.hits += 1
+            self._views.move_to_end(key)
+        return encoded
+
+    def cache_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "views": len(self._views),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def game_products(self, game_id: int) -> List[dict]:
+        return self.listing(view_key("game", game_id))
+
+    def app_products(self, app_id: int) -> List[dict]:
+        return self.listing(view_key("app", app_id))
+
+    def _build_view(self, key: tuple) -> Tuple:
+        kind, category_id = key
+        if kind == "games":
+            return tuple(g for g in self.games.values() if g.is_active)
+        if kind == "apps":
+            return tuple(a for a in self.apps.values() if a.is_active)
+        if kind in ("game", "app"):
+            return tuple(p for p in self._by_category.get(key, {}).values() if p.is_active)
+        return tuple(p for p in self.products.values() if p.is_active)
+
+    def _category_keys(self, record: ProductRecord) -> List[tuple]:
+        keys = []
+        if record.game_id is not None:
+            keys.append(view_key("game", record.game_id))
+        if record.app_id is not None:
+            keys.append(view_key("app", record.app_id))
+        return keys
+
+    def _store_product(self, record: ProductRecord) -> Optional[ProductRecord]:
+        previous = self.products.get(record.id)
+        if previous is not None:
+            for key in self._category_keys(previous):
+                self._by_category.get(key, {}).pop(previous.id, None)
+        self.products[record.id] = record
+        for key in self._category_keys(record):
+            self._by_category.setdefault(key, {})[record.id] = record
+        return previous
+
+    def _invalidate_product(self, record: ProductRecord):
+        # Сбрасываем только представления, которых касается товар
+        self._invalidate(ALL_PRODUCTS)
+        for key in self._category_keys(record):
+            self._invalidate(key)
+
+    def _invalidate(self, key: tuple):
+        self._views.pop(key, None)
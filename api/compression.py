@@ -0,0 +1,170 @@
+from typing import Optional
+import os
+import zlib
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, gzip есть всегда
+    brotli = None
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+# Тела от этого размера сжимаются в пуле потоков; zlib и brotli отпускают GIL на время работы
+COMPRESSION_THREADPOOL_SIZE = int(os.getenv("COMPRESSION_THREADPOOL_SIZE", "65536"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+class _GzipCompressor:
+    encoding = "gzip"
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+class _BrotliCompressor:
+    encoding = "br"
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Выбрать br или gzip по заголовку Accept-Encoding (с учётом q=0)"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+class CompressionMiddleware:
+    """Сжатие brotli/gzip по Accept-Encoding для ответов больше порога.
+
+    Потоковые ответы сжимаются по частям с flush, чтобы клиент начинал
+    разбирать ответ до его окончания.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        threadpool_size: int = COMPRESSION_THREADPOOL_SIZE,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.threadpool_size = threadpool_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self.app, encoding, self.minimum_size, self.threadpool_size)
+        await responder(scope, receive, send)
+
+class _CompressionResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int, threadpool_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.threadpool_size = threadpool_size
+        self.send: Send = None
+        self.initial_message: Message = {}
+        self.compressor = None
+        self.passthrough = False
+        self.started = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def _start_compression(self, streaming: bool):
+        self.compressor = _BrotliCompressor() if self.encoding == "br" else _GzipCompressor()
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.compressor.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if streaming:
+            del headers["Content-Length"]
+
+    def _compress_chunk(self, body: bytes, more_body: bool) -> bytes:
+        return self.compressor.compress(body) + (self.compressor.flush() if more_body else self.compressor.finish())
+
+    async def _compress(self, body: bytes, more_body: bool) -> bytes:
+        if len(body) < self.threadpool_size:
+            return self._compress_chunk(body, more_body)
+        return await run_in_threadpool(self._compress_chunk, body, more_body)
+
+    async def send_compressed(self, message: Message):
+        if message["type"] == "http.response.start":
+            # Заголовки придерживаем, пока не ясно, будет ли тело сжато
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            # Потоки событий (SSE) не сжимаются, чтобы события доходили сразу
+            self.passthrough = (
+                "content-encoding" in headers
+                or headers.get("content-type", "").startswith("text/event-stream")
+            )
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.passthrough:
+            if not self.started:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        if not self.started:
+            self.started = True
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+            self._start_compression(streaming=more_body)
+            message["body"] = await self._compress(body, more_body)
+            if not more_body:
+                MutableHeaders(raw=self.initial_message["headers"])["Content-Length"] = str(len(message["body"]))
+            await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        message["body"] = await self._compress(body, more_body)
+        await self.send(message)
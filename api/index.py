@@ -1,11 +1,34 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, Optional, List, Tuple
+import atexit
+import csv
+import hashlib
+import hmac
+import io
+import json
 import os
 import logging
+import secrets
+import time
 from datetime import datetime
+import bisect
+from decimal import Decimal
+
+from ids import ids, next_id
+from storage import Storage
+from catalog import Catalog, ACTIVE_GAMES, ACTIVE_APPS, ALL_PRODUCTS, view_key
+from view_history import ViewHistoryStore, view_key as history_key
+from compression import CompressionMiddleware
+from responses import FastJSONResponse, dumps, stream_json_array
+from ratelimit import RateLimit
+from vault import DeliveryVault
+from pricing import CRYPTO_CURRENCIES, CURRENCY, PricingError, from_minor, rate_table, to_minor
+from order_feed import order_broker, order_event_stream, FEED_SNAPSHOT_SIZE
+from bot_gateway import bot_gateway, BOT_GATEWAY_MAX_BATCH, BOT_GATEWAY_METHODS
+from settings import settings
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -14,7 +37,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="UNIVERSAL SHOP API",
     description="API для универсального магазина игровых товаров и Telegram услуг",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -26,6 +50,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Сжатие brotli/gzip для крупных ответов (каталог, заказы)
+app.add_middleware(CompressionMiddleware)
+
+# Пул соединений шлюза Bot API закрывается при остановке
+app.add_event_handler("shutdown", bot_gateway.aclose)
+# Настройки (settings.py) перечитываются по SIGHUP
+app.add_event_handler("startup", settings.install_signal_handler)
+
+# Недавние просмотры и заказы в дашборде и /api/me/state
+RECENT_VIEWS_LIMIT = int(os.getenv("RECENT_VIEWS_LIMIT", "10"))
+USER_STATE_ORDERS = int(os.getenv("USER_STATE_ORDERS", "10"))
+# Сколько билет на ленту заказов ждёт подключения
+STREAM_TICKET_SECONDS = float(os.getenv("STREAM_TICKET_SECONDS", "30"))
+
+def json_bytes_response(content: bytes) -> Response:
+    """Отдать уже закодированный JSON без повторной сериализации"""
+    return Response(content=content, media_type="application/json")
+
 # Модели Pydantic
 class User(BaseModel):
     telegram_id: str
@@ -42,7 +84,6 @@ class Product(BaseModel):
     image_url: str
     game_id: Optional[int] = None
     app_id: Optional[int] = None
-    delivery_data: str
 
 class Game(BaseModel):
     id: int
@@ -63,28 +104,37 @@ class OrderCreate(BaseModel):
 class ViewHistory(BaseModel):
     product_id: int
 
+class ProductBulkUpdate(BaseModel):
+    # Отбор: заданные условия сужают набор
+    product_ids: Optional[List[int]] = None
+    game_id: Optional[int] = None
+    app_id: Optional[int] = None
+    # Изменения: price важнее price_multiplier
+    price: Optional[Decimal] = Field(None, ge=0)
+    price_multiplier: Optional[Decimal] = Field(None, gt=0)
+    is_active: Optional[bool] = None
+
 # Имитация базы данных
-db = {
-    "users": [],
-    "games": [
+# Каталог хранится компактно (см. catalog.py), остальное - в обычных списках
+catalog = Catalog(
+    games=[
         {"id": 1, "name": "Genshin Impact", "icon_url": "https://via.placeholder.com/100", "is_active": True},
         {"id": 2, "name": "Honkai: Star Rail", "icon_url": "https://via.placeholder.com/100", "is_active": True},
         {"id": 3, "name": "Mobile Legends", "icon_url": "https://via.placeholder.com/100", "is_active": True},
     ],
-    "apps": [
+    apps=[
         {"id": 1, "name": "Продвижение Telegram", "icon_url": "https://via.placeholder.com/100", "is_active": True},
         {"id": 2, "name": "Дизайн каналов", "icon_url": "https://via.placeholder.com/100", "is_active": True},
         {"id": 3, "name": "NFT Подарки", "icon_url": "https://via.placeholder.com/100", "is_active": True},
     ],
-    "products": [
+    products=[
         {
             "id": 1,
             "game_id": 1,
             "name": "Аккаунт AR60",
             "description": "Премиум аккаунт с полным прохождением и всеми персонажами",
             "price": 5000.0,
-            "image_url": "https://via.placeholder.com/300x200/4F46E5/FFFFFF?text=Genshin+Impact",
-            "delivery_data": "Логин: genshin_premium\nПароль: securepass123\nEmail: account@example.com"
+            "image_url": "https://via.placeholder.com/300x200/4F46E5/FFFFFF?text=Genshin+Impact"
         },
         {
             "id": 2,
@@ -92,8 +142,7 @@ db = {
             "name": "Пакет Jade x10000",
             "description": "Большой пакет валюты + эксклюзивные предметы",
             "price": 2500.0,
-            "image_url": "https://via.placeholder.com/300x200/7C3AED/FFFFFF?text=Star+Rail",
-            "delivery_data": "Код активации: HSR-CODE-789XYZ-2024\nСрок действия: 30 дней"
+            "image_url": "https://via.placeholder.com/300x200/7C3AED/FFFFFF?text=Star+Rail"
         },
         {
             "id": 3,
@@ -101,14 +150,105 @@ db = {
             "name": "Продвижение канала",
             "description": "Накрутка подписчиков + просмотров на 1 месяц",
             "price": 1500.0,
-            "image_url": "https://via.placeholder.com/300x200/10B981/FFFFFF?text=Promotion",
-            "delivery_data": "Для активации напишите @admin с номером заказа"
+            "image_url": "https://via.placeholder.com/300x200/10B981/FFFFFF?text=Promotion"
         },
     ],
-    "view_history": [],
+)
+
+# Данные для выдачи хранятся зашифрованными отдельно от каталога и расшифровываются только при выдаче
+delivery_vault = DeliveryVault(persistent=bool(os.getenv("STORAGE_PATH")))
+SEED_DELIVERY_DATA = {
+    1: "Логин: genshin_premium\nПароль: securepass123\nEmail: account@example.com",
+    2: "Код активации: HSR-CODE-789XYZ-2024\nСрок действия: 30 дней",
+    3: "Для активации напишите @admin с номером заказа",
+}
+for _product_id, _delivery_data in SEED_DELIVERY_DATA.items():
+    delivery_vault.put(_product_id, _delivery_data)
+
+db = {
+    "users": [],
+    # Заказы в порядке возрастания ID (ID монотонны, см. ids.py)
     "orders": []
 }
 
+# order_id -> заказ, чтобы не искать перебором по списку
+orders_by_id = {}
+
+# История просмотров по пользователям, с лимитом записей на каждого
+view_history = ViewHistoryStore()
+
+# Постоянное хранилище: журнал + снапшоты в STORAGE_PATH (без него всё живёт только в памяти)
+STORAGE_PATH = os.getenv("STORAGE_PATH")
+
+def _storage_state() -> dict:
+    """Полное состояние для снапшота; вызывается из потока снапшота.
+
+    Словари, которые меняют запросы, не обходятся напрямую: list() копирует их за один шаг под GIL.
+    """
+    return {
+        "orders": orders_by_id,
+        "view_history": view_history.entries(),
+        "games": {g.id: g.to_dict() for g in list(catalog.games.values())},
+        "apps": {a.id: a.to_dict() for a in list(catalog.apps.values())},
+        "products": {p.id: p.to_dict() for p in list(catalog.products.values())},
+        "secrets": delivery_vault.ciphertexts(),
+    }
+
+def _restore(tables: dict):
+    """Восстановить состояние из хранилища при старте"""
+    for game in tables.get("games", {}).values():
+        catalog.add_game(game)
+    for app_data in tables.get("apps", {}).values():
+        catalog.add_app(app_data)
+    for product_id, ciphertext in tables.get("secrets", {}).items():
+        delivery_vault.load(product_id, ciphertext)
+    for product in tables.get("products", {}).values():
+        # Старые записи журнала хранили данные для выдачи открытым текстом прямо в товаре
+        delivery_data = product.pop("delivery_data", None)
+        if delivery_data and product["id"] not in delivery_vault:
+            delivery_vault.put(product["id"], delivery_data)
+        catalog.add_product(product)
+
+    for order in tables.get("orders", {}).values():
+        # Старые заказы хранили сумму в рублях числом с плавающей точкой
+        if "amount" in order:
+            order["amount_minor"] = to_minor(order.pop("amount"))
+            order.setdefault("currency", CURRENCY)
+    orders_by_id.update(tables.get("orders", {}))
+    db["orders"] = sorted(orders_by_id.values(), key=lambda o: o["id"])
+    # Часы после рестарта могут отставать: новые ID - только после уже сохранённых
+    restored_ids = [key for table in ("games", "apps", "products", "orders") for key in tables.get(table, {})]
+    if restored_ids:
+        ids.advance_past(max(restored_ids))
+    # Записи сверх лимита (снапшоты до его появления) сразу удаляются и из журнала
+    return view_history.load(tables.get("view_history", {}).values())
+
+storage = None
+if STORAGE_PATH:
+    storage = Storage(
+        STORAGE_PATH,
+        state=_storage_state,
+        group_commit_ms=int(os.getenv("STORAGE_GROUP_COMMIT_MS", "10")),
+        snapshot_every=int(os.getenv("STORAGE_SNAPSHOT_EVERY", "100000")),
+    )
+    for key in _restore(storage.load()):
+        storage.put("view_history", key, None)
+    atexit.register(storage.close)
+
+def persist(table: str, key, record: Optional[dict]):
+    """Записать изменение в журнал (record=None - удаление)"""
+    if storage is not None:
+        storage.put(table, key, record)
+
+def persist_secret(product_id: int, delivery_data: str):
+    """Зашифровать данные для выдачи и записать шифротекст в журнал"""
+    persist("secrets", product_id, delivery_vault.put(product_id, delivery_data))
+
+def save_order(order: dict):
+    """Сохранить заказ и разослать изменение в ленту заказов админки"""
+    persist("orders", order["id"], order)
+    order_broker.publish(dict(order))
+
 # Middleware для проверки токена Telegram
 def verify_telegram_token(token: str):
     """Проверка токена Telegram WebApp"""
@@ -141,9 +281,23 @@ def get_current_user(authorization: str = None):
         telegram_id=telegram_id,
         first_name="Пользователь",
         username="telegram_user",
-        is_admin=str(os.getenv("ADMIN_ID", "896706118")) == telegram_id
+        is_admin=settings.current.admin_id == telegram_id
     )
 
+def get_rate_limited_user(authorization: str = None):
+    """Пользователь для лимита на пользователя; без токена - None, остается лимит на IP"""
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    return get_current_user(authorization)
+
+# Лимиты запросов по маршрутам; переопределяются через RATE_LIMIT_<ИМЯ>_USER / _IP
+dashboard_rate_limit = RateLimit("dashboard", per_user="60/60", per_ip="300/60", get_user=get_rate_limited_user)
+view_rate_limit = RateLimit("views", per_user="120/60", per_ip="600/60", get_user=get_rate_limited_user)
+order_rate_limit = RateLimit("orders", per_user="5/60", per_ip="20/60", get_user=get_rate_limited_user)
+webhook_rate_limit = RateLimit("crypto-webhook", per_ip="120/60")
+state_rate_limit = RateLimit("state", per_user="120/60", per_ip="600/60", get_user=get_rate_limited_user)
+catalog_rate_limit = RateLimit("catalog-delta", per_ip="600/60")
+
 @app.get("/")
 async def root():
     return {
@@ -159,72 +313,109 @@ async def root():
         }
     }
 
-@app.get("/api/dashboard")
+def _recent_views(user: User) -> List[dict]:
+    """Недавно просмотренные пользователем активные товары, новые первыми"""
+    recent = []
+    for product_id in view_history.recent(user.telegram_id):
+        product = catalog.get_product(product_id)
+        if product is not None and product.is_active:
+            recent.append(product.to_dict())
+            if len(recent) >= RECENT_VIEWS_LIMIT:
+                break
+    return recent
+
+@app.get("/api/dashboard", dependencies=[Depends(dashboard_rate_limit.dependency)])
 async def get_dashboard(authorization: Optional[str] = None):
     """Получить данные для дашборда"""
     try:
         current_user = get_current_user(authorization)
         
-        # Получаем последний просмотренный товар
-        last_viewed = None
-        if db["view_history"]:
-            last_product_id = db["view_history"][-1]["product_id"]
-            last_viewed = next((p for p in db["products"] if p["id"] == last_product_id), None)
-        
-        return {
-            "user": current_user.dict(),
-            "games": [g for g in db["games"] if g["is_active"]],
-            "apps": [a for a in db["apps"] if a["is_active"]],
-            "last_viewed": last_viewed,
-            "all_products": [p for p in db["products"] if p.get("is_active", True)]
-        }
+        recent = _recent_views(current_user)
+        
+        # Каталожные части берутся уже закодированными, сериализуется только пользовательская часть
+        return json_bytes_response(
+            b'{"user":' + dumps(current_user.dict())
+            + b',"games":' + catalog.listing_json(ACTIVE_GAMES)
+            + b',"apps":' + catalog.listing_json(ACTIVE_APPS)
+            + b',"last_viewed":' + dumps(recent[0] if recent else None)
+            + b',"recent_views":' + dumps(recent)
+            + b',"all_products":' + catalog.listing_json(ALL_PRODUCTS)
+            + b',"catalog_version":' + dumps(catalog.version)
+            + b'}'
+        )
     except Exception as e:
         logger.error(f"Error in dashboard: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/me/state", dependencies=[Depends(state_rate_limit.dependency)])
+async def get_user_state(authorization: Optional[str] = None):
+    """Профиль, история просмотров и последние заказы - без каталога"""
+    current_user = get_current_user(authorization)
+    recent = _recent_views(current_user)
+    orders = []
+    for order in reversed(db["orders"]):
+        if order["user_id"] == current_user.telegram_id:
+            orders.append(order)
+            if len(orders) >= USER_STATE_ORDERS:
+                break
+    return {
+        "user": current_user.dict(),
+        "last_viewed": recent[0] if recent else None,
+        "recent_views": recent,
+        "orders": orders,
+    }
+
+@app.get("/api/catalog/delta", dependencies=[Depends(catalog_rate_limit.dependency)])
+async def get_catalog_delta(since: int):
+    """Изменения каталога после версии из /api/dashboard или прошлой дельты"""
+    changes = catalog.changes_since(since)
+    if changes is None:
+        return {"version": catalog.version, "reset": True, "games": [], "apps": [], "products": []}
+    return {"version": catalog.version, "reset": False, **changes}
+
 @app.get("/api/games")
 async def get_games():
     """Получить список всех игр"""
-    return [g for g in db["games"] if g["is_active"]]
+    return json_bytes_response(catalog.listing_json(ACTIVE_GAMES))
 
 @app.get("/api/apps")
 async def get_apps():
     """Получить список всех приложений"""
-    return [a for a in db["apps"] if a["is_active"]]
+    return json_bytes_response(catalog.listing_json(ACTIVE_APPS))
 
 @app.get("/api/games/{game_id}/products")
 async def get_game_products(game_id: int):
     """Получить товары для конкретной игры"""
-    products = [p for p in db["products"] if p.get("game_id") == game_id and p.get("is_active", True)]
-    return products
+    return json_bytes_response(catalog.listing_json(view_key("game", game_id)))
 
 @app.get("/api/apps/{app_id}/products")
 async def get_app_products(app_id: int):
     """Получить товары для конкретного приложения"""
-    products = [p for p in db["products"] if p.get("app_id") == app_id and p.get("is_active", True)]
-    return products
+    return json_bytes_response(catalog.listing_json(view_key("app", app_id)))
 
 @app.get("/api/products")
 async def get_all_products():
     """Получить все товары"""
-    return [p for p in db["products"] if p.get("is_active", True)]
+    return json_bytes_response(catalog.listing_json(ALL_PRODUCTS))
 
-@app.post("/api/products/{product_id}/view")
+@app.post("/api/products/{product_id}/view", dependencies=[Depends(view_rate_limit.dependency)])
 async def track_product_view(product_id: int, authorization: Optional[str] = None):
     """Отслеживание просмотра товара"""
     try:
         current_user = get_current_user(authorization)
         
-        # Удаляем старую запись для этого товара
-        db["view_history"] = [vh for vh in db["view_history"] 
-                             if not (vh["user_id"] == current_user.telegram_id and vh["product_id"] == product_id)]
-        
-        # Добавляем новую запись
-        db["view_history"].append({
+        # Повторный просмотр заменяет старую запись; самые старые сверх лимита вытесняются
+        entry = {
             "user_id": current_user.telegram_id,
             "product_id": product_id,
             "viewed_at": datetime.now().isoformat()
-        })
+        }
+        evicted = view_history.record(entry)
+        key = history_key(entry["user_id"], product_id)
+        persist("view_history", key, None)
+        persist("view_history", key, entry)
+        for evicted_key in evicted:
+            persist("view_history", evicted_key, None)
         
         logger.info(f"User {current_user.telegram_id} viewed product {product_id}")
         return {"success": True, "message": "View tracked"}
@@ -232,74 +423,91 @@ async def track_product_view(product_id: int, authorization: Optional[str] = Non
         logger.error(f"Error tracking view: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.delete("/api/view-history/{product_id}")
+@app.delete("/api/view-history/{product_id}", dependencies=[Depends(view_rate_limit.dependency)])
 async def delete_view_history(product_id: int, authorization: Optional[str] = None):
     """Удалить товар из истории просмотров"""
     try:
         current_user = get_current_user(authorization)
         
-        initial_count = len(db["view_history"])
-        db["view_history"] = [vh for vh in db["view_history"] 
-                             if not (vh["user_id"] == current_user.telegram_id and vh["product_id"] == product_id)]
-        
-        deleted = initial_count - len(db["view_history"])
+        deleted = int(view_history.remove(current_user.telegram_id, product_id))
+        if deleted:
+            persist("view_history", history_key(current_user.telegram_id, product_id), None)
         return {"success": deleted > 0, "deleted_count": deleted}
     except Exception as e:
         logger.error(f"Error deleting view history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/orders")
+@app.get("/api/payment-methods")
+async def get_payment_methods():
+    """Включённые способы оплаты из настроек (закодированы один раз на загрузку)"""
+    return json_bytes_response(settings.payment_methods_json)
+
+@app.post("/api/orders", dependencies=[Depends(order_rate_limit.dependency)])
 async def create_order(order_data: OrderCreate, authorization: Optional[str] = None):
     """Создать новый заказ"""
     try:
         current_user = get_current_user(authorization)
         
+        if order_data.payment_method not in settings.current.payment_methods:
+            raise HTTPException(status_code=400, detail="Payment method not available")
+        
         # Найти товар
-        product = next((p for p in db["products"] if p["id"] == order_data.product_id), None)
+        product = catalog.get_product(order_data.product_id)
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
+        # Крипта: сумма в монетах по закэшированному курсу, фиксируется в заказе
+        quote = None
+        if order_data.payment_method in CRYPTO_CURRENCIES:
+            try:
+                quote = rate_table.quote(order_data.payment_method, product.price_minor)
+            except PricingError as e:
+                raise HTTPException(status_code=503, detail=str(e))
+        
         # Создать заказ
-        order_id = len(db["orders"]) + 1
+        order_id = next_id()
         order = {
             "id": order_id,
             "user_id": current_user.telegram_id,
             "user_name": current_user.first_name,
             "product_id": order_data.product_id,
-            "product_name": product["name"],
+            "product_name": product.name,
             "payment_method": order_data.payment_method,
-            "amount": product["price"],
+            "amount_minor": product.price_minor,
+            "currency": CURRENCY,
+            **(quote or {}),
             "status": "pending",
             "created_at": datetime.now().isoformat()
         }
         
         db["orders"].append(order)
+        orders_by_id[order_id] = order
+        save_order(order)
         
         # Отправить уведомление в группу Telegram
         await send_telegram_notification(order, product, current_user)
         
         # Вернуть ответ в зависимости от метода оплаты
-        if order_data.payment_method in ["ton", "usdt"]:
+        if quote:
             return {
                 "order_id": order_id,
-                "payment_url": f"https://t.me/CryptoBot?start=payment_{order_id}_{int(product['price'])}",
+                "payment_url": f"https://t.me/CryptoBot?start=payment_{order_id}",
                 "requires_manual_payment": False,
-                "crypto_amount": product["price"],
-                "crypto_currency": "TON" if order_data.payment_method == "ton" else "USDT"
+                "crypto_amount": quote["pay_amount"],
+                "crypto_currency": quote["pay_currency"],
+                "rate": quote["rate"]
             }
         else:  # bank_transfer
             return {
                 "order_id": order_id,
-                "bank_details": {
-                    "bank_name": "Тинькофф",
-                    "card_number": "5536 9137 7373 9191",
-                    "account_holder": "Иван Иванов",
-                    "phone": "+7 (999) 123-45-67"
-                },
+                "bank_details": settings.bank_details,
                 "requires_manual_payment": True,
-                "amount_rub": product["price"],
+                "amount_rub": str(product.price),
                 "comment": f"Оплата заказа #{order_id}"
             }
+    except HTTPException:
+        # 404 / 503 отдаются как есть, а не превращаются в 500
+        raise
     except Exception as e:
         logger.error(f"Error creating order: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -307,20 +515,14 @@ async def create_order(order_data: OrderCreate, authorization: Optional[str] = N
 async def send_telegram_notification(order, product, user):
     """Отправить уведомление в Telegram группу"""
     try:
-        import requests
+        current = settings.current
         
-        TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-        ORDER_GROUP_ID = os.getenv("ORDER_GROUP_ID", "3605074724")
-        
-        if not TELEGRAM_BOT_TOKEN:
+        if not bot_gateway.token:
             logger.warning("TELEGRAM_BOT_TOKEN not set, skipping notification")
             return
         
-        payment_methods = {
-            "ton": "TON",
-            "usdt": "USDT (TRC20)",
-            "bank_transfer": "Перевод по реквизитам"
-        }
+        # Сумма в монетах, зафиксированная при оформлении
+        crypto_amount = f" ({order['pay_amount']} {order['pay_currency']} по курсу {order['rate']})" if order.get("pay_amount") else ""
         
         message = f"""
 🛒 *НОВЫЙ ЗАКАЗ* #{order['id']}
@@ -328,18 +530,17 @@ async def send_telegram_notification(order, product, user):
 👤 *Покупатель:* {user.first_name} {user.last_name or ''}
 📱 @{user.username or 'без username'}
 
-📦 *Товар:* {product['name']}
-💰 *Сумма:* {order['amount']} ₽
-💳 *Способ оплаты:* {payment_methods.get(order['payment_method'], order['payment_method'])}
+📦 *Товар:* {product.name}
+💰 *Сумма:* {from_minor(order['amount_minor'])} ₽{crypto_amount}
+💳 *Способ оплаты:* {current.payment_methods.get(order['payment_method'], order['payment_method'])}
 🕐 *Время:* {datetime.now().strftime('%d.%m.%Y %H:%M')}
 
 *Статус:* {order['status']}
         """
         
         # Отправляем сообщение в группу
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
         payload = {
-            "chat_id": ORDER_GROUP_ID,
+            "chat_id": current.order_group_id,
             "text": message,
             "parse_mode": "Markdown",
             "reply_markup": {
@@ -356,36 +557,67 @@ async def send_telegram_notification(order, product, user):
             }
         }
         
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
+        result = await bot_gateway.call("sendMessage", payload)
+        if result.get("ok"):
             logger.info(f"Telegram notification sent for order #{order['id']}")
         else:
-            logger.error(f"Failed to send Telegram notification: {response.text}")
+            logger.error(f"Failed to send Telegram notification: {result.get('description')}")
             
     except Exception as e:
         logger.error(f"Error sending Telegram notification: {e}")
 
-@app.post("/api/webhook/crypto")
-async def crypto_webhook(data: dict):
-    """Вебхук для подтверждения криптоплатежей"""
-    logger.info(f"Crypto webhook received: {data}")
+async def send_delivery(order: dict):
+    """Отправить покупателю данные для получения товара"""
+    try:
+        if not bot_gateway.token:
+            logger.warning("TELEGRAM_BOT_TOKEN not set, skipping delivery")
+            return
+        
+        delivery_data = delivery_vault.get(order["product_id"])
+        if delivery_data is None:
+            logger.error(f"No delivery data for order #{order['id']}")
+            return
+        
+        result = await bot_gateway.call("sendMessage", {
+            "chat_id": order["user_id"],
+            "text": f"🎉 Ваш товар успешно оплачен!\n\nДанные для получения:\n{delivery_data}\n\nСпасибо за покупку!"
+        })
+        if not result.get("ok"):
+            logger.error(f"Failed to deliver order #{order['id']}: {result.get('description')}")
+    except Exception as e:
+        logger.error(f"Error delivering order #{order['id']}: {e}")
+
+@app.post("/api/webhook/crypto", dependencies=[Depends(webhook_rate_limit.dependency)])
+async def crypto_webhook(request: Request):
+    """Вебхук для подтверждения криптоплатежей; тело подписано провайдером (X-Signature)"""
+    secret = settings.current.crypto_webhook_secret
+    if not secret:
+        # Подпись проверить нечем: оплату подтверждает админ вручную
+        raise HTTPException(status_code=503, detail="Crypto webhook is not configured")
+    body = await request.body()
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(request.headers.get("X-Signature", ""), expected):
+        raise HTTPException(status_code=403, detail="Invalid signature")
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Invalid payload")
+    logger.info(f"Crypto webhook for order #{data.get('order_id')}: {data.get('status')}")
     
-    # В реальном проекте здесь будет проверка подписи и обработка платежа
     if data.get("status") == "success":
         order_id = data.get("order_id")
         if order_id:
-            # Находим заказ и обновляем статус
-            for order in db["orders"]:
-                if order["id"] == order_id:
-                    order["status"] = "paid"
-                    order["paid_at"] = datetime.now().isoformat()
-                    
-                    # Находим товар и отправляем данные пользователю
-                    product = next((p for p in db["products"] if p["id"] == order["product_id"]), None)
-                    if product:
-                        logger.info(f"Order #{order_id} paid, product data: {product['delivery_data'][:50]}...")
-                    
-                    break
+            # Находим заказ и обновляем статус; повторный вебхук не выдаёт товар второй раз
+            order = orders_by_id.get(order_id)
+            if order and order["status"] == "pending":
+                order["status"] = "paid"
+                order["paid_at"] = datetime.now().isoformat()
+                save_order(order)
+                
+                # Данные для выдачи расшифровываются только сейчас
+                await send_delivery(order)
     
     return {"status": "ok", "message": "Webhook processed"}
 
@@ -403,28 +635,43 @@ async def telegram_webhook(update: dict):
             order_id = int(data.split("_")[1])
             
             # Находим заказ
-            for order in db["orders"]:
-                if order["id"] == order_id:
-                    order["status"] = "completed"
-                    order["completed_at"] = datetime.now().isoformat()
-                    
-                    # Отправляем подтверждение
-                    import requests
-                    TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-                    
-                    if TELEGRAM_BOT_TOKEN:
-                        requests.post(
-                            f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                            json={
-                                "callback_query_id": callback["id"],
-                                "text": f"Заказ #{order_id} подтвержден!"
-                            }
-                        )
-                    
-                    break
+            order = orders_by_id.get(order_id)
+            if order:
+                order["status"] = "completed"
+                order["completed_at"] = datetime.now().isoformat()
+                save_order(order)
+                
+                # Отправляем подтверждение; повторная доставка того же update не даёт второго вызова
+                await bot_gateway.call("answerCallbackQuery", {
+                    "callback_query_id": callback["id"],
+                    "text": f"Заказ #{order_id} подтвержден!"
+                })
     
     return {"ok": True}
 
+class BotCall(BaseModel):
+    method: str
+    params: dict = {}
+
+class BotBatch(BaseModel):
+    calls: List[BotCall]
+
+@app.post("/api/bot/batch")
+async def bot_batch(batch: BotBatch, request: Request, authorization: Optional[str] = None):
+    """Пакет вызовов Bot API через общий шлюз; результат на каждый вызов (для прокси фронтенда и админки)"""
+    secret = request.headers.get("X-Gateway-Secret", "")
+    expected = settings.current.bot_gateway_secret
+    if not (expected and hmac.compare_digest(secret, expected)):
+        if not get_current_user(authorization).is_admin:
+            raise HTTPException(status_code=403, detail="Gateway secret or admin access required")
+    if len(batch.calls) > BOT_GATEWAY_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"Не больше {BOT_GATEWAY_MAX_BATCH} вызовов в пакете")
+    forbidden = sorted({call.method for call in batch.calls} - BOT_GATEWAY_METHODS)
+    if forbidden:
+        raise HTTPException(status_code=400, detail=f"Методы недоступны через шлюз: {', '.join(forbidden)}")
+    results = await bot_gateway.batch((call.method, call.params) for call in batch.calls)
+    return {"results": results}
+
 # Админ эндпоинты
 @app.post("/api/admin/games")
 async def create_game(game_data: dict, authorization: Optional[str] = None):
@@ -435,17 +682,18 @@ async def create_game(game_data: dict, authorization: Optional[str] = None):
         if not current_user.is_admin:
             raise HTTPException(status_code=403, detail="Admin access required")
         
-        game_id = len(db["games"]) + 1
-        game = {
+        game_id = next_id()
+        game = catalog.add_game({
             "id": game_id,
             "name": game_data.get("name", ""),
             "icon_url": game_data.get("icon_url", ""),
             "is_active": True
-        }
-        db["games"].append(game)
+        })
+        
+        persist("games", game.id, game.to_dict())
         
-        logger.info(f"Admin {current_user.telegram_id} created game: {game['name']}")
-        return game
+        logger.info(f"Admin {current_user.telegram_id} created game: {game.name}")
+        return game.to_dict()
     except Exception as e:
         logger.error(f"Error creating game: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -459,17 +707,18 @@ async def create_app(app_data: dict, authorization: Optional[str] = None):
         if not current_user.is_admin:
             raise HTTPException(status_code=403, detail="Admin access required")
         
-        app_id = len(db["apps"]) + 1
-        app = {
+        app_id = next_id()
+        app = catalog.add_app({
             "id": app_id,
             "name": app_data.get("name", ""),
             "icon_url": app_data.get("icon_url", ""),
             "is_active": True
-        }
-        db["apps"].append(app)
+        })
+        
+        persist("apps", app.id, app.to_dict())
         
-        logger.info(f"Admin {current_user.telegram_id} created app: {app['name']}")
-        return app
+        logger.info(f"Admin {current_user.telegram_id} created app: {app.name}")
+        return app.to_dict()
     except Exception as e:
         logger.error(f"Error creating app: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -483,26 +732,141 @@ async def create_product(product_data: dict, authorization: Optional[str] = None
         if not current_user.is_admin:
             raise HTTPException(status_code=403, detail="Admin access required")
         
-        product_id = len(db["products"]) + 1
-        product = {
+        product_id = next_id()
+        product = catalog.add_product({
             "id": product_id,
             "name": product_data.get("name", ""),
             "description": product_data.get("description", ""),
-            "price": float(product_data.get("price", 0)),
+            "price": product_data.get("price", 0),
             "image_url": product_data.get("image_url", ""),
-            "delivery_data": product_data.get("delivery_data", ""),
             "game_id": product_data.get("game_id"),
             "app_id": product_data.get("app_id"),
             "is_active": True
-        }
-        db["products"].append(product)
+        })
+        
+        persist("products", product.id, product.to_dict())
+        persist_secret(product.id, product_data.get("delivery_data", ""))
         
-        logger.info(f"Admin {current_user.telegram_id} created product: {product['name']}")
-        return product
+        logger.info(f"Admin {current_user.telegram_id} created product: {product.name}")
+        return product.to_dict()
     except Exception as e:
         logger.error(f"Error creating product: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+IMPORT_CHUNK_SIZE = 1000
+PRODUCT_IMPORT_FIELDS = ("name", "description", "price", "image_url", "delivery_data", "game_id", "app_id")
+
+def _iter_import_rows(upload: UploadFile):
+    """Построчное чтение CSV/NDJSON без загрузки файла целиком"""
+    text_stream = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    if (upload.filename or "").lower().endswith(".csv"):
+        yield from enumerate(csv.DictReader(text_stream), start=1)
+        return
+    for number, line in enumerate(text_stream, start=1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield number, e
+
+def _validate_import_row(row) -> dict:
+    """Проверить строку импорта; ValueError с описанием ошибки"""
+    if not isinstance(row, dict):
+        raise ValueError(f"Некорректная строка: {row}")
+    product = {key: row.get(key) for key in PRODUCT_IMPORT_FIELDS}
+    if not product["name"]:
+        raise ValueError("name: обязательное поле")
+    try:
+        product["price"] = from_minor(to_minor(product["price"]))
+    except ValueError:
+        raise ValueError("price: должно быть числом")
+    if product["price"] < 0:
+        raise ValueError("price: не может быть отрицательной")
+    for key, entries in (("game_id", catalog.games), ("app_id", catalog.apps)):
+        if product[key] in (None, ""):
+            product[key] = None
+            continue
+        try:
+            product[key] = int(product[key])
+        except (TypeError, ValueError):
+            raise ValueError(f"{key}: должно быть целым числом")
+        if product[key] not in entries:
+            raise ValueError(f"{key}: {product[key]} не существует")
+    return product
+
+@app.post("/api/admin/products/import")
+async def import_products(file: UploadFile = File(...), authorization: Optional[str] = None):
+    """Массовый импорт товаров из CSV/NDJSON (только админ)"""
+    current_user = get_current_user(authorization)
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    errors = []
+    total = 0
+    inserted = 0
+    chunk = []
+    
+    def flush():
+        nonlocal inserted
+        for product in catalog.add_products(chunk):
+            persist("products", product.id, product.to_dict())
+        for row in chunk:
+            persist_secret(row["id"], row["delivery_data"] or "")
+        inserted += len(chunk)
+        chunk.clear()
+    
+    for number, row in _iter_import_rows(file):
+        total += 1
+        try:
+            product = _validate_import_row(row)
+        except ValueError as e:
+            errors.append({"row": number, "error": str(e)})
+            continue
+        chunk.append({**product, "id": next_id(), "is_active": True})
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            flush()
+    flush()
+    
+    logger.info(f"Admin {current_user.telegram_id} imported {inserted} of {total} products")
+    return {"total": total, "inserted": inserted, "failed": len(errors), "errors": errors[:1000]}
+
+@app.post("/api/admin/products/bulk-update")
+async def bulk_update_products(changes: ProductBulkUpdate, authorization: Optional[str] = None):
+    """Массово изменить цену/активность товаров (только админ)"""
+    current_user = get_current_user(authorization)
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    product_ids = set(changes.product_ids) if changes.product_ids is not None else None
+    game_id = changes.game_id
+    app_id = changes.app_id
+    if product_ids is None and game_id is None and app_id is None:
+        raise HTTPException(status_code=400, detail="Select products by product_ids, game_id or app_id")
+    
+    selected = [
+        p for p in catalog.products.values()
+        if (product_ids is None or p.id in product_ids)
+        and (game_id is None or p.game_id == game_id)
+        and (app_id is None or p.app_id == app_id)
+    ]
+    
+    updated = []
+    for product in selected:
+        data = product.to_dict()
+        if changes.price is not None:
+            data["price"] = changes.price
+        elif changes.price_multiplier is not None:
+            # Decimal: округление до копеек в make_product
+            data["price"] = product.price * changes.price_multiplier
+        if changes.is_active is not None:
+            data["is_active"] = changes.is_active
+        updated.append(data)
+    
+    for product in catalog.add_products(updated):
+        persist("products", product.id, product.to_dict())
+    
+    return {"updated": len(updated)}
+
 @app.put("/api/admin/orders/{order_id}/complete")
 async def complete_order(order_id: int, authorization: Optional[str] = None):
     """Завершить заказ (только админ)"""
@@ -513,12 +877,13 @@ async def complete_order(order_id: int, authorization: Optional[str] = None):
             raise HTTPException(status_code=403, detail="Admin access required")
         
         # Находим заказ
-        order = next((o for o in db["orders"] if o["id"] == order_id), None)
+        order = orders_by_id.get(order_id)
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
         
         order["status"] = "completed"
         order["completed_at"] = datetime.now().isoformat()
+        save_order(order)
         
         logger.info(f"Admin {current_user.telegram_id} completed order #{order_id}")
         return {"success": True, "order_id": order_id}
@@ -527,19 +892,82 @@ async def complete_order(order_id: int, authorization: Optional[str] = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/admin/orders")
-async def get_all_orders(authorization: Optional[str] = None):
-    """Получить все заказы (только админ)"""
+async def get_all_orders(
+    authorization: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """Получить заказы (только админ); after_id/limit - keyset-пагинация по ID"""
     try:
         current_user = get_current_user(authorization)
         
         if not current_user.is_admin:
             raise HTTPException(status_code=403, detail="Admin access required")
         
-        return db["orders"]
+        start = 0
+        if after_id is not None:
+            start = bisect.bisect_right(db["orders"], after_id, key=lambda o: o["id"])
+        end = start + limit if limit is not None else None
+        return stream_json_array(db["orders"][start:end])
     except Exception as e:
         logger.error(f"Error getting orders: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/admin/cache")
+async def get_cache_stats(authorization: Optional[str] = None):
+    """Попадания и промахи готовых представлений каталога (только админ)"""
+    current_user = get_current_user(authorization)
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {"product_listings": catalog.cache_stats()}
+
+@app.post("/api/admin/settings/reload")
+async def reload_settings(authorization: Optional[str] = None):
+    """Перечитать настройки без передеплоя, как по SIGHUP (только админ)"""
+    current_user = get_current_user(authorization)
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    previous = settings.current
+    reloaded = settings.reload()
+    return {"reloaded": reloaded, "changed": settings.changed_fields(previous)}
+
+# Одноразовые билеты на ленту заказов: билет -> (пользователь, срок по time.monotonic()).
+# Живут в памяти инстанса, как и сами заказы
+stream_tickets: Dict[str, Tuple[User, float]] = {}
+
+@app.post("/api/admin/orders/stream-ticket")
+async def create_stream_ticket(request: Request, authorization: Optional[str] = None):
+    """Одноразовый билет на одно подключение к ленте заказов, чтобы токен не попадал в URL и логи"""
+    current_user = get_current_user(authorization or request.headers.get("authorization"))
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    now = time.monotonic()
+    for expired in [ticket for ticket, (_, expires_at) in stream_tickets.items() if expires_at <= now]:
+        del stream_tickets[expired]
+    ticket = secrets.token_urlsafe(32)
+    stream_tickets[ticket] = (current_user, now + STREAM_TICKET_SECONDS)
+    return {"ticket": ticket, "expires_in": STREAM_TICKET_SECONDS}
+
+@app.get("/api/admin/orders/stream")
+async def stream_orders(request: Request, ticket: str):
+    """Лента заказов для админки (SSE): снимок последних заказов, затем только изменения"""
+    # EventSource не умеет заголовки - приходит с билетом из POST /api/admin/orders/stream-ticket.
+    # На Vercel соединение обрывается по таймауту функции, админка переподключается с новым билетом
+    current_user, expires_at = stream_tickets.pop(ticket, (None, 0.0))
+    if current_user is None or expires_at <= time.monotonic():
+        raise HTTPException(status_code=401, detail="Invalid or expired stream ticket")
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return StreamingResponse(
+        order_event_stream(order_broker, lambda: db["orders"][-FEED_SNAPSHOT_SIZE:], request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Health check для Vercel
 @app.get("/health")
 async def health_check():
@@ -0,0 +1,67 @@
+from typing import Awaitable, Callable, List, Set
+import asyncio
+import os
+
+from responses import dumps
+
+FEED_SNAPSHOT_SIZE = int(os.getenv("FEED_SNAPSHOT_SIZE", "50"))
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "1000"))
+FEED_KEEPALIVE_SECONDS = float(os.getenv("FEED_KEEPALIVE_SECONDS", "15"))
+
+# Отправляется подписчику, который отстал: вместо пропущенных событий он получит снимок заново
+RESYNC = object()
+
+class OrderBroker:
+    """Раздача событий по заказам подписчикам SSE внутри процесса"""
+
+    def __init__(self, queue_size: int = FEED_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, order_event):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(order_event)
+            except asyncio.QueueFull:
+                # Медленный клиент получает свежий снимок вместо бесконечной очереди
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+order_broker = OrderBroker()
+
+def format_event(name: str, data) -> bytes:
+    return b"event: " + name.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+async def order_event_stream(
+    broker: OrderBroker,
+    snapshot: Callable[[], List[dict]],
+    is_disconnected: Callable[[], Awaitable[bool]],
+):
+    """Тело SSE: снимок последних заказов, затем только изменения по отдельным заказам"""
+    # Подписываемся до снимка, чтобы не потерять заказы, созданные между ними
+    queue = broker.subscribe()
+    try:
+        yield format_event("snapshot", snapshot())
+        while True:
+            try:
+                order_event = await asyncio.wait_for(queue.get(), timeout=FEED_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                yield b": keepalive\n\n"
+                continue
+            if order_event is RESYNC:
+                yield format_event("snapshot", snapshot())
+            else:
+                yield format_event("order", order_event)
+    finally:
+        broker.unsubscribe(queue)
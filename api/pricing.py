@@ -0,0 +1,162 @@
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP, ROUND_UP
+from typing import Dict, Optional, Tuple
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Цены и суммы заказов хранятся в копейках (целые числа)
+CURRENCY = "RUB"
+MINOR_DIGITS = 2
+
+# "stub" (фиксированные PRICING_STUB_RATES) или "file" (JSON в PRICING_RATES_FILE, его обновляет внешний скрипт)
+PRICING_RATE_SOURCE = os.getenv("PRICING_RATE_SOURCE", "stub")
+PRICING_RATES_FILE = os.getenv("PRICING_RATES_FILE", "rates.json")
+PRICING_STUB_RATES = os.getenv("PRICING_STUB_RATES", "TON=250,USDT=95")
+PRICING_REFRESH_SECONDS = float(os.getenv("PRICING_REFRESH_SECONDS", "60"))
+# Курсы старше этого не используются: оплата криптой отвечает 503, пока обновление не пройдёт
+PRICING_RATE_TTL_SECONDS = float(os.getenv("PRICING_RATE_TTL_SECONDS", "900"))
+
+# Метод оплаты -> (монета, шаг суммы); округляем вверх, чтобы заказ не был недоплачен
+CRYPTO_CURRENCIES = {
+    "ton": ("TON", Decimal("0.0001")),
+    "usdt": ("USDT", Decimal("0.01")),
+}
+
+class PricingError(Exception):
+    pass
+
+def to_minor(amount) -> int:
+    """Рубли (число или строка) в копейки, округление половины вверх"""
+    try:
+        value = Decimal(str(amount))
+    except InvalidOperation:
+        raise ValueError(f"Некорректная сумма: {amount!r}")
+    if not value.is_finite():
+        raise ValueError(f"Некорректная сумма: {amount!r}")
+    return int(value.scaleb(MINOR_DIGITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_minor(minor: Optional[int]) -> Optional[Decimal]:
+    """Копейки в рубли ровно с двумя знаками"""
+    if minor is None:
+        return None
+    return Decimal(minor).scaleb(-MINOR_DIGITS)
+
+def parse_rates(spec: str) -> Dict[str, Decimal]:
+    """Разобрать "TON=250,USDT=95" в рубли за монету"""
+    rates = {}
+    for part in spec.split(","):
+        if part.strip():
+            currency, _, rate = part.partition("=")
+            rates[currency.strip().upper()] = Decimal(rate.strip())
+    return rates
+
+class RateSource:
+    """Источник курсов; fetch() блокирующий и вызывается в фоновом потоке"""
+
+    def fetch(self) -> Dict[str, Decimal]:
+        """Рубли за монету по коду валюты"""
+        raise NotImplementedError
+
+class FileRateSource(RateSource):
+    """JSON-объект вида {"TON": "250.10", "USDT": "95.3"}, перечитывается при каждом обновлении"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def fetch(self) -> Dict[str, Decimal]:
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        return {currency.upper(): Decimal(str(rate)) for currency, rate in data.items()}
+
+class StubRateSource(RateSource):
+    """Фиксированные курсы для разработки и тестов"""
+
+    def __init__(self, rates: Dict[str, Decimal]):
+        self.rates = dict(rates)
+
+    def fetch(self) -> Dict[str, Decimal]:
+        return dict(self.rates)
+
+def make_rate_source() -> RateSource:
+    if PRICING_RATE_SOURCE == "file":
+        return FileRateSource(PRICING_RATES_FILE)
+    if PRICING_RATE_SOURCE == "stub":
+        return StubRateSource(parse_rates(PRICING_STUB_RATES))
+    raise ValueError(f"Неизвестный PRICING_RATE_SOURCE {PRICING_RATE_SOURCE!r}, ожидается file или stub")
+
+class RateTable:
+    """Последние удачные курсы источника.
+
+    Фонового цикла у serverless-инстанса нет, поэтому обновление запускается
+    отдельным потоком, когда курсы старше interval, а запрос сразу получает
+    текущие значения - оформление заказа никогда не ждёт источник.
+    """
+
+    def __init__(
+        self,
+        source: RateSource,
+        ttl: float = PRICING_RATE_TTL_SECONDS,
+        interval: float = PRICING_REFRESH_SECONDS,
+    ):
+        self.source = source
+        self.ttl = ttl
+        self.interval = interval
+        # (курсы, время получения по monotonic, время получения UTC); заменяется целиком, читателям блокировка не нужна
+        self._snapshot: Optional[Tuple[Dict[str, Decimal], float, datetime]] = None
+        self._refreshing = threading.Lock()
+
+    def refresh(self) -> bool:
+        """Запросить источник; при ошибке остаются прежние курсы, пока не истекут"""
+        try:
+            rates = self.source.fetch()
+            for currency, rate in rates.items():
+                if not rate.is_finite() or rate <= 0:
+                    raise ValueError(f"курс {currency} {rate} не положительный")
+        except Exception as e:
+            logger.error(f"Не удалось обновить курсы: {e}")
+            return False
+        self._snapshot = (rates, time.monotonic(), datetime.now(timezone.utc))
+        return True
+
+    def _refresh_in_background(self):
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, name="rate-refresh", daemon=True).start()
+
+    def rate(self, currency: str) -> Optional[Tuple[Decimal, datetime]]:
+        """Текущий (рублей за монету, время получения) или None, если курса нет или он старше TTL"""
+        snapshot = self._snapshot
+        age = time.monotonic() - snapshot[1] if snapshot is not None else None
+        if age is None or age > self.interval:
+            self._refresh_in_background()
+        if age is None or age > self.ttl:
+            return None
+        rate = snapshot[0].get(currency)
+        return (rate, snapshot[2]) if rate is not None else None
+
+    def quote(self, payment_method: str, amount_minor: int) -> dict:
+        """Сумма в монетах и зафиксированный курс; поля сразу в формате записи заказа"""
+        currency, step = CRYPTO_CURRENCIES[payment_method]
+        current = self.rate(currency)
+        if current is None:
+            raise PricingError(f"Нет актуального курса {currency}, попробуйте позже или оплатите переводом")
+        rate, rate_at = current
+        amount = (from_minor(amount_minor) / rate).quantize(step, rounding=ROUND_UP)
+        # Строки: записи журнала (marshal) и JSON не теряют точность
+        return {"pay_currency": currency, "pay_amount": str(amount), "rate": str(rate), "rate_at": rate_at.isoformat()}
+
+rate_table = RateTable(make_rate_source())
+# Первое получение - при холодном старте инстанса, а не в запросе
+rate_table.refresh()
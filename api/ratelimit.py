@@ -0,0 +1,142 @@
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+import math
+import os
+import threading
+import time
+
+from fastapi import Depends, HTTPException, Request, status
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# На Vercel адрес клиента приходит первым значением X-Forwarded-For
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+def parse_rate(value: Optional[str]) -> Optional[Tuple[int, float]]:
+    """Разобрать "лимит/окно_в_секундах", например "5/60"; пусто или "off" отключает правило"""
+    if not value or value.lower() == "off":
+        return None
+    limit, _, window = value.partition("/")
+    return int(limit), float(window or 60)
+
+class SlidingWindowLimiter:
+    """Счетчики скользящего окна: предыдущее фиксированное окно учитывается с весом его перекрытия.
+
+    Два числа на ключ вместо журнала отметок времени; сверх max_keys ключи вытесняются по LRU.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # ключ -> [начало окна, счетчик предыдущего окна, счетчик текущего окна]
+        self._counters: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _counter(self, key: str, window: float, now: float) -> list:
+        start = now - now % window
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = [start, 0, 0]
+            if len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+        else:
+            self._counters.move_to_end(key)
+            if counter[0] != start:
+                # Через одно окно текущий счетчик становится предыдущим, позже оба устаревают
+                counter[1] = counter[2] if start - counter[0] == window else 0
+                counter[2] = 0
+                counter[0] = start
+        return counter
+
+    @staticmethod
+    def _retry_after(counter: list, limit: int, window: float, now: float) -> float:
+        start, previous, current = counter
+        if current + 1 > limit:
+            return start + window - now
+        # Ждем, пока вес предыдущего окна уменьшится настолько, чтобы пропустить еще один запрос
+        return start + window * (1 - (limit - current - 1) / previous) - now
+
+    def hit(self, rules: List[Tuple[str, int, float]], now: Optional[float] = None) -> float:
+        """Учесть запрос во всех правилах (ключ, лимит, окно).
+
+        Возвращает 0, если запрос разрешен, иначе число секунд до успешного повтора;
+        отклоненный запрос не учитывается.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            counters = []
+            retry_after = None
+            for key, limit, window in rules:
+                counter = self._counter(key, window, now)
+                weight = 1 - (now - counter[0]) / window
+                if counter[1] * weight + counter[2] + 1 > limit:
+                    wait = self._retry_after(counter, limit, window, now)
+                    retry_after = wait if retry_after is None else max(retry_after, wait)
+                counters.append(counter)
+            if retry_after is not None:
+                return max(retry_after, 0.001)
+            for counter in counters:
+                counter[2] += 1
+            return 0.0
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+limiter = SlidingWindowLimiter()
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+class RateLimit:
+    """Лимиты на пользователя и на IP для маршрута; подключается как Depends(rate_limit.dependency).
+
+    Лимит на IP проверяется до аутентификации, лимит на пользователя - после,
+    по пользователю из get_user, а не по сырому токену: смена токена не даёт
+    нового лимита. Значения по умолчанию переопределяются через
+    RATE_LIMIT_<ИМЯ>_USER и RATE_LIMIT_<ИМЯ>_IP, например
+    RATE_LIMIT_ORDERS_USER=10/60 или =off. Маршруты с одним именем делят общие
+    счетчики. Счетчики живут в процессе: у каждого инстанса свои.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        per_user: Optional[str] = None,
+        per_ip: Optional[str] = None,
+        get_user: Optional[Callable] = None,
+        limiter: SlidingWindowLimiter = limiter,
+    ):
+        self.name = name
+        env_name = name.upper().replace("-", "_")
+        self.per_user = parse_rate(os.getenv(f"RATE_LIMIT_{env_name}_USER", per_user))
+        self.per_ip = parse_rate(os.getenv(f"RATE_LIMIT_{env_name}_IP", per_ip))
+        self.limiter = limiter
+        if self.per_user and get_user is None:
+            raise ValueError(f"Rate limit {name}: a per-user limit needs get_user")
+        self.dependency = self._user_dependency(get_user) if self.per_user else self.check_ip
+
+    def check_ip(self, request: Request):
+        if self.per_ip:
+            self._enforce(f"{self.name}:ip:{client_ip(request)}", self.per_ip)
+
+    def _user_dependency(self, get_user: Callable):
+        # Подзависимости решаются по порядку: лимит на IP - до get_user
+        def check_user(request: Request, ip_checked: None = Depends(self.check_ip), user=Depends(get_user)):
+            if user is not None:
+                self._enforce(f"{self.name}:user:{user.telegram_id}", self.per_user)
+        return check_user
+
+    def _enforce(self, key: str, rule: Tuple[int, float]):
+        if not RATE_LIMIT_ENABLED:
+            return
+        retry_after = self.limiter.hit([(key, *rule)])
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
@@ -0,0 +1,112 @@
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+import signal
+
+from pydantic import BaseModel, ValidationError
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic_settings.sources import SettingsError
+
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# Файл настроек (формат .env); перечитывается по SIGHUP и POST /api/admin/settings/reload
+SETTINGS_FILE = os.getenv("SETTINGS_FILE", ".env")
+
+class BankDetails(BaseModel):
+    """Реквизиты для оплаты переводом"""
+    bank_name: str
+    card_number: str
+    account_holder: str
+    phone: Optional[str] = None
+
+class Settings(BaseSettings):
+    """Настройки, которые меняются без передеплоя.
+
+    Вложенные поля задаются через "__": BANK_DETAILS__CARD_NUMBER=...;
+    PAYMENT_METHODS - JSON-объект {код: название}. Значения из файла
+    важнее переменных окружения: окружение процесса после старта не
+    меняется, а файл можно поправить и перечитать.
+    """
+    model_config = SettingsConfigDict(env_nested_delimiter="__", extra="ignore")
+
+    telegram_bot_token: str = ""
+    admin_id: str = "896706118"
+    order_group_id: str = "3605074724"
+    # Общий секрет прокси фронтенда (frontend/pages/api/telegram.js) для /api/bot/batch
+    bot_gateway_secret: str = ""
+    # Ключ подписи вебхука криптоплатежей (X-Signature: HMAC-SHA256 тела); пусто - оплату подтверждает админ
+    crypto_webhook_secret: str = ""
+    frontend_url: str = "https://your-domain.com"
+    bank_details: BankDetails = BankDetails(
+        bank_name="Тинькофф",
+        card_number="5536 9137 7373 9191",
+        account_holder="Иван Иванов",
+        phone="+7 (999) 123-45-67",
+    )
+    # Включённые способы оплаты и их названия в уведомлениях
+    payment_methods: Dict[str, str] = {
+        "ton": "TON",
+        "usdt": "USDT (TRC20)",
+        "bank_transfer": "Перевод по реквизитам",
+    }
+
+    @classmethod
+    def settings_customise_sources(cls, settings_cls, init_settings, env_settings, dotenv_settings, file_secret_settings):
+        return init_settings, dotenv_settings, env_settings, file_secret_settings
+
+class SettingsHolder:
+    """Текущие настройки и готовые к отдаче производные; reload() подменяет всё разом"""
+
+    def __init__(self, path: Optional[str] = SETTINGS_FILE):
+        self.path = path
+        self._apply(self._read())
+
+    def _read(self) -> Settings:
+        return Settings(_env_file=self.path if self.path and os.path.exists(self.path) else None)
+
+    def _apply(self, current: Settings):
+        # Ссылки заменяются по одной, но каждая сама по себе согласована;
+        # обработчики читают их без блокировок
+        self.bank_details: dict = current.bank_details.model_dump(exclude_none=True)
+        self.payment_methods_json: bytes = dumps(
+            [{"code": code, "name": name} for code, name in current.payment_methods.items()]
+        )
+        self.current = current
+
+    def reload(self) -> bool:
+        """Перечитать файл и окружение; при ошибке остаются прежние настройки"""
+        try:
+            current = self._read()
+        except (ValidationError, SettingsError) as e:
+            logger.error(f"Settings reload failed, keeping the previous settings: {e}")
+            return False
+        self._apply(current)
+        logger.info(f"Settings reloaded from {self.path}")
+        return True
+
+    def changed_fields(self, previous: Settings) -> List[str]:
+        """Имена изменившихся полей (без значений: среди них секреты)"""
+        return [name for name in Settings.model_fields if getattr(previous, name) != getattr(self.current, name)]
+
+    def install_signal_handler(self):
+        """Перечитывать настройки по SIGHUP; вызывать из потока цикла событий (startup) или из главного потока без цикла"""
+        if not hasattr(signal, "SIGHUP"):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        try:
+            if loop is not None:
+                loop.add_signal_handler(signal.SIGHUP, self.reload)
+            else:
+                # Процесс бота до запуска его цикла событий
+                signal.signal(signal.SIGHUP, lambda signum, frame: self.reload())
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Не главный поток (тесты) или платформа без сигналов (serverless)
+            logger.info("SIGHUP settings reload is not available here")
+
+settings = SettingsHolder()
@@ -0,0 +1,305 @@
+from typing import Callable, Dict, Optional
+import gc
+import glob
+import logging
+import marshal
+import os
+import struct
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Заголовок кадра журнала: длина тела в байтах и его CRC32. Один кадр - одна пачка группового коммита
+_FRAME = struct.Struct("<II")
+# Сегменты с контрольными суммами начинаются с этой метки; без неё - старый формат (только длина)
+_MAGIC = b"JRN2"
+_LEGACY_FRAME = struct.Struct("<I")
+# Снапшот пишется кадрами (заголовок, затем куски таблиц); без метки - старый формат, один marshal на весь файл
+_SNAPSHOT_MAGIC = b"SNP2"
+_SNAPSHOT_FRAME = struct.Struct("<I")
+# Записей в одном кадре снапшота: между кадрами поток снапшота отдаёт GIL запросам
+SNAPSHOT_CHUNK = int(os.getenv("STORAGE_SNAPSHOT_CHUNK", "10000"))
+
+class Storage:
+    """Журнал упреждающей записи + периодические снапшоты для in-memory движка.
+
+    Данные - таблицы вида {ключ: запись}. Каждое изменение пишется кадром в
+    журнал; кадры копятся в буфере и сбрасываются одним write+fsync раз в
+    group_commit_ms (групповой коммит), так что запрос не ждёт fsync.
+    Каждые snapshot_every изменений фоновый поток сохраняет состояние в
+    снапшот (одновременно - не больше одного), а старые журналы удаляются.
+    При старте: снапшот + хвост журнала.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        state: Callable[[], Dict[str, dict]],
+        group_commit_ms: int = 10,
+        snapshot_every: int = 100_000,
+    ):
+        self.path = path
+        self.state = state
+        self.group_commit_ms = group_commit_ms
+        self.snapshot_every = snapshot_every
+
+        os.makedirs(path, exist_ok=True)
+        # _lock - буфер и счётчики (его берёт put), _io_lock - файл журнала: fsync идёт без _lock
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._pending = []
+        self._writes_since_snapshot = 0
+        self._segment = 0
+        self._journal = None
+        self._closed = False
+        self._wakeup = threading.Condition(self._lock)
+        self._flusher = None
+        # Поток текущего снапшота; ставится и снимается под _lock - это и есть флаг "снапшот идёт"
+        self._snapshotter = None
+
+    # Восстановление
+
+    def load(self) -> Dict[str, dict]:
+        """Прочитать снапшот и воспроизвести журналы после него"""
+        tables: Dict[str, dict] = {}
+        first_segment = 0
+
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            snapshot_path = os.path.join(self.path, "snapshot.bin")
+            if os.path.exists(snapshot_path):
+                tables, first_segment = self._read_snapshot(snapshot_path)
+
+            replayed = 0
+            for segment, journal_path in self._segments():
+                if segment < first_segment:
+                    continue
+                replayed += self._replay(journal_path, tables)
+                self._segment = segment
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        self._writes_since_snapshot = replayed
+        self._segment = max(self._segment + 1, first_segment)
+        self._journal = self._open_segment(self._segment)
+        self._flusher = threading.Thread(target=self._flush_loop, name="storage-flusher", daemon=True)
+        self._flusher.start()
+        logger.info(f"Storage loaded from {self.path}: {sum(len(t) for t in tables.values())} records, {replayed} replayed")
+        return tables
+
+    def _read_snapshot(self, snapshot_path: str):
+        with open(snapshot_path, "rb") as f:
+            data = f.read()
+        if not data.startswith(_SNAPSHOT_MAGIC):
+            snapshot = marshal.loads(data)
+            return snapshot["tables"], snapshot["segment"]
+
+        view = memoryview(data)
+        offset = len(_SNAPSHOT_MAGIC)
+        header = _SNAPSHOT_FRAME.size
+        segment = None
+        tables: Dict[str, dict] = {}
+        while offset < len(data):
+            (length,) = _SNAPSHOT_FRAME.unpack_from(data, offset)
+            body = marshal.loads(view[offset + header:offset + header + length])
+            offset += header + length
+            if segment is None:
+                segment = body
+            else:
+                table, rows = body
+                tables.setdefault(table, {}).update(rows)
+        return tables, segment
+
+    def _segments(self):
+        segments = []
+        for journal_path in glob.glob(os.path.join(self.path, "journal.*.log")):
+            segments.append((int(journal_path.rsplit(".", 2)[1]), journal_path))
+        return sorted(segments)
+
+    def _journal_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"journal.{segment:08d}.log")
+
+    def _open_segment(self, segment: int):
+        journal = open(self._journal_path(segment), "ab")
+        if journal.tell() == 0:
+            journal.write(_MAGIC)
+        return journal
+
+    def _replay(self, journal_path: str, tables: Dict[str, dict]) -> int:
+        with open(journal_path, "rb") as f:
+            data = f.read()
+
+        checksummed = data.startswith(_MAGIC)
+        frame = _FRAME if checksummed else _LEGACY_FRAME
+        count = 0
+        offset = len(_MAGIC) if checksummed else 0
+        size = len(data)
+        view = memoryview(data)
+        unpack_from = frame.unpack_from
+        header = frame.size
+        loads = marshal.loads
+        crc32 = zlib.crc32
+        while offset + header <= size:
+            length, *checksum = unpack_from(data, offset)
+            end = offset + header + length
+            if end > size:
+                break
+            body = view[offset + header:end]
+            if checksummed and crc32(body) != checksum[0]:
+                break
+            try:
+                changes = loads(body)
+            except (EOFError, ValueError, TypeError):
+                break
+            for table, key, record in changes:
+                rows = tables.get(table)
+                if rows is None:
+                    rows = tables[table] = {}
+                if record is None:
+                    rows.pop(key, None)
+                else:
+                    rows[key] = record
+                count += 1
+            offset = end
+
+        if offset != size:
+            # Недописанный или битый кадр после падения - отрезаем его и всё после него
+            logger.warning(f"Truncating torn tail of {journal_path} at {offset}")
+            with open(journal_path, "r+b") as f:
+                f.truncate(offset)
+        return count
+
+    # Запись
+
+    def put(self, table: str, key, record: Optional[dict]):
+        """Записать изменение; record=None удаляет ключ.
+
+        Запись сериализуется при сбросе пачки, поэтому в журнал попадает её
+        состояние на момент коммита.
+        """
+        with self._lock:
+            self._pending.append((table, key, record))
+            self._writes_since_snapshot += 1
+            if self._writes_since_snapshot >= self.snapshot_every:
+                self._start_snapshot()
+
+    def delete(self, table: str, key):
+        self.put(table, key, None)
+
+    def flush(self):
+        """Сбросить буфер на диск с fsync"""
+        with self._io_lock:
+            self._write_pending()
+
+    def _write_pending(self):
+        # Вызывается под _io_lock; _lock держим только на подмену буфера,
+        # чтобы put() не ждал write+fsync
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch or self._journal is None:
+            return
+        frame = marshal.dumps(batch)
+        self._journal.write(_FRAME.pack(len(frame), zlib.crc32(frame)) + frame)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _flush_loop(self):
+        interval = self.group_commit_ms / 1000
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                self._wakeup.wait(interval)
+            try:
+                with self._io_lock:
+                    self._write_pending()
+            except OSError as e:
+                logger.error(f"Storage flush failed: {e}")
+
+    # Снапшоты
+
+    def snapshot(self):
+        """Снять снапшот и дождаться его записи; идущий снапшот сначала дописывается"""
+        while True:
+            with self._lock:
+                running = self._snapshotter
+                started = self._start_snapshot()
+            if started is not None:
+                started.join()
+                return
+            running.join()
+
+    def _start_snapshot(self) -> Optional[threading.Thread]:
+        # Вызывается под _lock: проверка и установка флага атомарны, поэтому два
+        # снапшота не пишут snapshot.tmp наперегонки и старый не затрёт новый
+        if self._snapshotter is not None:
+            return None
+        self._writes_since_snapshot = 0
+        self._snapshotter = threading.Thread(target=self._take_snapshot, name="storage-snapshot", daemon=True)
+        self._snapshotter.start()
+        return self._snapshotter
+
+    def _take_snapshot(self):
+        try:
+            with self._io_lock:
+                self._write_pending()
+                self._journal.close()
+                self._segment += 1
+                self._journal = self._open_segment(self._segment)
+                segment = self._segment
+            # Состояние читается уже после смены сегмента: всё, что было до неё, в нём есть,
+            # а изменения, попавшие в него позже, журнал нового сегмента просто повторит
+            tables = self.state()
+            self._write_snapshot(tables, segment)
+        except OSError as e:
+            logger.error(f"Storage snapshot failed: {e}")
+        finally:
+            with self._lock:
+                self._snapshotter = None
+
+    def _write_snapshot(self, tables: Dict[str, dict], segment: int):
+        tmp_path = os.path.join(self.path, "snapshot.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(_SNAPSHOT_MAGIC)
+            self._write_frame(f, segment)
+            for table, rows in tables.items():
+                # list() копирует таблицу за один шаг под GIL, а кадры сериализуются по частям,
+                # так что поток запросов не стоит всё время сериализации
+                items = list(rows.items())
+                for start in range(0, max(len(items), 1), SNAPSHOT_CHUNK):
+                    self._write_frame(f, (table, dict(items[start:start + SNAPSHOT_CHUNK])))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, "snapshot.bin"))
+        dir_fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        for old_segment, journal_path in self._segments():
+            if old_segment < segment:
+                os.remove(journal_path)
+        logger.info(f"Storage snapshot written at segment {segment}")
+
+    def _write_frame(self, f, value):
+        body = marshal.dumps(value)
+        f.write(_SNAPSHOT_FRAME.pack(len(body)) + body)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            snapshotter = self._snapshotter
+        if snapshotter is not None:
+            snapshotter.join()
+        with self._io_lock:
+            self._write_pending()
+        if self._journal is not None:
+            self._journal.close()
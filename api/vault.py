@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from typing import Dict, Optional
+import logging
+import os
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+logger = logging.getLogger(__name__)
+
+# Ключи Fernet через запятую: первым шифруем, расшифровываем любым (для ротации новый ключ ставится первым)
+VAULT_KEY = os.getenv("VAULT_KEY", "")
+VAULT_CACHE_SIZE = int(os.getenv("VAULT_CACHE_SIZE", "256"))
+
+class DeliveryVault:
+    """Данные для выдачи товаров: зашифрованы и хранятся отдельно от каталога"""
+
+    def __init__(self, key: str = VAULT_KEY, persistent: bool = False, cache_size: int = VAULT_CACHE_SIZE):
+        keys = [k.strip() for k in key.split(",") if k.strip()]
+        if not keys:
+            if persistent:
+                raise RuntimeError("VAULT_KEY обязателен при STORAGE_PATH: иначе данные не расшифруются после перезапуска")
+            logger.warning("VAULT_KEY не задан, используется временный ключ")
+            keys = [Fernet.generate_key().decode("ascii")]
+        self._cipher = MultiFernet([Fernet(k) for k in keys])
+        # product_id -> шифротекст
+        self._secrets: Dict[int, str] = {}
+        # Небольшой LRU расшифрованных данных для повторных выдач одного товара
+        self._cache: "OrderedDict[int, str]" = OrderedDict()
+        self.cache_size = cache_size
+
+    def put(self, product_id: int, plaintext: str) -> str:
+        """Зашифровать и сохранить; возвращает шифротекст для журнала"""
+        ciphertext = self._cipher.encrypt(plaintext.encode("utf-8")).decode("ascii")
+        self._secrets[product_id] = ciphertext
+        self._cache.pop(product_id, None)
+        return ciphertext
+
+    def load(self, product_id: int, ciphertext: str):
+        """Восстановить шифротекст из хранилища"""
+        self._secrets[product_id] = ciphertext
+        self._cache.pop(product_id, None)
+
+    def __contains__(self, product_id: int) -> bool:
+        return product_id in self._secrets
+
+    def get(self, product_id: int) -> Optional[str]:
+        """Расшифровать данные в момент выдачи"""
+        plaintext = self._cache.get(product_id)
+        if plaintext is not None:
+            self._cache.move_to_end(product_id)
+            return plaintext
+        ciphertext = self._secrets.get(product_id)
+        if ciphertext is None:
+            return None
+        try:
+            plaintext = self._cipher.decrypt(ciphertext.encode("ascii")).decode("utf-8")
+        except InvalidToken:
+            logger.error(f"Не удалось расшифровать данные товара {product_id}: неверный VAULT_KEY")
+            return None
+        if self.cache_size > 0:
+            self._cache[product_id] = plaintext
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return plaintext
+
+    def ciphertexts(self) -> Dict[int, str]:
+        return self._secrets
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List
+import os
+
+# Просмотров на пользователя; более старые вытесняются при записи нового
+VIEW_HISTORY_PER_USER = int(os.getenv("VIEW_HISTORY_PER_USER", "50"))
+
+def view_key(user_id: str, product_id: int) -> str:
+    """Ключ записи в журнале хранилища"""
+    return f"{user_id}:{product_id}"
+
+class ViewHistoryStore:
+    """История просмотров по пользователям: у каждого не больше per_user записей.
+
+    user_id -> OrderedDict product_id -> запись, от старых к новым. Запись,
+    чтение последних и удаление стоят O(1) на запись и не зависят от числа
+    пользователей.
+    """
+
+    def __init__(self, per_user: int = VIEW_HISTORY_PER_USER):
+        self.per_user = per_user
+        self._by_user: Dict[str, "OrderedDict[int, dict]"] = {}
+
+    def record(self, entry: dict) -> List[str]:
+        """Добавить просмотр (повторный поднимается наверх); вернуть ключи вытесненных записей"""
+        user_id = entry["user_id"]
+        history = self._by_user.setdefault(user_id, OrderedDict())
+        history.pop(entry["product_id"], None)
+        history[entry["product_id"]] = entry
+        evicted = []
+        while len(history) > self.per_user:
+            product_id, _ = history.popitem(last=False)
+            evicted.append(view_key(user_id, product_id))
+        return evicted
+
+    def remove(self, user_id: str, product_id: int) -> bool:
+        history = self._by_user.get(user_id)
+        if not history or history.pop(product_id, None) is None:
+            return False
+        if not history:
+            del self._by_user[user_id]
+        return True
+
+    def recent(self, user_id: str) -> Iterator[int]:
+        """ID просмотренных товаров, новые первыми"""
+        return reversed(self._by_user.get(user_id, {}))
+
+    def load(self, entries: Iterable[dict]) -> List[str]:
+        """Восстановить из хранилища; вернуть ключи записей сверх лимита (их надо удалить из журнала)"""
+        evicted = []
+        # viewed_at в ISO-формате: строки сортируются как время
+        for entry in sorted(entries, key=lambda e: e["viewed_at"]):
+            evicted.extend(self.record(entry))
+        return evicted
+
+    def entries(self) -> Dict[str, dict]:
+        """Все записи по ключу журнала - для снапшота (безопасно вызывать из его потока)"""
+        return {
+            view_key(user_id, product_id): entry
+            for user_id, history in list(self._by_user.items())
+            for product_id, entry in list(history.items())
+        }
+
+    def __len__(self) -> int:
+        return sum(len(history) for history in self._by_user.values())
@@ -0,0 +1,443 @@
+from datetime import datetime, timedelta, timezone
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from sqlalchemy import case, func, inspect, or_, select, text, update
+from sqlalchemy.engine import Engine, Row
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from database import SessionLocal
+from models import Broadcast, User
+
+logger = logging.getLogger(__name__)
+
+# The Bot API takes about 30 messages a second across chats; the rest is headroom for order notifications
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+# Sends in flight at once, so slow Bot API responses do not eat into the rate
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+# Recipients per keyset page; progress is checkpointed after every page
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "200"))
+# Attempts per recipient on network errors; flood control waits do not count
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))
+# A worker that stops renewing for this long loses the broadcast to another worker; renewed every third of it
+BROADCAST_LEASE_SECONDS = float(os.getenv("BROADCAST_LEASE_SECONDS", "120"))
+# On shutdown, sends already taken from the queue get this long to finish before the last checkpoint
+BROADCAST_STOP_GRACE_SECONDS = float(os.getenv("BROADCAST_STOP_GRACE_SECONDS", "10"))
+BROADCAST_POLL_SECONDS = float(os.getenv("BROADCAST_POLL_SECONDS", "30"))
+
+SENT, BLOCKED, FAILED, RETRY = "sent", "blocked", "failed", "retry"
+# BadRequest descriptions that mean the chat is gone for good
+GONE_CHAT_ERRORS = ("chat not found", "user is deactivated", "peer_id_invalid")
+
+Sender = Callable[[str, str], Awaitable[str]]
+
+class RetryLater(Exception):
+    """Flood control from the Bot API: no sends for `seconds`"""
+
+    def __init__(self, seconds: float):
+        super().__init__(seconds)
+        self.seconds = seconds
+
+def bot_sender(bot: Bot) -> Sender:
+    """Send through a PTB bot, mapping its errors to broadcast outcomes"""
+
+    async def send(chat_id: str, message: str) -> str:
+        try:
+            await bot.send_message(chat_id=chat_id, text=message)
+            return SENT
+        except RetryAfter as e:
+            raise RetryLater(e.retry_after)
+        except Forbidden:
+            # The user blocked the bot or deleted the account
+            return BLOCKED
+        except BadRequest as e:
+            return BLOCKED if any(error in e.message.lower() for error in GONE_CHAT_ERRORS) else FAILED
+        except NetworkError:
+            return RETRY
+
+    return send
+
+class TokenBucket:
+    """Spaces sends at `rate` per second, shared by every sender of the process"""
+
+    def __init__(self, rate: float = BROADCAST_RATE, burst: float = 1):
+        self.rate = rate
+        self.capacity = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens go out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Hold every send for `seconds`, then carry on at the normal rate"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _lease_until() -> datetime:
+    return _utcnow() + timedelta(seconds=BROADCAST_LEASE_SECONDS)
+
+def claim_next_broadcast() -> Optional[int]:
+    """Lease the oldest running broadcast unless another worker holds it; broadcasts go one at a time"""
+    db = SessionLocal()
+    try:
+        oldest = select(func.min(Broadcast.id)).where(Broadcast.status == "running").scalar_subquery()
+        broadcast_id = db.scalar(
+            update(Broadcast)
+            .where(
+                Broadcast.id == oldest,
+                or_(Broadcast.lease_until.is_(None), Broadcast.lease_until < _utcnow()),
+            )
+            .values(lease_until=_lease_until())
+            .returning(Broadcast.id)
+        )
+        db.commit()
+        return broadcast_id
+    finally:
+        db.close()
+
+def load_recipients(after_id: int, limit: int = BROADCAST_PAGE_SIZE) -> List[Tuple[int, str]]:
+    """Next keyset page of (user id, telegram id) after the cursor, blocked users skipped"""
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(User.id, User.telegram_id)
+            .where(User.id > after_id, User.is_blocked.is_(False))
+            .order_by(User.id)
+            .limit(limit)
+        ).all()
+        return [(row.id, row.telegram_id) for row in rows]
+    finally:
+        db.close()
+
+def _load_broadcast(broadcast_id: int) -> Tuple[str, int]:
+    db = SessionLocal()
+    try:
+        broadcast = db.get(Broadcast, broadcast_id)
+        return broadcast.text, broadcast.last_user_id or 0
+    finally:
+        db.close()
+
+def save_progress(
+    broadcast_id: int,
+    last_user_id: int,
+    outcomes: List[str],
+    blocked_ids: List[int],
+    elapsed: float,
+) -> Row:
+    """Checkpoint one page in one transaction: blocked users, counters, cursor and lease"""
+    db = SessionLocal()
+    try:
+        if blocked_ids:
+            db.execute(
+                update(User).where(User.id.in_(blocked_ids)).values(is_blocked=True, blocked_at=_utcnow())
+            )
+        row = db.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(
+                # Never moves back, even if checkpoints land out of order during a shutdown
+                last_user_id=case((Broadcast.last_user_id > last_user_id, Broadcast.last_user_id), else_=last_user_id),
+                sent=Broadcast.sent + outcomes.count(SENT),
+                blocked=Broadcast.blocked + outcomes.count(BLOCKED),
+                failed=Broadcast.failed + outcomes.count(FAILED),
+                elapsed_seconds=Broadcast.elapsed_seconds + elapsed,
+                lease_until=_lease_until(),
+            )
+            .returning(Broadcast.status, Broadcast.sent, Broadcast.blocked, Broadcast.failed, Broadcast.elapsed_seconds)
+        ).one()
+        db.commit()
+        return row
+    finally:
+        db.close()
+
+def renew_lease(broadcast_id: int) -> Optional[str]:
+    """Extend the lease between checkpoints; returns the broadcast status"""
+    db = SessionLocal()
+    try:
+        status = db.scalar(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(lease_until=_lease_until())
+            .returning(Broadcast.status)
+        )
+        db.commit()
+        return status
+    finally:
+        db.close()
+
+def finish_broadcast(broadcast_id: int):
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.status == "running")
+            .values(status="completed", finished_at=_utcnow(), lease_until=None)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def release_broadcast(broadcast_id: int):
+    """Drop the lease so the next poll, here or on another worker, resumes from the checkpoint"""
+    db = SessionLocal()
+    try:
+        db.execute(update(Broadcast).where(Broadcast.id == broadcast_id).values(lease_until=None))
+        db.commit()
+    finally:
+        db.close()
+
+class _Page:
+    """One keyset page in flight: outcomes fill in as sends finish, in any order"""
+
+    def __init__(self, recipients: List[Tuple[int, str]]):
+        self.recipients = recipients
+        self.outcomes: List[Optional[str]] = [None] * len(recipients)
+        self.remaining = len(recipients)
+
+    def record(self, index: int, delivery: asyncio.Task):
+        if not delivery.cancelled():
+            self.outcomes[index] = delivery.result()
+            self.remaining -= 1
+
+    def finished_prefix(self) -> int:
+        return self.outcomes.index(None) if None in self.outcomes else len(self.outcomes)
+
+class _Stopped(Exception):
+    pass
+
+class BroadcastRun:
+    """Sends one broadcast from its checkpoint to the last registered user"""
+
+    def __init__(
+        self,
+        broadcast_id: int,
+        send: Sender,
+        bucket: TokenBucket,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        page_size: int = BROADCAST_PAGE_SIZE,
+    ):
+        self.broadcast_id = broadcast_id
+        self.send = send
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self._checkpointed_at = time.monotonic()
+
+    async def _deliver(self, chat_id: str, message: str) -> str:
+        attempts = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                outcome = await self.send(chat_id, message)
+            except RetryLater as e:
+                logger.warning(f"Broadcast {self.broadcast_id} hit flood control, pausing {e.seconds}s")
+                self.bucket.pause(e.seconds)
+                continue
+            except Exception as e:
+                logger.error(f"Broadcast {self.broadcast_id} send to {chat_id} failed: {e}")
+                return FAILED
+            if outcome != RETRY:
+                return outcome
+            attempts += 1
+            if attempts >= BROADCAST_MAX_ATTEMPTS:
+                return FAILED
+            await asyncio.sleep(attempts)
+
+    def _checkpoint(self, recipients: List[Tuple[int, str]], outcomes: List[str]) -> str:
+        now = time.monotonic()
+        blocked_ids = [user_id for (user_id, _), outcome in zip(recipients, outcomes) if outcome == BLOCKED]
+        row = save_progress(self.broadcast_id, recipients[-1][0], outcomes, blocked_ids, now - self._checkpointed_at)
+        self._checkpointed_at = now
+        handled = row.sent + row.blocked + row.failed
+        logger.info(
+            f"Broadcast {self.broadcast_id}: {row.sent} sent, {row.blocked} blocked, {row.failed} failed, "
+            f"{handled / row.elapsed_seconds if row.elapsed_seconds else 0:.1f} msg/s"
+        )
+        return row.status
+
+    def _checkpoint_finished(self, pages: Deque[_Page]):
+        """On shutdown: every finished page, then the finished prefix of the first unfinished one"""
+        for page in pages:
+            done = page.finished_prefix()
+            if done:
+                self._checkpoint(page.recipients[:done], page.outcomes[:done])
+            if done < len(page.recipients):
+                break
+
+    async def _keep_lease(self):
+        """Renew the lease while no page completes, e.g. through a flood-control pause longer than the lease"""
+        while True:
+            await asyncio.sleep(BROADCAST_LEASE_SECONDS / 3)
+            status = await asyncio.to_thread(renew_lease, self.broadcast_id)
+            if status != "running":
+                raise _Stopped(status)
+
+    async def run(self) -> bool:
+        """Send until the last user or a pause; return True when the broadcast completed"""
+        message, cursor = await asyncio.to_thread(_load_broadcast, self.broadcast_id)
+        self._checkpointed_at = time.monotonic()
+        # Bounded, so the producer reads at most about a page ahead of the senders
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.page_size)
+        # Pages not checkpointed yet, oldest first; the cursor only moves past fully handled pages
+        pages: Deque[_Page] = deque()
+        checkpoint_lock = asyncio.Lock()
+        # Sends run as their own tasks, so cancelling a sender does not drop a message already on its way
+        deliveries = set()
+
+        async def produce():
+            after = cursor
+            while recipients := await asyncio.to_thread(load_recipients, after, self.page_size):
+                page = _Page(recipients)
+                pages.append(page)
+                for index in range(len(recipients)):
+                    await queue.put((page, index))
+                after = recipients[-1][0]
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def send():
+            # No barrier between pages: a slow recipient holds back the checkpoint, not the other senders
+            while (item := await queue.get()) is not None:
+                page, index = item
+                delivery = asyncio.create_task(self._deliver(page.recipients[index][1], message))
+                deliveries.add(delivery)
+                delivery.add_done_callback(deliveries.discard)
+                delivery.add_done_callback(lambda delivery, page=page, index=index: page.record(index, delivery))
+                await asyncio.shield(delivery)
+                if page.remaining:
+                    continue
+                async with checkpoint_lock:
+                    while pages and not pages[0].remaining:
+                        done = pages.popleft()
+                        status = await asyncio.to_thread(self._checkpoint, done.recipients, done.outcomes)
+                        if status != "running":
+                            raise _Stopped(status)
+
+        tasks = [asyncio.create_task(produce())] + [asyncio.create_task(send()) for _ in range(self.concurrency)]
+        lease = asyncio.create_task(self._keep_lease())
+        # Not awaited directly: cancelling run() must not cancel the senders before the drain below
+        work = asyncio.gather(*tasks)
+        try:
+            done, _ = await asyncio.wait({work, lease}, return_when=asyncio.FIRST_COMPLETED)
+            (work if work in done else lease).result()
+        except _Stopped as e:
+            logger.info(f"Broadcast {self.broadcast_id} is {e}, stopping")
+            return False
+        except asyncio.CancelledError:
+            work.cancel()
+            # Senders take recipients in order, so once the sends in flight finish the handled
+            # recipients are a prefix; checkpoint all of it so a resume messages nobody twice.
+            # A send still waiting out flood control after the grace period was not made yet.
+            if deliveries:
+                await asyncio.wait(set(deliveries), timeout=BROADCAST_STOP_GRACE_SECONDS)
+                for delivery in list(deliveries):
+                    delivery.cancel()
+            await asyncio.to_thread(self._checkpoint_finished, pages)
+            raise
+        finally:
+            lease.cancel()
+            work.cancel()
+            # A cancelled gather holds a CancelledError; fetch it so it is not reported as never retrieved
+            work.add_done_callback(lambda future: future.cancelled() or future.exception())
+            for delivery in list(deliveries):
+                delivery.cancel()
+        await asyncio.to_thread(finish_broadcast, self.broadcast_id)
+        logger.info(f"Broadcast {self.broadcast_id} completed")
+        return True
+
+class BroadcastManager:
+    """Background loop that claims running broadcasts and sends them one at a time"""
+
+    def __init__(self, send: Sender, rate: float = BROADCAST_RATE, interval: float = BROADCAST_POLL_SECONDS):
+        self.send = send
+        self.bucket = TokenBucket(rate)
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        """Look for work now instead of at the next poll (a broadcast was created or resumed)"""
+        self._wakeup.set()
+
+    async def _run(self, broadcast_id: int):
+        try:
+            await BroadcastRun(broadcast_id, self.send, self.bucket).run()
+        finally:
+            await asyncio.to_thread(release_broadcast, broadcast_id)
+
+    async def _loop(self):
+        while True:
+            try:
+                broadcast_id = await asyncio.to_thread(claim_next_broadcast)
+                if broadcast_id is not None:
+                    await self._run(broadcast_id)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Broadcast run failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        # A broadcast can run for hours; cancel it after checkpointing what was sent
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+def migrate_blocked_users(engine: Engine):
+    """Add is_blocked / blocked_at to the users table of an existing database"""
+    columns = {column["name"] for column in inspect(engine).get_columns("users")}
+    with engine.begin() as conn:
+        if "is_blocked" not in columns:
+            conn.execute(text("ALTER TABLE users ADD COLUMN is_blocked BOOLEAN NOT NULL DEFAULT false"))
+        if "blocked_at" not in columns:
+            column_type = User.blocked_at.type.compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE users ADD COLUMN blocked_at {column_type}"))
+    logger.info("Users table has is_blocked")
+
+# Usage:
+#   python broadcast.py migrate   add the blocked-user columns to an existing database
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] == ["migrate"]:
+        from database import engine
+
+        migrate_blocked_users(engine)
+    else:
+        print("Usage: python broadcast.py migrate")
+        sys.exit(1)
@@ -0,0 +1,198 @@
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+import csv
+import io
+import json
+import logging
+import os
+
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from cache import checkout_products, product_listing_keys, product_listings
+from models import App, Game, Product
+from pricing import to_minor
+from schemas import ProductCreate, ProductBulkUpdate
+from vault import store_secrets
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+# Only the first errors are returned; the counts always cover every row
+MAX_REPORTED_ERRORS = 1000
+
+PRODUCT_COLUMNS = ["name", "description", "image_url", "price", "delivery_data", "game_id", "app_id"]
+# delivery_data goes to the vault; COPY bypasses the ORM's Python-side column defaults, so they are written explicitly
+# Prices are stored in kopecks
+CATALOG_COLUMNS = ["name", "description", "image_url", "price_minor", "game_id", "app_id"]
+INSERT_COLUMNS = ["id"] + CATALOG_COLUMNS + ["is_active", "is_unique"]
+
+def detect_format(filename: Optional[str], declared: Optional[str] = None) -> str:
+    fmt = (declared or os.path.splitext(filename or "")[1].lstrip(".")).lower()
+    if fmt in ("jsonl", "ndjson", "json"):
+        return "ndjson"
+    if fmt == "csv":
+        return "csv"
+    raise ValueError("Unsupported import format, expected csv or ndjson")
+
+def iter_rows(stream: IO[bytes], fmt: str) -> Iterator[Tuple[int, object]]:
+    """Yield (row number, raw row) without loading the whole upload into memory"""
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        for number, row in enumerate(csv.DictReader(text_stream), start=1):
+            yield number, row
+        return
+    for number, line in enumerate(text_stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, e
+
+OPTIONAL_COLUMNS = ("game_id", "app_id")
+
+def _clean(row: dict) -> dict:
+    # CSV has no nulls: an empty optional cell means "not set"
+    return {
+        key: (None if value == "" and key in OPTIONAL_COLUMNS else value)
+        for key, value in row.items()
+        if key in PRODUCT_COLUMNS
+    }
+
+def _validate_chunk(
+    chunk: List[Tuple[int, object]],
+    game_ids: set,
+    app_ids: set,
+    errors: List[Dict],
+) -> List[dict]:
+    valid = []
+    for number, raw in chunk:
+        if isinstance(raw, Exception) or not isinstance(raw, dict):
+            errors.append({"row": number, "error": f"Malformed row: {raw}"})
+            continue
+        try:
+            product = ProductCreate(**_clean(raw))
+        except ValidationError as e:
+            errors.append({"row": number, "error": "; ".join(
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+            )})
+            continue
+        if product.price < 0:
+            errors.append({"row": number, "error": "price: must not be negative"})
+            continue
+        if product.game_id is not None and product.game_id not in game_ids:
+            errors.append({"row": number, "error": f"game_id: game {product.game_id} does not exist"})
+            continue
+        if product.app_id is not None and product.app_id not in app_ids:
+            errors.append({"row": number, "error": f"app_id: app {product.app_id} does not exist"})
+            continue
+        row = product.model_dump()
+        row["price_minor"] = to_minor(row.pop("price"))
+        valid.append({**row, "is_active": True, "is_unique": True})
+    return valid
+
+def _copy_field(value) -> str:
+    # In COPY csv an unquoted empty field is NULL and a quoted one ("") an empty string
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+def _copy_rows(db: Session, rows: List[dict]):
+    """COPY a chunk into products in one round trip (PostgreSQL)"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(_copy_field(row[column]) for column in INSERT_COLUMNS) + "\n")
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY products ({', '.join(INSERT_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '')",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+def _insert_rows(db: Session, rows: List[dict]):
+    secrets = [row.pop("delivery_data") for row in rows]
+    if db.get_bind().dialect.name == "postgresql":
+        # Ids are drawn from the sequence up front so the secrets can reference them after COPY
+        ids = db.scalars(
+            text("SELECT nextval(pg_get_serial_sequence('products', 'id')) FROM generate_series(1, :count)"),
+            {"count": len(rows)},
+        ).all()
+        for row, product_id in zip(rows, ids):
+            row["id"] = product_id
+        _copy_rows(db, rows)
+    else:
+        # Multi-row INSERT via executemany
+        ids = db.scalars(insert(Product).returning(Product.id, sort_by_parameter_order=True), rows).all()
+    store_secrets(db, zip(ids, secrets))
+
+def import_products(db: Session, stream: IO[bytes], fmt: str) -> dict:
+    """Validate and insert products chunk by chunk; one transaction per chunk"""
+    game_ids = set(db.scalars(select(Game.id)))
+    app_ids = set(db.scalars(select(App.id)))
+    errors: List[Dict] = []
+    inserted = 0
+    total = 0
+    chunk: List[Tuple[int, object]] = []
+
+    def flush():
+        nonlocal inserted
+        rows = _validate_chunk(chunk, game_ids, app_ids, errors)
+        if rows:
+            _insert_rows(db, rows)
+            db.commit()
+            product_listings.invalidate(product_listing_keys((row["game_id"], row["app_id"]) for row in rows))
+            inserted += len(rows)
+        chunk.clear()
+
+    for number, raw in iter_rows(stream, fmt):
+        total += 1
+        chunk.append((number, raw))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            flush()
+    flush()
+
+    logger.info(f"Imported {inserted} of {total} products ({len(errors)} rejected)")
+    return {
+        "total": total,
+        "inserted": inserted,
+        "failed": len(errors),
+        "errors": errors[:MAX_REPORTED_ERRORS],
+    }
+
+def bulk_update_products(db: Session, changes: ProductBulkUpdate) -> int:
+    """Apply one price / activity change to many products in a single UPDATE"""
+    conditions = []
+    if changes.product_ids is not None:
+        conditions.append(Product.id.in_(changes.product_ids))
+    if changes.game_id is not None:
+        conditions.append(Product.game_id == changes.game_id)
+    if changes.app_id is not None:
+        conditions.append(Product.app_id == changes.app_id)
+    if not conditions:
+        raise ValueError("Select products by product_ids, game_id or app_id")
+
+    values = {}
+    if changes.price is not None:
+        values["price_minor"] = to_minor(changes.price)
+    elif changes.price_multiplier is not None:
+        values["price_minor"] = func.round(Product.price_minor * changes.price_multiplier)
+    if changes.is_active is not None:
+        values["is_active"] = changes.is_active
+    if not values:
+        raise ValueError("Nothing to update: set price, price_multiplier or is_active")
+
+    # The touched products and categories come back from the same statement; only their cache entries are dropped
+    updated = db.execute(
+        update(Product).where(*conditions).values(**values).returning(Product.id, Product.game_id, Product.app_id)
+    ).all()
+    db.commit()
+    product_listings.invalidate(product_listing_keys((row.game_id, row.app_id) for row in updated))
+    checkout_products.invalidate(row.id for row in updated)
+    return len(updated)
@@ -0,0 +1,280 @@
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RECENT_VIEWS_LIMIT = int(os.getenv("RECENT_VIEWS_LIMIT", "10"))
+RECENT_VIEWS_TTL = float(os.getenv("RECENT_VIEWS_TTL", "60"))
+RECENT_VIEWS_MAX_USERS = int(os.getenv("RECENT_VIEWS_MAX_USERS", "100000"))
+NEIGHBOURS_TTL = float(os.getenv("NEIGHBOURS_TTL", "300"))
+LISTING_CACHE_SIZE = int(os.getenv("LISTING_CACHE_SIZE", "1000"))
+# Changes made by other workers (or straight in the DB) show up at most this late
+LISTING_CACHE_TTL = float(os.getenv("LISTING_CACHE_TTL", "30"))
+# Fills right after an invalidation are not kept: a replica may still return the old rows
+LISTING_CACHE_SETTLE = float(os.getenv("LISTING_CACHE_SETTLE", "2"))
+CHECKOUT_PRODUCT_CACHE_SIZE = int(os.getenv("CHECKOUT_PRODUCT_CACHE_SIZE", "10000"))
+CHECKOUT_PRODUCT_CACHE_TTL = float(os.getenv("CHECKOUT_PRODUCT_CACHE_TTL", "30"))
+
+class RecentViews:
+    """Per-user ring buffer of recently viewed product ids, newest first.
+
+    Each worker has its own; on PostgreSQL writes in one worker drop the user's
+    buffer in the others through NOTIFY (order_feed.py). Without it (SQLite,
+    one process) a buffer can lag another process's writes for up to the TTL.
+    """
+
+    def __init__(self, maxlen: int, ttl: float, max_users: int):
+        self.maxlen = maxlen
+        self.ttl = ttl
+        self.max_users = max_users
+        # user_id -> (expires_at, deque of product ids); LRU order over users
+        self._entries: "OrderedDict[int, Tuple[float, deque]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[List[int]]:
+        """Return cached product ids, or None when the user must be loaded from the DB"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, ring = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return list(ring)
+
+    def fill(self, user_id: int, product_ids: Iterable[int]):
+        """Replace the user's buffer with ids loaded from storage (newest first)"""
+        ring = deque(maxlen=self.maxlen)
+        for product_id in product_ids:
+            if product_id not in ring:
+                ring.append(product_id)
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, ring)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def push(self, user_id: int, product_id: int):
+        """Move a freshly viewed product to the front of the user's buffer"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                # Not cached: the next read loads the full list from the DB
+                return
+            ring = entry[1]
+            try:
+                ring.remove(product_id)
+            except ValueError:
+                pass
+            ring.appendleft(product_id)
+
+    def discard(self, user_id: int, product_id: int):
+        """Remove a product from the user's buffer"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            try:
+                entry[1].remove(product_id)
+            except ValueError:
+                pass
+
+    def forget(self, user_id: int):
+        """Drop the user's buffer; another worker changed their history (order_feed.py)"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class NeighbourTable:
+    """Read-only product -> neighbour ids mapping, swapped atomically on reload"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._neighbours: Dict[int, Tuple[int, ...]] = {}
+        self._expires_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def is_stale(self) -> bool:
+        return self._expires_at <= time.monotonic()
+
+    def load(self, neighbours: Dict[int, Tuple[int, ...]]):
+        self._neighbours = neighbours
+        self._expires_at = time.monotonic() + self.ttl
+
+    def refresh_if_stale(self, loader: Callable[[], Dict[int, Tuple[int, ...]]]):
+        """Reload in a background thread once stale; readers keep the current map meanwhile"""
+        with self._lock:
+            if self._refreshing or not self.is_stale():
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, args=(loader,), name="neighbour-table-refresh", daemon=True).start()
+
+    def _refresh(self, loader: Callable[[], Dict[int, Tuple[int, ...]]]):
+        try:
+            self.load(loader())
+        except Exception as e:
+            logger.error(f"Neighbour table refresh failed, keeping the previous map: {e}")
+            # Not on every request while the database is struggling
+            self._expires_at = time.monotonic() + self.ttl / 10
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def recommend(self, product_ids: List[int], limit: int) -> List[int]:
+        """Merge neighbours of the given products, skipping the products themselves"""
+        neighbours = self._neighbours
+        seen = set(product_ids)
+        result = []
+        for product_id in product_ids:
+            for neighbour_id in neighbours.get(product_id, ()):
+                if neighbour_id not in seen:
+                    seen.add(neighbour_id)
+                    result.append(neighbour_id)
+                    if len(result) >= limit:
+                        return result
+        return result
+
+def listing_key(kind: str, category_id: int) -> Tuple[str, int]:
+    """Key of a product listing: ("game", id) or ("app", id)"""
+    return (kind, category_id)
+
+def product_listing_keys(categories: Iterable[Tuple[Optional[int], Optional[int]]]) -> List[Tuple[str, int]]:
+    """Listing keys touched by products with these (game_id, app_id) pairs"""
+    keys = set()
+    for game_id, app_id in categories:
+        if game_id is not None:
+            keys.add(listing_key("game", game_id))
+        if app_id is not None:
+            keys.add(listing_key("app", app_id))
+    return list(keys)
+
+class ListingCache:
+    """LRU of encoded product listings per game / app, with hit and miss counters.
+
+    A listing is at most `ttl` old. Writes made in this process invalidate
+    their keys at once; a fill that started before the invalidation, or less
+    than `settle` seconds after it, is served but not kept.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, settle: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.settle = settle
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires_at, encoded listing); LRU order
+        self._entries: "OrderedDict[tuple, Tuple[float, bytes]]" = OrderedDict()
+        # key -> monotonic time of the last invalidation
+        self._invalidated_at: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, value: bytes, loaded_at: float):
+        """Keep a listing read from the DB starting at `loaded_at` (time.monotonic())"""
+        with self._lock:
+            if loaded_at <= self._invalidated_at.get(key, float("-inf")) + self.settle:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[tuple]):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._invalidated_at[key] = now
+            if len(self._invalidated_at) > self.max_entries:
+                # Marks older than a TTL cannot reject any fill still in progress
+                horizon = now - max(self.ttl, self.settle)
+                self._invalidated_at = {k: t for k, t in self._invalidated_at.items() if t > horizon}
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+class CachedProduct(NamedTuple):
+    """What checkout needs of a product: the price to quote and the name / image for the notification"""
+    id: int
+    name: str
+    image_url: Optional[str]
+    price_minor: int
+
+class ProductCache:
+    """LRU of products by id for checkout; a stale price is caught by the order insert itself"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # product id -> (expires_at, product); LRU order
+        self._entries: "OrderedDict[int, Tuple[float, CachedProduct]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, product_id: int) -> Optional[CachedProduct]:
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(product_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[product_id]
+            self.misses += 1
+            return None
+
+    def put(self, product: CachedProduct):
+        with self._lock:
+            self._entries[product.id] = (time.monotonic() + self.ttl, product)
+            self._entries.move_to_end(product.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, product_ids: Iterable[int]):
+        with self._lock:
+            for product_id in product_ids:
+                self._entries.pop(product_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+recent_views = RecentViews(RECENT_VIEWS_LIMIT, RECENT_VIEWS_TTL, RECENT_VIEWS_MAX_USERS)
+neighbour_table = NeighbourTable(NEIGHBOURS_TTL)
+product_listings = ListingCache(LISTING_CACHE_SIZE, LISTING_CACHE_TTL, LISTING_CACHE_SETTLE)
+checkout_products = ProductCache(CHECKOUT_PRODUCT_CACHE_SIZE, CHECKOUT_PRODUCT_CACHE_TTL)
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+import logging
+import os
+import sys
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from database import engine, schema_lock
+from models import App, Game, Product
+
+logger = logging.getLogger(__name__)
+
+# More changed rows than this in one table and the client reloads /api/dashboard instead
+CATALOG_DELTA_LIMIT = int(os.getenv("CATALOG_DELTA_LIMIT", "500"))
+# Rows not yet on the replica get caught by re-reading this window; long transactions hold the version back instead
+CATALOG_DELTA_OVERLAP_SECONDS = float(os.getenv("CATALOG_DELTA_OVERLAP_SECONDS", "5"))
+
+CATALOG_MODELS = {"games": Game, "apps": App, "products": Product}
+
+# On PostgreSQL updated_at is the time the row was written, not the transaction start (now()):
+# rows written late in a long transaction, such as a COPY import, are stamped late too
+CATALOG_TRIGGER_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION touch_catalog_row() RETURNS trigger AS $$
+    BEGIN
+        NEW.updated_at := clock_timestamp();
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+] + [
+    statement
+    for table in CATALOG_MODELS
+    for statement in (
+        f"DROP TRIGGER IF EXISTS {table}_touch ON {table}",
+        f"CREATE TRIGGER {table}_touch BEFORE INSERT OR UPDATE ON {table} "
+        "FOR EACH ROW EXECUTE FUNCTION touch_catalog_row()",
+    )
+]
+
+# Start of the oldest transaction that has written and not committed yet; every row it writes is stamped later
+OLDEST_OPEN_WRITE_SQL = text(
+    "SELECT min(xact_start) FROM pg_stat_activity WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()"
+)
+
+def to_version(moment: datetime) -> int:
+    """Catalog version: milliseconds since the epoch of the database clock"""
+    if moment.tzinfo is None:
+        # SQLite returns naive UTC
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+def from_version(version: int) -> datetime:
+    return datetime.fromtimestamp(version / 1000, tz=timezone.utc)
+
+def _clock_and_version(db: Session) -> Tuple[int, int]:
+    clock = db.scalar(select(func.now()))
+    version = clock
+    if engine.dialect.name == "postgresql":
+        # Open writes are visible on the primary only, not on a replica
+        with engine.connect() as conn:
+            oldest_open_write = conn.scalar(OLDEST_OPEN_WRITE_SQL)
+        if oldest_open_write is not None:
+            version = min(version, oldest_open_write)
+    return to_version(clock), to_version(version)
+
+def current_version(db: Session) -> int:
+    """The database clock, held back to the oldest open write so its rows still land in the next delta.
+
+    Take it before reading the catalog.
+    """
+    return _clock_and_version(db)[1]
+
+def install_catalog_trigger(engine: Engine):
+    if engine.dialect.name != "postgresql":
+        return
+    with schema_lock(engine), engine.begin() as conn:
+        for statement in CATALOG_TRIGGER_SQL:
+            conn.execute(text(statement))
+
+def catalog_changes(db: Session, since: int) -> dict:
+    """Games, apps and products changed after `since`, deactivated ones included"""
+    clock, version = _clock_and_version(db)
+    empty = {"version": version, "reset": True, "games": [], "apps": [], "products": []}
+    if since > clock:
+        # A version from another clock or a bogus value: start over
+        return empty
+    # The version handed out may be older than `since` while a long write is open; the client
+    # then re-reads from there, and applying a change twice is harmless
+    cutoff = from_version(since) - timedelta(seconds=CATALOG_DELTA_OVERLAP_SECONDS)
+    changes: Dict[str, List] = {}
+    for key, model in CATALOG_MODELS.items():
+        rows = (
+            db.query(model)
+            .filter(model.updated_at > cutoff)
+            .order_by(model.updated_at)
+            .limit(CATALOG_DELTA_LIMIT + 1)
+            .all()
+        )
+        if len(rows) > CATALOG_DELTA_LIMIT:
+            return empty
+        changes[key] = rows
+    return {"version": version, "reset": False, **changes}
+
+def migrate_updated_at(engine: Engine):
+    """Add and backfill updated_at on the catalog tables of an existing database, plus the user orders index"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in CATALOG_MODELS:
+            if "updated_at" not in {column["name"] for column in inspector.get_columns(table)}:
+                column_type = Product.updated_at.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN updated_at {column_type}"))
+            if engine.dialect.name == "postgresql":
+                # SQLite cannot add a column with a non-constant default; recreate development databases instead
+                conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN updated_at SET DEFAULT now()"))
+            conn.execute(text(f"UPDATE {table} SET updated_at = created_at WHERE updated_at IS NULL"))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_updated_at ON {table} (updated_at)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_user_created_at ON orders (user_id, created_at)"))
+    logger.info("Catalog tables have updated_at")
+
+# Usage:
+#   python catalog_sync.py migrate   add updated_at to games, apps and products of an existing database
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] == ["migrate"]:
+        from database import engine
+
+        migrate_updated_at(engine)
+    else:
+        print("Usage: python catalog_sync.py migrate")
+        sys.exit(1)
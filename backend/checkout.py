@@ -0,0 +1,135 @@
+from typing import Callable, Optional, Tuple
+import os
+import re
+
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Connection
+
+from cache import CachedProduct, checkout_products
+from models import Order, Product
+from pricing import CURRENCY, PricingError, Quote
+
+# Server-side prepared order insert on PostgreSQL; turn off behind PgBouncer in transaction pooling mode
+CHECKOUT_PREPARED = os.getenv("CHECKOUT_PREPARED", "1") == "1"
+# Inserts tried when the product's price keeps changing under the checkout
+CHECKOUT_ATTEMPTS = 3
+
+# Parameters of the insert in the order the prepared statement takes them, with the column giving each its type
+_PARAMETERS = (
+    ("user_id", Order.user_id),
+    ("product_id", Order.product_id),
+    ("price_minor", Order.amount_minor),
+    ("payment_method", Order.payment_method),
+    ("currency", Order.currency),
+    ("pay_currency", Order.pay_currency),
+    ("pay_amount", Order.pay_amount),
+    ("rate", Order.rate),
+    ("rate_at", Order.rate_at),
+)
+
+# The price is read by the insert itself, and the row is written only while it is still the price that
+# was quoted: a stale cached product can never change what an order costs
+ORDER_INSERT = """
+INSERT INTO orders (user_id, product_id, payment_method, amount_minor, currency, status,
+                    pay_currency, pay_amount, rate, rate_at)
+SELECT :user_id, products.id, :payment_method, products.price_minor, :currency, 'pending',
+       :pay_currency, :pay_amount, :rate, :rate_at
+FROM products
+WHERE products.id = :product_id AND products.price_minor = :price_minor
+RETURNING id, created_at
+"""
+
+PREPARED_NAME = "checkout_insert_order"
+
+def _prepare_statement() -> str:
+    names = [name for name, _ in _PARAMETERS]
+    types = ", ".join(column.type.compile(dialect=postgresql.dialect()) for _, column in _PARAMETERS)
+    body = re.sub(r":(\w+)", lambda match: f"${names.index(match.group(1)) + 1}", ORDER_INSERT)
+    return f"PREPARE {PREPARED_NAME} ({types}) AS {body}"
+
+_PREPARE = _prepare_statement()
+_BINDS = [bindparam(name, type_=column.type) for name, column in _PARAMETERS]
+_EXECUTE = (
+    text(f"EXECUTE {PREPARED_NAME} ({', '.join(':' + name for name, _ in _PARAMETERS)})")
+    .bindparams(*_BINDS)
+    .columns(Order.id, Order.created_at)
+)
+_INSERT = text(ORDER_INSERT).bindparams(*_BINDS).columns(Order.id, Order.created_at)
+
+def _prepared(connection: Connection) -> bool:
+    """PREPARE the order insert once per database connection (PostgreSQL only)"""
+    if not CHECKOUT_PREPARED or connection.dialect.name != "postgresql":
+        return False
+    # Connection.info lives as long as the DBAPI connection, like the prepared statement
+    if not connection.info.get(PREPARED_NAME):
+        connection.exec_driver_sql(_PREPARE)
+        connection.info[PREPARED_NAME] = True
+    return True
+
+def load_product(connection: Connection, product_id: int) -> Optional[CachedProduct]:
+    """Read a product from the database into the checkout cache"""
+    row = connection.execute(
+        select(Product.id, Product.name, Product.image_url, Product.price_minor).where(Product.id == product_id)
+    ).first()
+    if row is None:
+        return None
+    product = CachedProduct(*row)
+    checkout_products.put(product)
+    return product
+
+def insert_order(
+    connection: Connection, user_id: int, product: CachedProduct, payment_method: str, quote: Optional[Quote]
+) -> Optional[Order]:
+    """Insert a pending order at the product's price in one statement; None if the product is gone or repriced"""
+    fields = quote.order_fields() if quote else {"pay_currency": None, "pay_amount": None, "rate": None, "rate_at": None}
+    parameters = {
+        "user_id": user_id,
+        "product_id": product.id,
+        "price_minor": product.price_minor,
+        "payment_method": payment_method,
+        "currency": CURRENCY,
+        **fields,
+    }
+    row = connection.execute(_EXECUTE if _prepared(connection) else _INSERT, parameters).first()
+    if row is None:
+        return None
+    # Not attached to a session: everything the notification and the response read is already set
+    return Order(
+        id=row.id,
+        created_at=row.created_at,
+        user_id=user_id,
+        product_id=product.id,
+        payment_method=payment_method,
+        amount_minor=product.price_minor,
+        currency=CURRENCY,
+        status="pending",
+        **(quote.order_fields() if quote else {}),
+    )
+
+def place_order(
+    connection: Connection,
+    user_id: int,
+    product_id: int,
+    payment_method: str,
+    quote_for: Callable[[int], Optional[Quote]],
+) -> Optional[Tuple[CachedProduct, Order, Optional[Quote]]]:
+    """Checkout in one round trip when the product is cached: (product, order, quote), or None if there is no such product.
+
+    `connection` should be in autocommit mode, the insert is a single statement.
+    `quote_for(price_minor)` locks the crypto amount and may raise PricingError.
+    """
+    product = checkout_products.get(product_id)
+    for _ in range(CHECKOUT_ATTEMPTS):
+        if product is None:
+            product = load_product(connection, product_id)
+            if product is None:
+                return None
+        quote = quote_for(product.price_minor)
+        order = insert_order(connection, user_id, product, payment_method, quote)
+        if order is not None:
+            return product, order, quote
+        # Repriced or deleted since it was cached: look again
+        checkout_products.invalidate([product_id])
+        product = None
+    raise PricingError("The price changed during checkout, please try again")
@@ -0,0 +1,269 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Coroutine, Dict, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import or_, select, update
+
+from database import SessionLocal
+from models import Order, Product, User
+from order_feed import RESYNC, OrderBroker, order_broker
+
+logger = logging.getLogger(__name__)
+
+# New orders waiting for a score; past this they are notified unscored rather than slow down checkout
+FRAUD_QUEUE_SIZE = int(os.getenv("FRAUD_QUEUE_SIZE", "1000"))
+# Users whose features are kept in memory (LRU)
+FRAUD_MAX_USERS = int(os.getenv("FRAUD_MAX_USERS", "100000"))
+# Features are reloaded from the DB after this long, picking up changes no event reported
+FRAUD_FEATURE_TTL_SECONDS = float(os.getenv("FRAUD_FEATURE_TTL_SECONDS", "600"))
+FRAUD_VELOCITY_WINDOW_MINUTES = int(os.getenv("FRAUD_VELOCITY_WINDOW_MINUTES", "10"))
+FRAUD_MAX_ORDERS_PER_WINDOW = int(os.getenv("FRAUD_MAX_ORDERS_PER_WINDOW", "5"))
+FRAUD_MAX_UNPAID = int(os.getenv("FRAUD_MAX_UNPAID", "3"))
+FRAUD_NEW_ACCOUNT_MINUTES = int(os.getenv("FRAUD_NEW_ACCOUNT_MINUTES", "10"))
+# Score at which an order is marked in the group notification, and at which it is held back from it
+FRAUD_FLAG_SCORE = int(os.getenv("FRAUD_FLAG_SCORE", "2"))
+FRAUD_HOLD_SCORE = int(os.getenv("FRAUD_HOLD_SCORE", "3"))
+
+VELOCITY_POINTS = 2
+UNPAID_POINTS = 2
+NEW_ACCOUNT_POINTS = 1
+
+OK, FLAG, HOLD = "ok", "flag", "hold"
+UNPAID_STATUSES = ("pending", "held")
+
+def _timestamp(value) -> float:
+    """Epoch seconds of a created_at from the ORM (naive on SQLite) or from a NOTIFY payload (ISO string)"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+@dataclass(slots=True)
+class UserFeatures:
+    """Signals of one user, kept current from order events; applying an event twice changes nothing"""
+    loaded_at: float
+    account_created: Optional[float] = None
+    # order id -> created_at of the orders inside the velocity window
+    recent: Dict[int, float] = field(default_factory=dict)
+    unpaid: Set[int] = field(default_factory=set)
+
+    def apply(self, order_id: int, status: str, created_at: float):
+        if created_at >= time.time() - FRAUD_VELOCITY_WINDOW_MINUTES * 60:
+            self.recent[order_id] = created_at
+        if status in UNPAID_STATUSES:
+            self.unpaid.add(order_id)
+        else:
+            self.unpaid.discard(order_id)
+
+    def velocity(self, now: float) -> int:
+        horizon = now - FRAUD_VELOCITY_WINDOW_MINUTES * 60
+        for order_id in [order_id for order_id, created_at in self.recent.items() if created_at < horizon]:
+            del self.recent[order_id]
+        return len(self.recent)
+
+class FeatureStore:
+    """Per-user features of recently active buyers; users not in it are ignored until they order again"""
+
+    def __init__(self, max_users: int = FRAUD_MAX_USERS, ttl: float = FRAUD_FEATURE_TTL_SECONDS):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users: "OrderedDict[int, UserFeatures]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[UserFeatures]:
+        features = self._users.get(user_id)
+        if features is None:
+            return None
+        if features.loaded_at + self.ttl <= time.monotonic():
+            del self._users[user_id]
+            return None
+        self._users.move_to_end(user_id)
+        return features
+
+    def put(self, user_id: int, features: UserFeatures):
+        self._users[user_id] = features
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def apply_event(self, order_event: dict):
+        features = self._users.get(order_event.get("user_id"))
+        if features is not None:
+            # ORM commit hooks may not have the server-set created_at of a new order
+            created_at = order_event.get("created_at")
+            features.apply(order_event["id"], order_event["status"], _timestamp(created_at) if created_at else time.time())
+
+    def clear(self):
+        self._users.clear()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+def load_features(user_id: int) -> UserFeatures:
+    """Read a user's unpaid orders, orders inside the velocity window and account age from the primary"""
+    since = datetime.now(timezone.utc) - timedelta(minutes=FRAUD_VELOCITY_WINDOW_MINUTES)
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(Order.id, Order.status, Order.created_at)
+            .where(Order.user_id == user_id, or_(Order.status.in_(UNPAID_STATUSES), Order.created_at >= since))
+        ).all()
+        account_created = db.scalar(select(User.created_at).where(User.id == user_id))
+    finally:
+        db.close()
+    features = UserFeatures(
+        loaded_at=time.monotonic(),
+        account_created=_timestamp(account_created) if account_created is not None else None,
+    )
+    for order_id, status, created_at in rows:
+        features.apply(order_id, status, _timestamp(created_at))
+    return features
+
+@dataclass(frozen=True)
+class Verdict:
+    action: str
+    score: int
+    reasons: Tuple[str, ...]
+
+def assess(features: UserFeatures, now: float) -> Verdict:
+    """Score a user's features; reasons are shown to the admins as they are"""
+    score = 0
+    reasons = []
+    velocity = features.velocity(now)
+    if velocity > FRAUD_MAX_ORDERS_PER_WINDOW:
+        score += VELOCITY_POINTS
+        reasons.append(f"{velocity} заказов за {FRAUD_VELOCITY_WINDOW_MINUTES} мин")
+    if len(features.unpaid) > FRAUD_MAX_UNPAID:
+        score += UNPAID_POINTS
+        reasons.append(f"{len(features.unpaid)} неоплаченных заказов")
+    if features.account_created is not None and now - features.account_created < FRAUD_NEW_ACCOUNT_MINUTES * 60:
+        score += NEW_ACCOUNT_POINTS
+        reasons.append(f"аккаунт создан {int(now - features.account_created) // 60} мин назад")
+    if score >= FRAUD_HOLD_SCORE:
+        action = HOLD
+    elif score >= FRAUD_FLAG_SCORE:
+        action = FLAG
+    else:
+        action = OK
+    return Verdict(action, score, tuple(reasons))
+
+def hold_order(order_id: int) -> bool:
+    """Move a still pending order to "held"; False if it was paid or cancelled meanwhile"""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(Order).where(Order.id == order_id, Order.status == "pending").values(status="held")
+        )
+        db.commit()
+        return result.rowcount > 0
+    finally:
+        db.close()
+
+class FraudScorer:
+    """Scores new orders off the request path, then notifies the admin group, flags or holds them"""
+
+    def __init__(
+        self,
+        notify: Callable[[Order, Product, User, Optional[str]], Awaitable[None]],
+        spawn: Callable[[Coroutine], asyncio.Task],
+        broker: OrderBroker = order_broker,
+        store: Optional[FeatureStore] = None,
+        queue_size: int = FRAUD_QUEUE_SIZE,
+    ):
+        self.notify = notify
+        self.spawn = spawn
+        self.broker = broker
+        self.store = store if store is not None else FeatureStore()
+        self.scored = 0
+        self.flagged = 0
+        self.held = 0
+        # Notified without a score: queue full or scoring failed
+        self.unscored = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._events_task: Optional[asyncio.Task] = None
+
+    def submit(self, order: Order, product: Product, user: User):
+        """Queue a new order for scoring; never waits"""
+        try:
+            self._queue.put_nowait((order, product, user))
+        except asyncio.QueueFull:
+            self.unscored += 1
+            self.spawn(self.notify(order, product, user, None))
+
+    async def _score(self, order: Order, product: Product, user: User):
+        features = self.store.get(order.user_id)
+        if features is None:
+            features = await asyncio.to_thread(load_features, order.user_id)
+            self.store.put(order.user_id, features)
+        features.apply(order.id, order.status, _timestamp(order.created_at))
+        verdict = assess(features, time.time())
+        self.scored += 1
+        if verdict.action == HOLD and await asyncio.to_thread(hold_order, order.id):
+            self.held += 1
+            logger.warning(f"Order #{order.id} held for review: {', '.join(verdict.reasons)}")
+            return
+        warning = None
+        if verdict.action != OK:
+            self.flagged += 1
+            warning = ", ".join(verdict.reasons)
+        self.spawn(self.notify(order, product, user, warning))
+
+    async def _loop(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                break
+            try:
+                await self._score(*item)
+            except Exception as e:
+                # Fail open: an unscored order still reaches the admins
+                logger.error(f"Fraud scoring failed: {e}")
+                self.unscored += 1
+                self.spawn(self.notify(*item, None))
+
+    async def _follow_events(self):
+        # Status changes from every process (the bot, the scheduler, other workers) keep the features current
+        queue = self.broker.subscribe()
+        try:
+            while True:
+                order_event = await queue.get()
+                if order_event is RESYNC:
+                    self.store.clear()
+                else:
+                    self.store.apply_event(order_event)
+        finally:
+            self.broker.unsubscribe(queue)
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+        self._events_task = asyncio.create_task(self._follow_events())
+
+    async def stop(self):
+        # Orders already queued are still scored and notified
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        if self._events_task is not None:
+            self._events_task.cancel()
+            try:
+                await self._events_task
+            except asyncio.CancelledError:
+                pass
+            self._events_task = None
+
+    def stats(self) -> dict:
+        return {
+            "scored": self.scored,
+            "flagged": self.flagged,
+            "held": self.held,
+            "unscored": self.unscored,
+            "queued": self._queue.qsize(),
+            "users": len(self.store),
+        }
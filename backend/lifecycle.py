@@ -0,0 +1,114 @@
+from typing import Awaitable, Callable, Coroutine, Dict, Iterable, Set
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "20"))
+SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("SHUTDOWN_TIMEOUT_SECONDS", "20"))
+POOL_WARMUP_CONNECTIONS = int(os.getenv("POOL_WARMUP_CONNECTIONS", "5"))
+
+class Lifecycle:
+    """Readiness flag, in-flight request count and tracked background tasks of one worker"""
+
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        self.in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def request_started(self):
+        self.in_flight += 1
+        self._idle.clear()
+
+    def request_finished(self):
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self._idle.set()
+
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        """Run work after the response (e.g. Telegram notifications) and let shutdown wait for it"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background task failed: {task.exception()}")
+
+    async def wait_idle(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"Shutdown with {self.in_flight} requests still in flight")
+            return False
+
+    async def drain_tasks(self, timeout: float):
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Cancelled {len(pending)} background tasks at shutdown")
+
+lifecycle = Lifecycle()
+
+class InFlightMiddleware:
+    """Count in-flight HTTP requests so shutdown can wait for them.
+
+    Long-lived streams and the health probes are not counted.
+    """
+
+    def __init__(self, app: ASGIApp, untracked_paths: Iterable[str] = ()):
+        self.app = app
+        self.untracked_paths = set(untracked_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.untracked_paths:
+            await self.app(scope, receive, send)
+            return
+        lifecycle.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lifecycle.request_finished()
+
+def warm_pool(engine: Engine, connections: int = POOL_WARMUP_CONNECTIONS):
+    """Open connections up front so the first requests after a deploy skip the TCP/TLS/auth handshake"""
+    # Never hold more than the pool keeps, or the extra checkouts would block on the pool timeout
+    pool_size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    opened = []
+    try:
+        for _ in range(min(connections, pool_size)):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        # Closing returns them to the pool, where they stay open
+        for conn in opened:
+            conn.close()
+
+async def warm_up(steps: Dict[str, Callable[[], Awaitable[None]]], timeout: float = WARMUP_TIMEOUT_SECONDS):
+    """Run warm-up steps concurrently; a failed or slow step is logged and does not block readiness"""
+
+    async def run(name: str, step: Callable[[], Awaitable[None]]):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(step(), timeout)
+            logger.info(f"Warm-up {name} done in {(time.perf_counter() - started) * 1000:.0f} ms")
+        except Exception as e:
+            logger.error(f"Warm-up {name} failed: {e!r}")
+
+    await asyncio.gather(*(run(name, step) for name, step in steps.items()))
@@ -1,19 +1,128 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import delete, update
 from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
 from typing import List, Optional
+import asyncio
 import logging
+import math
+import os
+import secrets
+import time
 
-from database import SessionLocal, engine, Base
-from models import User, Game, App, Product, Order, ViewHistory
-from schemas import *
+from database import SessionLocal, ReadSessionLocal, engine, replica_engines, create_schema, mark_primary_read, pool_stats
+from database import PRIMARY_PIN_COOKIE, READ_YOUR_WRITES_SECONDS, primary_pin_deadline
+from models import User, Game, App, Product, Order, ViewHistory, Broadcast, StreamTicket
+from schemas import DashboardResponse, GameCreate, ProductCreate, OrderCreate, ProductBulkUpdate, ProductImportResult
+from schemas import UserStateResponse, CatalogDelta, BroadcastCreate
+from schemas import Broadcast as BroadcastSchema
 from telegram_bot import bot, send_order_notification
+from cache import recent_views, neighbour_table, product_listings, checkout_products, listing_key, product_listing_keys, RECENT_VIEWS_LIMIT
+from recommendations import load_neighbour_map
+from scheduler import OrderScheduler, StubPaymentProvider, note_view, settle_crypto_order
+from partitions import ensure_partitions, view_history_cutoff
+from bulk_import import detect_format, import_products, bulk_update_products
+from compression import CompressionMiddleware
+from responses import FastJSONResponse, iter_json_array
+from ratelimit import RateLimit
+from order_feed import order_broker, order_event_stream, start_order_feed, notify_view_change, FEED_SNAPSHOT_SIZE
+from lifecycle import lifecycle, InFlightMiddleware, warm_pool, warm_up, SHUTDOWN_TIMEOUT_SECONDS
+from vault import VaultError, get_delivery_data, store_secret
+from pricing import CRYPTO_CURRENCIES, PricingError, rate_table
+from catalog_sync import catalog_changes, current_version, install_catalog_trigger
+from broadcast import BroadcastManager, bot_sender
+from checkout import place_order
+from fraud import FraudScorer
+from settings import settings
+from schemas import Product as ProductSchema
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="UNIVERSAL SHOP API")
+# Latest orders returned by /api/me/state
+USER_STATE_ORDERS = int(os.getenv("USER_STATE_ORDERS", "10"))
+# How long a ticket for the admin order stream can wait for its connection
+STREAM_TICKET_SECONDS = float(os.getenv("STREAM_TICKET_SECONDS", "30"))
+# Held orders listed by /api/admin/fraud
+FRAUD_HELD_LIMIT = 100
+
+# Background order expiry, crypto reconciliation and archiving
+payment_provider = StubPaymentProvider()
+
+def read_neighbour_map():
+    db = ReadSessionLocal()
+    try:
+        return load_neighbour_map(db)
+    finally:
+        db.close()
+
+def warm_neighbour_table():
+    neighbour_table.load(read_neighbour_map())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create tables and the monthly partitions of orders / view_history; one worker at a time
+    await asyncio.to_thread(create_schema, engine)
+    await asyncio.to_thread(ensure_partitions, engine)
+    await asyncio.to_thread(install_catalog_trigger, engine)
+
+    # Pay connection setup, cache fills and the Bot API handshake before taking traffic
+    warm_steps = {
+        "primary pool": lambda: asyncio.to_thread(warm_pool, engine),
+        "neighbour table": lambda: asyncio.to_thread(warm_neighbour_table),
+        "bot": bot.initialize,
+        "exchange rates": lambda: asyncio.to_thread(rate_table.refresh),
+        "product listings": lambda: asyncio.to_thread(warm_product_listings),
+    }
+    for number, replica_engine in enumerate(replica_engines):
+        if replica_engine is not engine:
+            warm_steps[f"replica pool {number}"] = lambda replica_engine=replica_engine: asyncio.to_thread(warm_pool, replica_engine)
+    await warm_up(warm_steps)
+
+    # Checkout quotes from the last good rates; this keeps them fresh
+    rate_table.start()
+    app.state.order_scheduler = OrderScheduler(payment_provider, on_paid=send_product_to_user)
+    app.state.order_scheduler.start()
+    # Admin broadcasts; picks up one left running by a previous process
+    app.state.broadcasts = BroadcastManager(bot_sender(bot))
+    app.state.broadcasts.start()
+    # Scores new orders before the admin group hears about them
+    app.state.fraud = FraudScorer(send_order_notification, lifecycle.spawn)
+    app.state.fraud.start()
+    # Live admin order feed: LISTEN/NOTIFY on PostgreSQL, ORM commit hooks otherwise
+    app.state.order_feed_listener = start_order_feed(engine, asyncio.get_running_loop())
+    # Bank details and payment methods (settings.py) are re-read on SIGHUP
+    settings.install_signal_handler()
+    lifecycle.ready = True
+
+    yield
+
+    # Fail readiness first, then let running requests and queued notifications finish
+    lifecycle.ready = False
+    lifecycle.draining = True
+    await lifecycle.wait_idle(SHUTDOWN_TIMEOUT_SECONDS)
+    await app.state.order_scheduler.stop()
+    await app.state.broadcasts.stop()
+    await app.state.fraud.stop()
+    await rate_table.stop()
+    if app.state.order_feed_listener is not None:
+        await asyncio.to_thread(app.state.order_feed_listener.stop)
+    await lifecycle.drain_tasks(SHUTDOWN_TIMEOUT_SECONDS)
+    try:
+        await bot.shutdown()
+    except Exception as e:
+        logger.error(f"Bot shutdown failed: {e}")
+    for replica_engine in replica_engines:
+        replica_engine.dispose()
+    engine.dispose()
+
+app = FastAPI(title="UNIVERSAL SHOP API", default_response_class=FastJSONResponse, lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -24,10 +133,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Negotiated brotli/gzip for larger payloads (dashboard, catalog listings)
+app.add_middleware(CompressionMiddleware)
+
+# Counts requests for the shutdown drain; the order stream and probes are long-lived or trivial
+app.add_middleware(
+    InFlightMiddleware,
+    untracked_paths=["/api/admin/orders/stream", "/health/live", "/health/ready"],
+)
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Dependency
 def get_db():
@@ -37,12 +153,42 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """Read-only session on a replica, or on the primary right after the user's own writes"""
+    try:
+        pinned_until = float(request.cookies[PRIMARY_PIN_COOKIE])
+    except (KeyError, ValueError):
+        pinned_until = None
+    db = ReadSessionLocal(credentials.credentials if credentials else None, pinned_until)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def pin_to_primary(response: Response, user: User):
+    """Read-your-writes: pin in this worker and, by cookie, on whichever worker serves the next request"""
+    mark_primary_read(user.telegram_id)
+    response.set_cookie(
+        PRIMARY_PIN_COOKIE, f"{primary_pin_deadline():.3f}",
+        max_age=math.ceil(READ_YOUR_WRITES_SECONDS), path="/api", httponly=True, samesite="lax",
+    )
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     token = credentials.credentials
     user = db.query(User).filter(User.telegram_id == token).first()
+    if not user:
+        # Users registered by /start may not have reached the replica yet
+        primary = SessionLocal()
+        try:
+            user = primary.query(User).filter(User.telegram_id == token).first()
+        finally:
+            primary.close()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -50,57 +196,173 @@ def get_current_user(
         )
     return user
 
+# Per-route request budgets; each can be overridden with RATE_LIMIT_<NAME>_USER / _IP
+dashboard_rate_limit = RateLimit("dashboard", per_user="60/60", per_ip="300/60", get_user=get_current_user)
+state_rate_limit = RateLimit("state", per_user="120/60", per_ip="600/60", get_user=get_current_user)
+catalog_rate_limit = RateLimit("catalog-delta", per_ip="600/60")
+view_rate_limit = RateLimit("views", per_user="120/60", per_ip="600/60", get_user=get_current_user)
+order_rate_limit = RateLimit("orders", per_user="5/60", per_ip="20/60", get_user=get_current_user)
+webhook_rate_limit = RateLimit("crypto-webhook", per_ip="120/60")
+
 @app.get("/")
 async def root():
     return {"message": "UNIVERSAL SHOP API"}
 
-@app.get("/api/dashboard", response_model=DashboardResponse)
+@app.get("/health/live")
+async def liveness():
+    """The process is up and serving"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Warm-up finished and not draining; load balancers route traffic only while this is 200"""
+    if not lifecycle.ready:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "draining" if lifecycle.draining else "starting"},
+        )
+    return {"status": "ready", "in_flight": lifecycle.in_flight}
+
+def _recent_view_ids(db: Session, user: User) -> List[int]:
+    # Recently viewed products come from the per-user ring buffer
+    recent_ids = recent_views.get(user.id)
+    if recent_ids is None:
+        rows = (
+            db.query(ViewHistory.product_id)
+            .filter(
+                ViewHistory.user_id == user.id,
+                ViewHistory.viewed_at >= view_history_cutoff()
+            )
+            .order_by(ViewHistory.viewed_at.desc())
+            .limit(RECENT_VIEWS_LIMIT)
+            .all()
+        )
+        recent_ids = [product_id for (product_id,) in rows]
+        recent_views.fill(user.id, recent_ids)
+    return recent_ids
+
+def _view_state(db: Session, user: User, products_by_id: Optional[dict] = None) -> dict:
+    """last_viewed / recent_views / recommended; loads only the products it needs unless given the catalog"""
+    recent_ids = _recent_view_ids(db, user)
+    
+    # Recommendations are served from the precomputed neighbour table; a stale one reloads off the request
+    neighbour_table.refresh_if_stale(read_neighbour_map)
+    recommended_ids = neighbour_table.recommend(recent_ids, RECENT_VIEWS_LIMIT)
+    
+    if products_by_id is None:
+        wanted = set(recent_ids) | set(recommended_ids)
+        products_by_id = {
+            product.id: product
+            for product in db.query(Product).filter(Product.id.in_(wanted), Product.is_active == True)
+        } if wanted else {}
+    recent = [products_by_id[product_id] for product_id in recent_ids if product_id in products_by_id]
+    return {
+        "last_viewed": recent[0] if recent else None,
+        "recent_views": recent,
+        "recommended": [products_by_id[product_id] for product_id in recommended_ids if product_id in products_by_id],
+    }
+
+@app.get("/api/dashboard", response_model=DashboardResponse, dependencies=[Depends(dashboard_rate_limit.dependency)])
 async def get_dashboard(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get user dashboard with games, apps, and view history"""
+    # Taken before reading the catalog, so a delta from it cannot miss a concurrent change
+    catalog_version = current_version(db)
+    
     # Get games
     games = db.query(Game).filter(Game.is_active == True).all()
     
     # Get apps
     apps = db.query(App).filter(App.is_active == True).all()
     
-    # Get view history
-    view_history = (
-        db.query(ViewHistory)
-        .filter(ViewHistory.user_id == current_user.id)
-        .order_by(ViewHistory.viewed_at.desc())
-        .first()
-    )
-    
     # Get all products mixed
     all_products = db.query(Product).filter(Product.is_active == True).all()
+    products_by_id = {product.id: product for product in all_products}
     
     return {
         "user": current_user,
         "games": games,
         "apps": apps,
-        "last_viewed": view_history.product if view_history else None,
-        "all_products": all_products
+        **_view_state(db, current_user, products_by_id),
+        "all_products": all_products,
+        "catalog_version": catalog_version
     }
 
+@app.get("/api/me/state", response_model=UserStateResponse, dependencies=[Depends(state_rate_limit.dependency)])
+async def get_user_state(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Profile, view history and latest orders, without the catalog"""
+    orders = (
+        db.query(Order)
+        .filter(Order.user_id == current_user.id)
+        .order_by(Order.created_at.desc())
+        .limit(USER_STATE_ORDERS)
+        .all()
+    )
+    return {"user": current_user, **_view_state(db, current_user), "orders": orders}
+
+@app.get("/api/catalog/delta", response_model=CatalogDelta, dependencies=[Depends(catalog_rate_limit.dependency)])
+async def get_catalog_delta(since: int, db: Session = Depends(get_read_db)):
+    """Games, apps and products changed since a catalog version from /api/dashboard or a previous delta"""
+    return catalog_changes(db, since)
+
+def _encode_listing(products: List[Product]) -> bytes:
+    return b"".join(
+        iter_json_array(products, encode=lambda product: ProductSchema.model_validate(product).model_dump(mode="json"))
+    )
+
+def _load_listing(db: Session, key: tuple, condition) -> bytes:
+    loaded_at = time.monotonic()
+    body = _encode_listing(db.query(Product).filter(condition, Product.is_active == True).all())
+    product_listings.put(key, body, loaded_at)
+    return body
+
+def warm_product_listings():
+    """Fill the listing cache for every game and app from one catalog read"""
+    db = SessionLocal()
+    try:
+        loaded_at = time.monotonic()
+        listings = {}
+        for product in db.query(Product).filter(Product.is_active == True).order_by(Product.id):
+            for key in product_listing_keys([(product.game_id, product.app_id)]):
+                listings.setdefault(key, []).append(product)
+        for key, products in listings.items():
+            product_listings.put(key, _encode_listing(products), loaded_at)
+    finally:
+        db.close()
+
 @app.get("/api/games/{game_id}/products")
 async def get_game_products(
     game_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all products for a specific game"""
-    products = (
-        db.query(Product)
-        .filter(Product.game_id == game_id, Product.is_active == True)
-        .all()
-    )
-    return products
+    key = listing_key("game", game_id)
+    body = product_listings.get(key)
+    if body is None:
+        body = await run_in_threadpool(_load_listing, db, key, Product.game_id == game_id)
+    return Response(body, media_type="application/json")
 
-@app.post("/api/products/{product_id}/view")
+@app.get("/api/apps/{app_id}/products")
+async def get_app_products(
+    app_id: int,
+    db: Session = Depends(get_read_db)
+):
+    """Get all products for a specific app"""
+    key = listing_key("app", app_id)
+    body = product_listings.get(key)
+    if body is None:
+        body = await run_in_threadpool(_load_listing, db, key, Product.app_id == app_id)
+    return Response(body, media_type="application/json")
+
+@app.post("/api/products/{product_id}/view", dependencies=[Depends(view_rate_limit.dependency)])
 async def track_product_view(
     product_id: int,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -108,7 +370,8 @@ async def track_product_view(
     # Remove previous entry for this product
     db.query(ViewHistory).filter(
         ViewHistory.user_id == current_user.id,
-        ViewHistory.product_id == product_id
+        ViewHistory.product_id == product_id,
+        ViewHistory.viewed_at >= view_history_cutoff()
     ).delete()
     
     # Add new view
@@ -117,56 +380,78 @@ async def track_product_view(
         product_id=product_id
     )
     db.add(view)
+    notify_view_change(db, current_user.id)
     db.commit()
+    pin_to_primary(response, current_user)
+    recent_views.push(current_user.id, product_id)
+    note_view(current_user.id)
     return {"success": True}
 
-@app.delete("/api/view-history/{product_id}")
+@app.delete("/api/view-history/{product_id}", dependencies=[Depends(view_rate_limit.dependency)])
 async def delete_view_history(
     product_id: int,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete specific product from view history"""
     deleted = db.query(ViewHistory).filter(
         ViewHistory.user_id == current_user.id,
-        ViewHistory.product_id == product_id
+        ViewHistory.product_id == product_id,
+        ViewHistory.viewed_at >= view_history_cutoff()
     ).delete()
+    notify_view_change(db, current_user.id)
     db.commit()
+    pin_to_primary(response, current_user)
+    recent_views.discard(current_user.id, product_id)
     return {"success": deleted > 0}
 
-@app.post("/api/orders")
+@app.get("/api/payment-methods")
+async def get_payment_methods():
+    """Enabled payment methods from the settings, encoded once per load"""
+    return Response(settings.payment_methods_json, media_type="application/json")
+
+@app.post("/api/orders", dependencies=[Depends(order_rate_limit.dependency)])
 async def create_order(
     order_data: OrderCreate,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create a new order"""
-    product = db.query(Product).filter(Product.id == order_data.product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
+    if order_data.payment_method not in settings.current.payment_methods:
+        raise HTTPException(status_code=400, detail="Payment method not available")
     
-    # Create order
-    order = Order(
-        user_id=current_user.id,
-        product_id=order_data.product_id,
-        payment_method=order_data.payment_method,
-        amount=product.price,
-        status="pending"
-    )
-    db.add(order)
-    db.commit()
-    db.refresh(order)
+    def quote_for(price_minor: int):
+        # Crypto orders lock the coin amount at the cached rate; no rate fetch on this path
+        if order_data.payment_method in CRYPTO_CURRENCIES:
+            return rate_table.quote(order_data.payment_method, price_minor)
+        return None
+    
+    # Product from the checkout cache and a single-statement insert: no transaction to commit
+    connection = db.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+    try:
+        placed = place_order(connection, current_user.id, order_data.product_id, order_data.payment_method, quote_for)
+    except PricingError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if placed is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    product, order, quote = placed
+    pin_to_primary(response, current_user)
     
-    # Send notification to Telegram group
-    await send_order_notification(order, product, current_user)
+    # Scored after responding, then sent to the Telegram group, flagged or held for review
+    app.state.fraud.submit(order, product, current_user)
     
     # If crypto payment, generate payment link
-    if order_data.payment_method in ["ton", "usdt"]:
-        payment_url = generate_crypto_payment_link(order, product.price)
+    if quote:
+        payment_url = generate_crypto_payment_link(order, quote.amount)
         return {
             "order_id": order.id,
             "payment_url": payment_url,
-            "requires_manual_payment": False
+            "requires_manual_payment": False,
+            "crypto_amount": str(quote.amount),
+            "crypto_currency": quote.currency,
+            "rate": str(quote.rate)
         }
     else:  # Bank transfer
         return {
@@ -175,22 +460,27 @@ async def create_order(
             "requires_manual_payment": True
         }
 
-@app.post("/api/webhook/crypto")
+@app.post("/api/webhook/crypto", dependencies=[Depends(webhook_rate_limit.dependency)])
 async def crypto_webhook(payment_data: dict):
     """Webhook for crypto payment confirmation"""
     # Verify payment
     if verify_crypto_payment(payment_data):
         order_id = payment_data.get("order_id")
         db = SessionLocal()
-        order = db.query(Order).filter(Order.id == order_id).first()
-        if order:
-            order.status = "paid"
+        try:
+            # Only the caller that moves the order out of "pending" delivers it;
+            # a repeated webhook or a reconciler that got there first gets nothing
+            delivery = settle_crypto_order(db, order_id, paid=True)
             db.commit()
+        finally:
+            db.close()
+        if delivery:
+            telegram_id, delivery_data = delivery
+            # The payer's browser is not on this request: only this worker's pin applies
+            mark_primary_read(telegram_id)
             
-            # Send product data to user
-            product = db.query(Product).filter(Product.id == order.product_id).first()
-            await send_product_to_user(order.user.telegram_id, product.delivery_data)
-        db.close()
+            # Send product data to user; it is decrypted only here
+            lifecycle.spawn(send_product_to_user(telegram_id, delivery_data))
     
     return {"status": "ok"}
 
@@ -221,12 +511,72 @@ async def create_product(
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    product = Product(**product_data.dict())
+    product = Product(**product_data.dict(exclude={"delivery_data"}))
     db.add(product)
+    db.flush()
+    try:
+        store_secret(db, product.id, product_data.delivery_data)
+    except VaultError as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
     db.commit()
+    product_listings.invalidate(product_listing_keys([(product.game_id, product.app_id)]))
     db.refresh(product)
     return product
 
+@app.post("/api/admin/products/import", response_model=ProductImportResult)
+async def import_products_file(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Bulk import products from a CSV or NDJSON upload (admin only)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        fmt = detect_format(file.filename, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        return await run_in_threadpool(import_products, db, file.file, fmt)
+    except VaultError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/products/bulk-update")
+async def bulk_update(
+    changes: ProductBulkUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Change price or activity of many products at once (admin only)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        updated = await run_in_threadpool(bulk_update_products, db, changes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"updated": updated}
+
+@app.get("/api/admin/cache")
+async def get_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit / miss counters of the product listing and checkout caches (admin only)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {"product_listings": product_listings.stats(), "checkout_products": checkout_products.stats()}
+
+@app.get("/api/admin/db/pool")
+async def get_pool_stats(current_user: User = Depends(get_current_user)):
+    """Checked-out connections, checkout wait histogram and long-held connections per engine (admin only)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return pool_stats()
+
 @app.put("/api/admin/orders/{order_id}/complete")
 async def complete_order(
     order_id: int,
@@ -246,12 +596,191 @@ async def complete_order(
     
     # Send product to user if not sent yet
     if order.payment_method == "bank_transfer" and order.status == "paid":
-        product = db.query(Product).filter(Product.id == order.product_id).first()
-        await send_product_to_user(order.user.telegram_id, product.delivery_data)
+        await send_product_to_user(order.user.telegram_id, get_delivery_data(db, order.product_id))
+    
+    return {"success": True}
+
+@app.put("/api/admin/orders/{order_id}/release")
+async def release_order(
+    order_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Send an order held by the fraud scorer to the admin group as pending (admin only)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    # Only one release wins, and an order paid or expired meanwhile stays as it is
+    released = db.execute(
+        update(Order).where(Order.id == order_id, Order.status == "held").values(status="pending")
+    ).rowcount
+    db.commit()
+    order = db.query(Order).filter(Order.id == order_id).first()
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if not released:
+        raise HTTPException(status_code=400, detail="Order is not held")
+    
+    # Loaded now: the notification runs after the session is closed
+    lifecycle.spawn(send_order_notification(order, order.product, order.user))
     
     return {"success": True}
 
-def generate_crypto_payment_link(order: Order, amount: float) -> str:
+@app.get("/api/admin/fraud")
+async def get_fraud_stats(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Fraud scorer counters and the orders held for review (admin only)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    held = db.query(Order).filter(Order.status == "held").order_by(Order.created_at.desc()).limit(FRAUD_HELD_LIMIT).all()
+    return {
+        "stats": app.state.fraud.stats(),
+        "held": [
+            {"id": order.id, "user_id": order.user_id, "product_id": order.product_id,
+             "amount": order.amount, "created_at": order.created_at}
+            for order in held
+        ],
+    }
+
+@app.post("/api/admin/settings/reload")
+async def reload_settings(current_user: User = Depends(get_current_user)):
+    """Re-read the settings without a redeploy, like SIGHUP does (admin only)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    previous = settings.current
+    reloaded = settings.reload()
+    return {"reloaded": reloaded, "changed": settings.changed_fields(previous)}
+
+@app.post("/api/admin/broadcasts", response_model=BroadcastSchema)
+async def create_broadcast(
+    broadcast: BroadcastCreate,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Message every registered user (admin only); progress via GET /api/admin/broadcasts/{id}"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if not broadcast.text.strip():
+        raise HTTPException(status_code=400, detail="Broadcast text is empty")
+    
+    db_broadcast = Broadcast(text=broadcast.text)
+    db.add(db_broadcast)
+    db.commit()
+    db.refresh(db_broadcast)
+    request.app.state.broadcasts.wake()
+    return db_broadcast
+
+def _get_broadcast(db: Session, broadcast_id: int) -> Broadcast:
+    broadcast = db.query(Broadcast).filter(Broadcast.id == broadcast_id).first()
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return broadcast
+
+@app.get("/api/admin/broadcasts/{broadcast_id}", response_model=BroadcastSchema)
+async def get_broadcast(
+    broadcast_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Broadcast progress and throughput (admin only)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return _get_broadcast(db, broadcast_id)
+
+@app.put("/api/admin/broadcasts/{broadcast_id}/{action}", response_model=BroadcastSchema)
+async def control_broadcast(
+    broadcast_id: int,
+    action: str,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Pause or resume a broadcast (admin only); a paused one stops after the current page"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    transitions = {"pause": ("running", "paused"), "resume": ("paused", "running")}
+    if action not in transitions:
+        raise HTTPException(status_code=404, detail="Unknown action")
+    
+    broadcast = _get_broadcast(db, broadcast_id)
+    current, new = transitions[action]
+    if broadcast.status != current:
+        raise HTTPException(status_code=409, detail=f"Broadcast is {broadcast.status}")
+    broadcast.status = new
+    db.commit()
+    db.refresh(broadcast)
+    if new == "running":
+        request.app.state.broadcasts.wake()
+    return broadcast
+
+def _recent_orders() -> List[dict]:
+    db = SessionLocal()
+    try:
+        orders = db.query(Order).order_by(Order.id.desc()).limit(FEED_SNAPSHOT_SIZE).all()
+        return [
+            {column.name: getattr(order, column.name) for column in Order.__table__.columns}
+            for order in orders
+        ]
+    finally:
+        db.close()
+
+@app.post("/api/admin/orders/stream-ticket")
+async def create_stream_ticket(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Single-use ticket for one /api/admin/orders/stream connection, so the bearer token stays out of URLs and logs"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    now = datetime.now(timezone.utc)
+    # Tickets never redeemed are dropped here; the table stays at a few rows
+    db.execute(delete(StreamTicket).where(StreamTicket.expires_at < now))
+    ticket = secrets.token_urlsafe(32)
+    db.add(StreamTicket(ticket=ticket, user_id=current_user.id, expires_at=now + timedelta(seconds=STREAM_TICKET_SECONDS)))
+    db.commit()
+    return {"ticket": ticket, "expires_in": STREAM_TICKET_SECONDS}
+
+def _redeem_stream_ticket(ticket: str) -> Optional[User]:
+    # Deleted as it is read: a ticket opens one connection, on whichever worker it lands
+    db = SessionLocal()
+    try:
+        user_id = db.scalar(
+            delete(StreamTicket)
+            .where(StreamTicket.ticket == ticket, StreamTicket.expires_at > datetime.now(timezone.utc))
+            .returning(StreamTicket.user_id)
+        )
+        db.commit()
+        return db.get(User, user_id) if user_id is not None else None
+    finally:
+        db.close()
+
+@app.get("/api/admin/orders/stream")
+async def stream_orders(request: Request, ticket: str):
+    """Server-sent order feed for the admin panel: a snapshot of recent orders, then deltas"""
+    # EventSource cannot set headers; it brings a ticket from POST /api/admin/orders/stream-ticket
+    user = await run_in_threadpool(_redeem_stream_ticket, ticket)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid or expired stream ticket")
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    async def is_disconnected() -> bool:
+        return lifecycle.draining or await request.is_disconnected()
+
+    return StreamingResponse(
+        order_event_stream(order_broker, lambda: run_in_threadpool(_recent_orders), is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def generate_crypto_payment_link(order: Order, amount: Decimal) -> str:
     """Generate payment link for crypto"""
     # Implementation for TON/USDT payment
     return f"https://t.me/CryptoBot?start=payment_{order.id}"
@@ -263,11 +792,7 @@ def verify_crypto_payment(payment_data: dict) -> bool:
 
 def get_bank_details() -> dict:
     """Get bank details for manual transfer"""
-    return {
-        "bank_name": "Тинькофф",
-        "card_number": "5536 9137 1234 5678",
-        "account_holder": "Иван Иванов"
-    }
+    return settings.bank_details
 
 async def send_product_to_user(telegram_id: int, product_data: str):
     """Send product data to user via Telegram"""
@@ -280,5 +805,6 @@ async def send_product_to_user(telegram_id: int, product_data: str):
         logger.error(f"Failed to send product to user {telegram_id}: {e}")
 
 if __name__ == "__main__":
+    # Development entry point; production runs serve.py (multi-worker)
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
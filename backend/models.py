@@ -1,7 +1,17 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Numeric, Boolean, DateTime, Text, ForeignKey, Index, Identity, PrimaryKeyConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from database import Base
+from database import Base, engine
+from pricing import CURRENCY, from_minor, to_minor
+
+# orders and view_history are range-partitioned by month on PostgreSQL (partitions.py), which needs
+# the partition column in the primary key. PostgreSQL cannot make id alone unique there; the
+# identity sequence does. Without partitioning (SQLite in development) the key is the id alone,
+# so the database numbers it (rowid).
+PARTITIONED = engine.dialect.name == "postgresql"
+
+def partitioned_key(partition_column: str) -> PrimaryKeyConstraint:
+    return PrimaryKeyConstraint("id", partition_column) if PARTITIONED else PrimaryKeyConstraint("id")
 
 class User(Base):
     __tablename__ = "users"
@@ -12,6 +22,9 @@ class User(Base):
     first_name = Column(String)
     last_name = Column(String, nullable=True)
     is_admin = Column(Boolean, default=False)
+    # Set when a broadcast finds the bot blocked or the account deleted; cleared by /start
+    is_blocked = Column(Boolean, default=False, nullable=False, server_default="false")
+    blocked_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     orders = relationship("Order", back_populates="user")
@@ -25,6 +38,8 @@ class Game(Base):
     icon_url = Column(String)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Catalog deltas (catalog_sync.py) select rows by this
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
     
     products = relationship("Product", back_populates="game")
 
@@ -36,6 +51,7 @@ class App(Base):
     icon_url = Column(String)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
     
     products = relationship("Product", back_populates="app")
 
@@ -48,40 +64,148 @@ class Product(Base):
     name = Column(String, index=True)
     description = Column(Text)
     image_url = Column(String)
-    price = Column(Float)
-    delivery_data = Column(Text)  # Логин:пароль или инструкция
+    # Kopecks (pricing.py); `price` below is the rouble view used by the API
+    price_minor = Column(BigInteger)
     is_active = Column(Boolean, default=True)
     is_unique = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
     
     game = relationship("Game", back_populates="products")
     app = relationship("App", back_populates="products")
     orders = relationship("Order", back_populates="product")
     view_history = relationship("ViewHistory", back_populates="product")
+    
+    @property
+    def price(self):
+        return from_minor(self.price_minor)
+    
+    @price.setter
+    def price(self, value):
+        self.price_minor = to_minor(value)
+
+# Delivery data (логин:пароль или инструкция), Fernet-encrypted and kept out of the catalog rows (vault.py)
+class ProductSecret(Base):
+    __tablename__ = "product_secrets"
+    
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    ciphertext = Column(Text, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 class Order(Base):
     __tablename__ = "orders"
     
-    id = Column(Integer, primary_key=True, index=True)
+    # Range-partitioned by month on created_at (partitions.py), so it is part of the key there
+    id = Column(Integer, Identity(), index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     product_id = Column(Integer, ForeignKey("products.id"))
     payment_method = Column(String)  # "ton", "usdt", "bank_transfer"
-    amount = Column(Float)
-    status = Column(String, default="pending")  # pending, paid, completed, cancelled
+    amount_minor = Column(BigInteger)  # kopecks
+    currency = Column(String, default=CURRENCY)
+    # Crypto orders lock the coin amount and the rate it was quoted at
+    pay_currency = Column(String, nullable=True)  # "TON", "USDT"
+    pay_amount = Column(Numeric(30, 9), nullable=True)
+    rate = Column(Numeric(30, 9), nullable=True)  # RUB per coin
+    rate_at = Column(DateTime(timezone=True), nullable=True)
+    status = Column(String, default="pending")  # pending, held, paid, completed, cancelled, expired
     crypto_hash = Column(String, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
     
     user = relationship("User", back_populates="orders")
     product = relationship("Product", back_populates="orders")
+    
+    @property
+    def amount(self):
+        return from_minor(self.amount_minor)
+    
+    # Scheduler scans by status and age (expiry, reconciliation, archiving)
+    __table_args__ = (
+        partitioned_key("created_at"),
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        # A user's latest orders (/api/me/state)
+        Index("ix_orders_user_created_at", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    # Ids are unique on their own; the ORM finds rows by id, not by the partitioned key
+    __mapper_args__ = {"primary_key": [id]}
+
+class OrderArchive(Base):
+    __tablename__ = "orders_archive"
+    
+    # Cold copy of finished orders moved out of the hot table by scheduler.py
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, index=True)
+    product_id = Column(Integer)
+    payment_method = Column(String)
+    amount_minor = Column(BigInteger)
+    currency = Column(String)
+    pay_currency = Column(String, nullable=True)
+    pay_amount = Column(Numeric(30, 9), nullable=True)
+    rate = Column(Numeric(30, 9), nullable=True)
+    rate_at = Column(DateTime(timezone=True), nullable=True)
+    status = Column(String)
+    crypto_hash = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class ViewHistory(Base):
     __tablename__ = "view_history"
     
-    id = Column(Integer, primary_key=True, index=True)
+    # Range-partitioned by month on viewed_at; old partitions are dropped (partitions.py)
+    id = Column(Integer, Identity(), index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     product_id = Column(Integer, ForeignKey("products.id"))
-    viewed_at = Column(DateTime(timezone=True), server_default=func.now())
+    viewed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     
     user = relationship("User", back_populates="view_history")
     product = relationship("Product", back_populates="view_history")
+    
+    __table_args__ = (
+        partitioned_key("viewed_at"),
+        Index("ix_view_history_user_viewed_at", "user_id", "viewed_at"),
+        {"postgresql_partition_by": "RANGE (viewed_at)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+class ProductNeighbour(Base):
+    __tablename__ = "product_neighbours"
+    
+    # Precomputed "also viewed / also bought" rows, rebuilt offline by recommendations.py
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    neighbour_id = Column(Integer, ForeignKey("products.id"))
+    score = Column(Float)
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+    
+    # Admin message to every user; progress is checkpointed so a restart resumes (broadcast.py)
+    id = Column(Integer, primary_key=True, index=True)
+    text = Column(Text)
+    status = Column(String, default="running")  # running, paused, completed
+    # Keyset cursor: every user with a smaller or equal id has been handled
+    last_user_id = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    blocked = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    # Time spent sending, summed over runs, for the throughput figure
+    elapsed_seconds = Column(Float, default=0)
+    # The worker running it holds a lease; an expired lease lets another worker resume it
+    lease_until = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    @property
+    def messages_per_second(self) -> float:
+        handled = (self.sent or 0) + (self.blocked or 0) + (self.failed or 0)
+        return handled / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+class StreamTicket(Base):
+    __tablename__ = "stream_tickets"
+    
+    # Single-use ticket for the admin order stream: EventSource cannot send the bearer token as a header
+    ticket = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,228 @@
+from typing import Awaitable, Callable, List, Optional, Set
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from cache import recent_views
+from database import schema_lock
+from models import Order
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENTS_CHANNEL = "order_events"
+# "<process token>:<user id>" after a view-history write; other workers drop that user's recent views
+VIEW_EVENTS_CHANNEL = "view_history_events"
+# Tells this process's own view notifications apart from other workers'
+PROCESS_TOKEN = uuid.uuid4().hex
+FEED_SNAPSHOT_SIZE = int(os.getenv("FEED_SNAPSHOT_SIZE", "50"))
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "1000"))
+FEED_KEEPALIVE_SECONDS = float(os.getenv("FEED_KEEPALIVE_SECONDS", "15"))
+# Streams end after this long and EventSource reconnects, so an open feed never holds up a shutdown for long
+FEED_MAX_STREAM_SECONDS = float(os.getenv("FEED_MAX_STREAM_SECONDS", "300"))
+
+ORDER_EVENT_COLUMNS = [
+    "id", "user_id", "product_id", "payment_method", "amount_minor", "currency",
+    "pay_currency", "pay_amount", "rate", "rate_at", "status", "crypto_hash", "created_at", "completed_at",
+]
+
+_ORDER_EVENT_FIELDS = ", ".join(f"'{column}', NEW.{column}" for column in ORDER_EVENT_COLUMNS)
+
+# Every insert/update of orders, from any process (API workers, bot, scheduler), lands on one channel
+ORDER_TRIGGER_SQL = [
+    f"""
+    CREATE OR REPLACE FUNCTION notify_order_change() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{ORDER_EVENTS_CHANNEL}', json_build_object({_ORDER_EVENT_FIELDS})::text);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS orders_notify ON orders",
+    "CREATE TRIGGER orders_notify AFTER INSERT OR UPDATE ON orders "
+    "FOR EACH ROW EXECUTE FUNCTION notify_order_change()",
+]
+
+# Queued to a subscriber that fell behind or may have missed events: resend the snapshot
+RESYNC = object()
+
+class OrderBroker:
+    """In-process fan-out of order events to SSE subscribers"""
+
+    def __init__(self, queue_size: int = FEED_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, order_event):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(order_event)
+            except asyncio.QueueFull:
+                # A slow client gets a fresh snapshot instead of an unbounded backlog
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+    def publish_threadsafe(self, order_event):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.publish, order_event)
+
+order_broker = OrderBroker()
+
+def notify_view_change(db: Session, user_id: int):
+    """Tell the other workers a user's view history changed; sent on commit, PostgreSQL only"""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": VIEW_EVENTS_CHANNEL, "payload": f"{PROCESS_TOKEN}:{user_id}"},
+        )
+
+def _on_view_change(payload: str):
+    origin, user_id = payload.split(":", 1)
+    if origin != PROCESS_TOKEN:
+        recent_views.forget(int(user_id))
+
+def install_order_trigger(engine: Engine):
+    if engine.dialect.name != "postgresql":
+        return
+    # Concurrent CREATE OR REPLACE FUNCTION from several workers fails with "tuple concurrently updated"
+    with schema_lock(engine), engine.begin() as conn:
+        for statement in ORDER_TRIGGER_SQL:
+            conn.execute(text(statement))
+
+class PgOrderListener:
+    """Dedicated LISTEN connection feeding the broker (and recent-views invalidation) from a background thread"""
+
+    def __init__(self, engine: Engine, broker: OrderBroker = order_broker, reconnect_delay: float = 5.0):
+        # Outside the pool: the connection stays checked out for the life of the process
+        self.dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        self.broker = broker
+        self.reconnect_delay = reconnect_delay
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="order-feed-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.reconnect_delay + 1)
+            self._thread = None
+
+    def _run(self):
+        import psycopg2
+
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {ORDER_EVENTS_CHANNEL}")
+                    cursor.execute(f"LISTEN {VIEW_EVENTS_CHANNEL}")
+                # Notifications sent while disconnected are lost
+                self.broker.publish_threadsafe(RESYNC)
+                recent_views.clear()
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            notify = conn.notifies.pop(0)
+                            if notify.channel == VIEW_EVENTS_CHANNEL:
+                                _on_view_change(notify.payload)
+                            else:
+                                self.broker.publish_threadsafe(json.loads(notify.payload))
+            except Exception as e:
+                logger.error(f"Order feed listener failed: {e}")
+                self._stopping.wait(self.reconnect_delay)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+def _order_event(order: Order) -> dict:
+    # Read loaded attributes only: a lazy load inside a flush would issue more SQL
+    state = inspect(order).dict
+    return {column: state.get(column) for column in ORDER_EVENT_COLUMNS}
+
+def install_session_hooks(broker: OrderBroker = order_broker):
+    """Without LISTEN/NOTIFY (SQLite in development), publish orders changed through the ORM on commit.
+
+    Bulk UPDATE statements (the scheduler) are not seen by this fallback.
+    """
+
+    @event.listens_for(Session, "after_flush")
+    def collect_order_events(session, flush_context):
+        changed = [obj for obj in list(session.new) + list(session.dirty) if isinstance(obj, Order)]
+        if changed:
+            session.info.setdefault("order_events", []).extend(_order_event(order) for order in changed)
+
+    @event.listens_for(Session, "after_commit")
+    def publish_order_events(session):
+        for order_event in session.info.pop("order_events", []):
+            broker.publish_threadsafe(order_event)
+
+    @event.listens_for(Session, "after_rollback")
+    def drop_order_events(session):
+        session.info.pop("order_events", None)
+
+def start_order_feed(engine: Engine, loop: asyncio.AbstractEventLoop) -> Optional[PgOrderListener]:
+    order_broker.bind(loop)
+    if engine.dialect.name != "postgresql":
+        install_session_hooks()
+        return None
+    install_order_trigger(engine)
+    listener = PgOrderListener(engine)
+    listener.start()
+    return listener
+
+def format_event(name: str, data) -> bytes:
+    return b"event: " + name.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+async def order_event_stream(
+    broker: OrderBroker,
+    snapshot: Callable[[], Awaitable[List[dict]]],
+    is_disconnected: Callable[[], Awaitable[bool]],
+):
+    """SSE body: one snapshot of recent orders, then only per-order deltas"""
+    # Subscribe before loading the snapshot so nothing committed in between is lost
+    queue = broker.subscribe()
+    deadline = asyncio.get_running_loop().time() + FEED_MAX_STREAM_SECONDS
+    try:
+        yield format_event("snapshot", await snapshot())
+        while asyncio.get_running_loop().time() < deadline:
+            try:
+                order_event = await asyncio.wait_for(queue.get(), timeout=FEED_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                yield b": keepalive\n\n"
+                continue
+            if order_event is RESYNC:
+                yield format_event("snapshot", await snapshot())
+            else:
+                yield format_event("order", order_event)
+    finally:
+        broker.unsubscribe(queue)
@@ -0,0 +1,127 @@
+from datetime import date, datetime, timezone
+from typing import List, Optional
+import logging
+import os
+import re
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from database import schema_lock
+
+logger = logging.getLogger(__name__)
+
+# Partitioned table -> partition key column (see __table_args__ in models.py)
+PARTITIONED_TABLES = {
+    "orders": "created_at",
+    "view_history": "viewed_at",
+}
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+VIEW_HISTORY_RETENTION_MONTHS = int(os.getenv("VIEW_HISTORY_RETENTION_MONTHS", "6"))
+
+_PARTITION_NAME = re.compile(r"^(?P<table>\w+)_y(?P<year>\d{4})m(?P<month>\d{2})$")
+
+def month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+def view_history_cutoff(now: Optional[datetime] = None) -> datetime:
+    """Oldest viewed_at still retained; filtering on it lets Postgres prune partitions"""
+    start = add_months(month_start(now or datetime.now(timezone.utc)), -VIEW_HISTORY_RETENTION_MONTHS)
+    return datetime(start.year, start.month, 1, tzinfo=timezone.utc)
+
+def _is_postgres(engine: Engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+def month_partition_sql(table: str, month: date) -> List[str]:
+    """Statements (one transaction) creating a month partition, with that month's rows moved out of the default.
+
+    CREATE TABLE ... PARTITION OF fails while the default partition holds rows of
+    the month (inserted while the scheduler was behind), so the partition is built
+    standalone, filled from the default and then attached.
+    """
+    name = partition_name(table, month)
+    column = PARTITIONED_TABLES[table]
+    bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    in_month = f"{column} >= '{month.isoformat()}' AND {column} < '{add_months(month, 1).isoformat()}'"
+    return [
+        f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)",
+        f"WITH moved AS (DELETE FROM {table}_default WHERE {in_month} RETURNING *) INSERT INTO {name} SELECT * FROM moved",
+        f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds}",
+    ]
+
+def ensure_partitions(engine: Engine, now: Optional[datetime] = None):
+    """Create monthly partitions for the current month and PARTITION_MONTHS_AHEAD ahead"""
+    if not _is_postgres(engine):
+        return
+    current = month_start(now or datetime.now(timezone.utc))
+    with schema_lock(engine):
+        for table in PARTITIONED_TABLES:
+            # Catch-all so an insert never fails if the scheduler fell behind
+            with engine.begin() as conn:
+                conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+            existing = set(list_partitions(engine, table))
+            for offset in range(PARTITION_MONTHS_AHEAD + 1):
+                month = add_months(current, offset)
+                if partition_name(table, month) in existing:
+                    continue
+                try:
+                    with engine.begin() as conn:
+                        for statement in month_partition_sql(table, month):
+                            conn.execute(text(statement))
+                except Exception as e:
+                    logger.error(f"Failed to create partition {partition_name(table, month)}: {e}")
+
+def list_partitions(engine: Engine, table: str) -> List[str]:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :table"
+            ),
+            {"table": table},
+        )
+        return [name for (name,) in rows]
+
+def drop_expired_view_history(engine: Engine, now: Optional[datetime] = None) -> List[str]:
+    """Detach and drop view_history partitions that fall entirely before the retention cutoff,
+    and delete expired rows left in the default partition"""
+    if not _is_postgres(engine):
+        return []
+    cutoff = month_start(view_history_cutoff(now))
+    dropped = []
+    with schema_lock(engine):
+        for name in list_partitions(engine, "view_history"):
+            match = _PARTITION_NAME.match(name)
+            if not match:
+                continue
+            month = date(int(match["year"]), int(match["month"]), 1)
+            if add_months(month, 1) <= cutoff:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE view_history DETACH PARTITION {name}"))
+                    conn.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+        with engine.begin() as conn:
+            purged = conn.execute(
+                text("DELETE FROM view_history_default WHERE viewed_at < :cutoff"),
+                {"cutoff": view_history_cutoff(now)},
+            ).rowcount
+    if purged:
+        logger.info(f"Deleted {purged} expired rows from view_history_default")
+    if dropped:
+        logger.info(f"Dropped expired view_history partitions: {', '.join(dropped)}")
+    return dropped
+
+def maintain_partitions(engine: Engine):
+    """Periodic job: create upcoming partitions and enforce view_history retention"""
+    ensure_partitions(engine)
+    drop_expired_view_history(engine)
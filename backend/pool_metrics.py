@@ -0,0 +1,172 @@
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the checkout wait histogram, milliseconds
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+# A connection checked out longer than this is reported with the stack that took it
+DB_POOL_HOLD_WARN_SECONDS = float(os.getenv("DB_POOL_HOLD_WARN_SECONDS", "10"))
+# Frames kept per checkout; 0 turns stack capture off (held times are still tracked)
+DB_POOL_STACK_DEPTH = int(os.getenv("DB_POOL_STACK_DEPTH", "12"))
+# Long-held connections are looked for at most this often, on checkout
+HOLD_SCAN_INTERVAL_SECONDS = 1.0
+
+# Frames of SQLAlchemy (including its generated "<string>" wrappers) and of this module
+# say nothing about who took the connection
+_INTERNAL_PATHS = (os.sep + "sqlalchemy" + os.sep, __file__, "<string>")
+
+def _capture_stack(depth: int) -> Optional[traceback.StackSummary]:
+    if depth <= 0:
+        return None
+    frames = (
+        (frame, lineno) for frame, lineno in traceback.walk_stack(sys._getframe(1))
+        if not any(path in frame.f_code.co_filename for path in _INTERNAL_PATHS)
+    )
+    # Source lines are read only if the stack is ever printed
+    return traceback.StackSummary.extract(frames, limit=depth, lookup_lines=False)
+
+def _format_stack(stack: Optional[traceback.StackSummary]) -> List[str]:
+    if stack is None:
+        return []
+    # walk_stack yields innermost first; print outermost first like a traceback
+    return [f"{frame.filename}:{frame.lineno} in {frame.name}" for frame in reversed(stack)]
+
+class PoolMetrics:
+    """Checkout wait histogram, timeouts and currently held connections of one pool"""
+
+    def __init__(self, hold_warn_seconds: float = DB_POOL_HOLD_WARN_SECONDS, stack_depth: int = DB_POOL_STACK_DEPTH):
+        self.hold_warn_seconds = hold_warn_seconds
+        self.stack_depth = stack_depth
+        self.wait_counts = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.wait_seconds_total = 0.0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.long_held = 0
+        # id(connection record) -> (checked out at, stack, already reported)
+        self._held: Dict[int, Tuple[float, Optional[traceback.StackSummary], bool]] = {}
+        self._next_scan = 0.0
+        self._lock = threading.Lock()
+
+    def observe_wait(self, seconds: float):
+        milliseconds = seconds * 1000
+        index = next((i for i, bound in enumerate(WAIT_BUCKETS_MS) if milliseconds <= bound), len(WAIT_BUCKETS_MS))
+        with self._lock:
+            self.wait_counts[index] += 1
+            self.wait_seconds_total += seconds
+            self.checkouts += 1
+
+    def on_checkout(self, record):
+        now = time.monotonic()
+        stack = _capture_stack(self.stack_depth)
+        with self._lock:
+            self._held[id(record)] = (now, stack, False)
+            scan = now >= self._next_scan
+            if scan:
+                self._next_scan = now + HOLD_SCAN_INTERVAL_SECONDS
+        if scan:
+            self.report_long_held()
+
+    def on_checkin(self, record):
+        with self._lock:
+            entry = self._held.pop(id(record), None)
+        if entry is None:
+            return
+        checked_out_at, stack, reported = entry
+        held = time.monotonic() - checked_out_at
+        if held >= self.hold_warn_seconds and not reported:
+            with self._lock:
+                self.long_held += 1
+            logger.warning(
+                f"DB connection held for {held:.1f}s, checked out at:\n  " + "\n  ".join(_format_stack(stack))
+            )
+
+    def held_connections(self) -> List[dict]:
+        """Connections checked out right now, longest held first"""
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._held.values())
+        return sorted(
+            ({"held_seconds": now - checked_out_at, "stack": _format_stack(stack)} for checked_out_at, stack, _ in entries),
+            key=lambda entry: entry["held_seconds"],
+            reverse=True,
+        )
+
+    def report_long_held(self) -> int:
+        """Log connections held past the threshold that were not reported yet; a leaked session shows up here"""
+        now = time.monotonic()
+        found = []
+        with self._lock:
+            for key, (checked_out_at, stack, reported) in self._held.items():
+                if not reported and now - checked_out_at >= self.hold_warn_seconds:
+                    self._held[key] = (checked_out_at, stack, True)
+                    self.long_held += 1
+                    found.append((now - checked_out_at, stack))
+        for held, stack in found:
+            logger.warning(
+                f"DB connection checked out for {held:.1f}s and not returned, taken at:\n  "
+                + "\n  ".join(_format_stack(stack))
+            )
+        return len(found)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip([*map(str, WAIT_BUCKETS_MS), "+Inf"], self.wait_counts):
+                cumulative += count
+                buckets[bound] = cumulative
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "long_held": self.long_held,
+                "wait_seconds_total": self.wait_seconds_total,
+                # Cumulative counts of checkouts that waited at most that many milliseconds
+                "wait_ms_buckets": buckets,
+            }
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited and which connections are held"""
+
+    def __init__(self, *args, metrics: Optional[PoolMetrics] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics or PoolMetrics()
+        # A recreated pool inherits the listeners together with the rest of the dispatch
+        if "_dispatch" not in kwargs:
+            event.listen(self, "checkout", lambda dbapi_connection, record, proxy: self.metrics.on_checkout(record))
+            event.listen(self, "checkin", lambda dbapi_connection, record: self.metrics.on_checkin(record))
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.observe_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self) -> "TimedQueuePool":
+        # engine.dispose() swaps in a new pool; the counters carry over
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(0, self.overflow()),
+            "max_overflow": self._max_overflow,
+            **self.metrics.snapshot(),
+        }
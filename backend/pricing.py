@@ -0,0 +1,218 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP, ROUND_UP
+from typing import Dict, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Prices and order amounts are stored as integer kopecks
+CURRENCY = "RUB"
+MINOR_DIGITS = 2
+
+# "stub" (fixed PRICING_STUB_RATES) or "file" (JSON at PRICING_RATES_FILE, written by an external job)
+PRICING_RATE_SOURCE = os.getenv("PRICING_RATE_SOURCE", "stub")
+PRICING_RATES_FILE = os.getenv("PRICING_RATES_FILE", "rates.json")
+PRICING_STUB_RATES = os.getenv("PRICING_STUB_RATES", "TON=250,USDT=95")
+PRICING_REFRESH_SECONDS = float(os.getenv("PRICING_REFRESH_SECONDS", "60"))
+# Rates older than this are not quoted: crypto checkout answers 503 until a refresh succeeds
+PRICING_RATE_TTL_SECONDS = float(os.getenv("PRICING_RATE_TTL_SECONDS", "900"))
+
+# Payment method -> (coin, quote step); quotes round up so an order is never underpaid
+CRYPTO_CURRENCIES = {
+    "ton": ("TON", Decimal("0.0001")),
+    "usdt": ("USDT", Decimal("0.01")),
+}
+
+class PricingError(Exception):
+    pass
+
+def to_minor(amount) -> int:
+    """Roubles (number or string) to kopecks, rounding half up"""
+    try:
+        value = Decimal(str(amount))
+    except InvalidOperation:
+        raise ValueError(f"Not a valid amount: {amount!r}")
+    if not value.is_finite():
+        raise ValueError(f"Not a valid amount: {amount!r}")
+    return int(value.scaleb(MINOR_DIGITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_minor(minor: Optional[int]) -> Optional[Decimal]:
+    """Kopecks to roubles with exactly two decimals"""
+    if minor is None:
+        return None
+    return Decimal(minor).scaleb(-MINOR_DIGITS)
+
+def parse_rates(spec: str) -> Dict[str, Decimal]:
+    """Parse "TON=250,USDT=95" into RUB per coin"""
+    rates = {}
+    for part in spec.split(","):
+        if part.strip():
+            currency, _, rate = part.partition("=")
+            rates[currency.strip().upper()] = Decimal(rate.strip())
+    return rates
+
+@dataclass(frozen=True)
+class Quote:
+    """Coin amount for an order, with the rate it was computed from"""
+    currency: str
+    amount: Decimal
+    rate: Decimal  # RUB per coin
+    rate_at: datetime
+
+    def order_fields(self) -> dict:
+        return {"pay_currency": self.currency, "pay_amount": self.amount, "rate": self.rate, "rate_at": self.rate_at}
+
+class RateSource:
+    """Where exchange rates come from; fetch() is blocking and runs in a worker thread"""
+
+    def fetch(self) -> Dict[str, Decimal]:
+        """Return RUB per coin keyed by currency code"""
+        raise NotImplementedError
+
+class FileRateSource(RateSource):
+    """JSON object such as {"TON": "250.10", "USDT": "95.3"}, re-read on every refresh"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def fetch(self) -> Dict[str, Decimal]:
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        return {currency.upper(): Decimal(str(rate)) for currency, rate in data.items()}
+
+class StubRateSource(RateSource):
+    """Fixed rates for development and tests"""
+
+    def __init__(self, rates: Dict[str, Decimal]):
+        self.rates = dict(rates)
+
+    def fetch(self) -> Dict[str, Decimal]:
+        return dict(self.rates)
+
+def make_rate_source() -> RateSource:
+    if PRICING_RATE_SOURCE == "file":
+        return FileRateSource(PRICING_RATES_FILE)
+    if PRICING_RATE_SOURCE == "stub":
+        return StubRateSource(parse_rates(PRICING_STUB_RATES))
+    raise ValueError(f"Unknown PRICING_RATE_SOURCE {PRICING_RATE_SOURCE!r}, expected file or stub")
+
+class RateTable:
+    """Last good rates of a source, refreshed in the background; quoting never waits for a fetch"""
+
+    def __init__(
+        self,
+        source: RateSource,
+        ttl: float = PRICING_RATE_TTL_SECONDS,
+        interval: float = PRICING_REFRESH_SECONDS,
+    ):
+        self.source = source
+        self.ttl = ttl
+        self.interval = interval
+        # (rates, monotonic fetch time, wall-clock fetch time); replaced as a whole, so readers need no lock
+        self._snapshot: Optional[Tuple[Dict[str, Decimal], float, datetime]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    def refresh(self) -> bool:
+        """Fetch from the source; on failure the previous rates stay until they expire"""
+        try:
+            rates = self.source.fetch()
+            for currency, rate in rates.items():
+                if not rate.is_finite() or rate <= 0:
+                    raise ValueError(f"{currency} rate {rate} is not positive")
+        except Exception as e:
+            logger.error(f"Exchange rate refresh failed: {e}")
+            return False
+        self._snapshot = (rates, time.monotonic(), datetime.now(timezone.utc))
+        return True
+
+    def rate(self, currency: str) -> Optional[Tuple[Decimal, datetime]]:
+        """Current (RUB per coin, fetched at), or None if unknown or older than the TTL"""
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot[1] > self.ttl:
+            return None
+        rate = snapshot[0].get(currency)
+        return (rate, snapshot[2]) if rate is not None else None
+
+    def quote(self, payment_method: str, amount_minor: int) -> Quote:
+        currency, step = CRYPTO_CURRENCIES[payment_method]
+        current = self.rate(currency)
+        if current is None:
+            raise PricingError(f"No current {currency} rate, try again later or pay by bank transfer")
+        rate, rate_at = current
+        amount = (from_minor(amount_minor) / rate).quantize(step, rounding=ROUND_UP)
+        return Quote(currency=currency, amount=amount, rate=rate, rate_at=rate_at)
+
+    async def _loop(self):
+        while not self._stopping.is_set():
+            await asyncio.to_thread(self.refresh)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+rate_table = RateTable(make_rate_source())
+
+# Float money columns of databases created before pricing.py: (table, old column, new column)
+LEGACY_MONEY_COLUMNS = [
+    ("products", "price", "price_minor"),
+    ("orders", "amount", "amount_minor"),
+    ("orders_archive", "amount", "amount_minor"),
+]
+
+def migrate_minor_units(engine: Engine) -> int:
+    """Add the pricing columns to an existing database and convert float roubles to kopecks"""
+    from models import Order, OrderArchive, Product
+
+    inspector = inspect(engine)
+    tables = {model.__tablename__: model.__table__ for model in (Product, Order, OrderArchive)}
+    existing = {name: {column["name"] for column in inspector.get_columns(name)} for name in tables}
+    converted = 0
+    with engine.begin() as conn:
+        for name, table in tables.items():
+            for column in table.columns:
+                if column.name not in existing[name]:
+                    conn.execute(text(
+                        f"ALTER TABLE {name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                    ))
+        for name, old, new in LEGACY_MONEY_COLUMNS:
+            if old in existing[name]:
+                converted += conn.execute(text(
+                    f"UPDATE {name} SET {new} = ROUND({old} * {10 ** MINOR_DIGITS}) WHERE {new} IS NULL"
+                )).rowcount
+                conn.execute(text(f"ALTER TABLE {name} DROP COLUMN {old}"))
+        conn.execute(text(f"UPDATE orders SET currency = '{CURRENCY}' WHERE currency IS NULL"))
+        conn.execute(text(f"UPDATE orders_archive SET currency = '{CURRENCY}' WHERE currency IS NULL"))
+    logger.info(f"Converted {converted} money values to minor units")
+    return converted
+
+# Usage:
+#   python pricing.py migrate   convert float prices / amounts of an existing database to kopecks
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] == ["migrate"]:
+        from database import engine
+
+        migrate_minor_units(engine)
+    else:
+        print("Usage: python pricing.py migrate")
+        sys.exit(1)
@@ -0,0 +1,110 @@
+from collections import defaultdict
+from itertools import combinations
+from typing import Dict, List, Tuple
+import logging
+import math
+import os
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Order, ProductNeighbour, ViewHistory
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NEIGHBOURS_PER_PRODUCT = int(os.getenv("NEIGHBOURS_PER_PRODUCT", "10"))
+# Longest per-user basket considered; keeps the pair count quadratic in a small number
+MAX_BASKET_SIZE = int(os.getenv("RECOMMENDATIONS_MAX_BASKET", "50"))
+VIEW_WEIGHT = 1.0
+ORDER_WEIGHT = 3.0
+
+def _user_baskets(db: Session):
+    """Yield {product_id: weight} per user from view history and orders"""
+    basket: Dict[int, float] = {}
+    current_user = None
+
+    rows = (
+        db.query(ViewHistory.user_id, ViewHistory.product_id)
+        .order_by(ViewHistory.user_id, ViewHistory.viewed_at.desc())
+        .yield_per(10000)
+    )
+    orders = defaultdict(set)
+    for user_id, product_id in db.query(Order.user_id, Order.product_id).yield_per(10000):
+        orders[user_id].add(product_id)
+
+    for user_id, product_id in rows:
+        if user_id != current_user:
+            if basket:
+                yield _with_orders(basket, orders.pop(current_user, ()))
+            basket = {}
+            current_user = user_id
+        if len(basket) < MAX_BASKET_SIZE:
+            basket[product_id] = VIEW_WEIGHT
+    if basket:
+        yield _with_orders(basket, orders.pop(current_user, ()))
+
+    # Buyers without any recorded views
+    for product_ids in orders.values():
+        yield _with_orders({}, product_ids)
+
+def _with_orders(basket: Dict[int, float], ordered) -> Dict[int, float]:
+    for product_id in ordered:
+        basket[product_id] = basket.get(product_id, 0.0) + ORDER_WEIGHT
+    return basket
+
+def compute_neighbours(db: Session, limit: int = NEIGHBOURS_PER_PRODUCT) -> Dict[int, List[Tuple[int, float]]]:
+    """Cosine-weighted co-occurrence neighbours for every product"""
+    popularity: Dict[int, float] = defaultdict(float)
+    pairs: Dict[Tuple[int, int], float] = defaultdict(float)
+
+    for basket in _user_baskets(db):
+        for product_id, weight in basket.items():
+            popularity[product_id] += weight * weight
+        for (a, wa), (b, wb) in combinations(sorted(basket.items()), 2):
+            pairs[(a, b)] += wa * wb
+
+    candidates: Dict[int, List[Tuple[int, float]]] = defaultdict(list)
+    for (a, b), weight in pairs.items():
+        score = weight / math.sqrt(popularity[a] * popularity[b])
+        candidates[a].append((b, score))
+        candidates[b].append((a, score))
+
+    return {
+        product_id: sorted(scored, key=lambda item: item[1], reverse=True)[:limit]
+        for product_id, scored in candidates.items()
+    }
+
+def rebuild_neighbour_table(db: Session) -> int:
+    """Replace the product_neighbours table with a fresh computation"""
+    neighbours = compute_neighbours(db)
+    rows = [
+        {"product_id": product_id, "rank": rank, "neighbour_id": neighbour_id, "score": score}
+        for product_id, scored in neighbours.items()
+        for rank, (neighbour_id, score) in enumerate(scored)
+    ]
+    db.query(ProductNeighbour).delete()
+    if rows:
+        db.bulk_insert_mappings(ProductNeighbour, rows)
+    db.commit()
+    logger.info(f"Rebuilt neighbours for {len(neighbours)} products ({len(rows)} rows)")
+    return len(rows)
+
+def load_neighbour_map(db: Session) -> Dict[int, Tuple[int, ...]]:
+    """Load the precomputed table into the product -> neighbour ids mapping the cache serves"""
+    neighbours = defaultdict(list)
+    rows = (
+        db.query(ProductNeighbour.product_id, ProductNeighbour.neighbour_id)
+        .order_by(ProductNeighbour.product_id, ProductNeighbour.rank)
+    )
+    for product_id, neighbour_id in rows:
+        neighbours[product_id].append(neighbour_id)
+    return {product_id: tuple(ids) for product_id, ids in neighbours.items()}
+
+# Offline job: run periodically (cron) with `python recommendations.py`
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        rebuild_neighbour_table(db)
+    finally:
+        db.close()
@@ -0,0 +1,39 @@
+from typing import Any, Callable, Iterable, Iterator
+import json
+
+from fastapi.responses import JSONResponse, StreamingResponse
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+
+    def dumps(value: Any) -> bytes:
+        # Decimal money values (pricing.py) are written as strings, like the stdlib fallback does
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+    FastJSONResponse = JSONResponse
+
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+# Items per chunk of a streamed array; keeps chunks around tens of kilobytes
+STREAM_BATCH_SIZE = 500
+
+def iter_json_array(items: Iterable[Any], encode: Callable[[Any], Any] = None) -> Iterator[bytes]:
+    """Encode a list as a JSON array piece by piece instead of building it in memory"""
+    yield b"["
+    first = True
+    batch = []
+    for item in items:
+        batch.append(dumps(encode(item) if encode else item))
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield (b"" if first else b",") + b",".join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield (b"" if first else b",") + b",".join(batch)
+    yield b"]"
+
+def stream_json_array(items: Iterable[Any], encode: Callable[[Any], Any] = None) -> StreamingResponse:
+    return StreamingResponse(iter_json_array(items, encode), media_type="application/json")
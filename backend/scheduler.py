@@ -0,0 +1,283 @@
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+import asyncio
+import logging
+import os
+
+from sqlalchemy import delete, func, insert, select, update
+
+from database import SessionLocal, engine
+from models import Order, OrderArchive, User, ViewHistory
+from partitions import maintain_partitions
+from vault import get_delivery_data
+
+logger = logging.getLogger(__name__)
+
+PENDING_ORDER_TTL_MINUTES = int(os.getenv("PENDING_ORDER_TTL_MINUTES", "60"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+SCHEDULER_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_INTERVAL_SECONDS", "60"))
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "500"))
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "10"))
+# Views kept per user; older ones are trimmed by the scheduler
+VIEW_HISTORY_PER_USER = int(os.getenv("VIEW_HISTORY_PER_USER", "50"))
+
+CRYPTO_METHODS = ("ton", "usdt")
+TERMINAL_STATUSES = ("completed", "cancelled", "expired")
+# Held orders (fraud.py) nobody released expire like unpaid ones
+EXPIRING_STATUSES = ("pending", "held")
+ARCHIVED_COLUMNS = [
+    "id", "user_id", "product_id", "payment_method", "amount_minor", "currency",
+    "pay_currency", "pay_amount", "rate", "rate_at", "status", "crypto_hash", "created_at", "completed_at",
+]
+
+# Users with views since the last trim; only their histories can be over the cap.
+# Per process and lost on restart: a user missed here is trimmed after their next view
+_viewed_users: Set[int] = set()
+
+def note_view(user_id: int):
+    _viewed_users.add(user_id)
+
+def take_viewed_users() -> List[int]:
+    users = sorted(_viewed_users)
+    _viewed_users.clear()
+    return users
+
+class PaymentProvider:
+    """Source of truth for crypto payment state"""
+
+    async def fetch_status(self, order_id: int) -> Optional[str]:
+        """Return "paid", "failed" or None if the payment is still open"""
+        raise NotImplementedError
+
+class StubPaymentProvider(PaymentProvider):
+    """Stand-in provider: statuses are fed in by tests; the crypto webhook settles orders itself"""
+
+    def __init__(self, statuses: Optional[Dict[int, str]] = None):
+        self.statuses = statuses if statuses is not None else {}
+
+    async def fetch_status(self, order_id: int) -> Optional[str]:
+        return self.statuses.get(order_id)
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def expire_pending_orders(now: Optional[datetime] = None) -> int:
+    """Move pending and held orders older than the TTL to "expired", one batch per transaction"""
+    cutoff = (now or _utcnow()) - timedelta(minutes=PENDING_ORDER_TTL_MINUTES)
+    expired = 0
+    while True:
+        db = SessionLocal()
+        try:
+            ids = db.scalars(
+                select(Order.id)
+                .where(Order.status.in_(EXPIRING_STATUSES), Order.created_at < cutoff)
+                .order_by(Order.id)
+                .limit(SCHEDULER_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if ids:
+                db.execute(
+                    update(Order)
+                    .where(Order.id.in_(ids), Order.status.in_(EXPIRING_STATUSES))
+                    .values(status="expired")
+                )
+            db.commit()
+        finally:
+            db.close()
+        expired += len(ids)
+        if len(ids) < SCHEDULER_BATCH_SIZE:
+            break
+    if expired:
+        logger.info(f"Expired {expired} stale pending and held orders")
+    return expired
+
+def archive_orders(now: Optional[datetime] = None) -> int:
+    """Move finished orders older than ARCHIVE_AFTER_DAYS into orders_archive"""
+    cutoff = (now or _utcnow()) - timedelta(days=ARCHIVE_AFTER_DAYS)
+    archived = 0
+    source_columns = [getattr(Order, column) for column in ARCHIVED_COLUMNS]
+    while True:
+        db = SessionLocal()
+        try:
+            ids = db.scalars(
+                select(Order.id)
+                .where(Order.status.in_(TERMINAL_STATUSES), Order.created_at < cutoff)
+                .order_by(Order.id)
+                .limit(SCHEDULER_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if ids:
+                db.execute(
+                    insert(OrderArchive).from_select(
+                        ARCHIVED_COLUMNS, select(*source_columns).where(Order.id.in_(ids))
+                    )
+                )
+                db.execute(delete(Order).where(Order.id.in_(ids)))
+            db.commit()
+        finally:
+            db.close()
+        archived += len(ids)
+        if len(ids) < SCHEDULER_BATCH_SIZE:
+            break
+    if archived:
+        logger.info(f"Archived {archived} finished orders")
+    return archived
+
+def trim_view_history(user_ids: Iterable[int]) -> int:
+    """Delete all but the newest VIEW_HISTORY_PER_USER views of these users, one batch of users per statement"""
+    user_ids = list(user_ids)
+    trimmed = 0
+    for start in range(0, len(user_ids), SCHEDULER_BATCH_SIZE):
+        batch = user_ids[start:start + SCHEDULER_BATCH_SIZE]
+        # Ranked over the (user_id, viewed_at) index of each user
+        ranked = (
+            select(
+                ViewHistory.id,
+                func.row_number().over(
+                    partition_by=ViewHistory.user_id, order_by=ViewHistory.viewed_at.desc()
+                ).label("position"),
+            )
+            .where(ViewHistory.user_id.in_(batch))
+            .subquery()
+        )
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                delete(ViewHistory)
+                .where(
+                    ViewHistory.user_id.in_(batch),
+                    ViewHistory.id.in_(select(ranked.c.id).where(ranked.c.position > VIEW_HISTORY_PER_USER)),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+        trimmed += result.rowcount
+    if trimmed:
+        logger.info(f"Trimmed {trimmed} view history rows of {len(user_ids)} users")
+    return trimmed
+
+def _pending_crypto_batch(after_id: int) -> List[int]:
+    db = SessionLocal()
+    try:
+        return db.scalars(
+            select(Order.id)
+            .where(
+                Order.status == "pending",
+                Order.payment_method.in_(CRYPTO_METHODS),
+                Order.id > after_id,
+            )
+            .order_by(Order.id)
+            .limit(SCHEDULER_BATCH_SIZE)
+        ).all()
+    finally:
+        db.close()
+
+def settle_crypto_order(db, order_id: int, paid: bool) -> Optional[tuple]:
+    """Move a pending order to "paid" or "cancelled"; return (telegram_id, delivery_data) if this call paid it
+
+    The status guard and RETURNING make the transition happen once, so the
+    webhook and the reconcilers of several workers cannot deliver one payment twice.
+    """
+    row = db.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.status == "pending")
+        .values(status="paid" if paid else "cancelled")
+        .returning(Order.user_id, Order.product_id)
+    ).first()
+    if row is None or not paid:
+        return None
+    telegram_id = db.scalar(select(User.telegram_id).where(User.id == row.user_id))
+    return telegram_id, get_delivery_data(db, row.product_id)
+
+def _apply_payment_statuses(statuses: Dict[int, str]) -> List[tuple]:
+    """Persist provider results; return (telegram_id, delivery_data) for newly paid orders"""
+    deliveries = []
+    db = SessionLocal()
+    try:
+        for order_id, provider_status in statuses.items():
+            delivery = settle_crypto_order(db, order_id, provider_status == "paid")
+            if delivery:
+                deliveries.append(delivery)
+        db.commit()
+    finally:
+        db.close()
+    return deliveries
+
+async def reconcile_crypto_orders(
+    provider: PaymentProvider,
+    on_paid: Callable[[str, str], Awaitable[None]],
+) -> int:
+    """Ask the payment provider about open crypto orders and settle the ones it knows"""
+    semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+
+    async def fetch(order_id: int):
+        async with semaphore:
+            try:
+                return order_id, await provider.fetch_status(order_id)
+            except Exception as e:
+                logger.error(f"Payment provider failed for order {order_id}: {e}")
+                return order_id, None
+
+    settled = 0
+    after_id = 0
+    while True:
+        ids = await asyncio.to_thread(_pending_crypto_batch, after_id)
+        if not ids:
+            break
+        results = await asyncio.gather(*(fetch(order_id) for order_id in ids))
+        statuses = {order_id: status for order_id, status in results if status in ("paid", "failed")}
+        if statuses:
+            for telegram_id, delivery_data in await asyncio.to_thread(_apply_payment_statuses, statuses):
+                await on_paid(telegram_id, delivery_data)
+            settled += len(statuses)
+        after_id = ids[-1]
+    if settled:
+        logger.info(f"Reconciled {settled} crypto orders")
+    return settled
+
+class OrderScheduler:
+    """Background loop for order expiry, crypto reconciliation, archiving, view history trimming and partition upkeep"""
+
+    def __init__(
+        self,
+        provider: PaymentProvider,
+        on_paid: Callable[[str, str], Awaitable[None]],
+        interval: float = SCHEDULER_INTERVAL_SECONDS,
+    ):
+        self.provider = provider
+        self.on_paid = on_paid
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    async def run_once(self):
+        # Reconcile before expiring so a paid-but-unconfirmed order is not expired
+        await reconcile_crypto_orders(self.provider, self.on_paid)
+        await asyncio.to_thread(expire_pending_orders)
+        await asyncio.to_thread(archive_orders)
+        # Taken here, on the event loop thread that fills it
+        await asyncio.to_thread(trim_view_history, take_viewed_users())
+        await asyncio.to_thread(maintain_partitions, engine)
+
+    async def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Order scheduler run failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
+from decimal import Decimal
 
 # User schemas
 class UserBase(BaseModel):
@@ -36,20 +37,38 @@ class Game(GameBase):
     class Config:
         from_attributes = True
 
+# App schemas
+class AppBase(BaseModel):
+    name: str
+    icon_url: str
+
+class AppCreate(AppBase):
+    pass
+
+class App(AppBase):
+    id: int
+    is_active: bool
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
 # Product schemas
 class ProductBase(BaseModel):
     name: str
     description: str
     image_url: str
-    price: float
-    delivery_data: str
+    # Roubles; stored as kopecks (pricing.py)
+    price: Decimal
     game_id: Optional[int] = None
     app_id: Optional[int] = None
 
 class ProductCreate(ProductBase):
-    pass
+    # Write-only: stored encrypted in the vault, never returned by the API
+    delivery_data: str
 
 class Product(ProductBase):
+    price: float
     id: int
     is_active: bool
     is_unique: bool
@@ -58,6 +77,26 @@ class Product(ProductBase):
     class Config:
         from_attributes = True
 
+class ProductBulkUpdate(BaseModel):
+    # Selection: any combination narrows the set
+    product_ids: Optional[List[int]] = None
+    game_id: Optional[int] = None
+    app_id: Optional[int] = None
+    # Changes: price wins over price_multiplier
+    price: Optional[Decimal] = Field(None, ge=0)
+    price_multiplier: Optional[Decimal] = Field(None, gt=0)
+    is_active: Optional[bool] = None
+
+class ProductImportError(BaseModel):
+    row: int
+    error: str
+
+class ProductImportResult(BaseModel):
+    total: int
+    inserted: int
+    failed: int
+    errors: List[ProductImportError]
+
 # Order schemas
 class OrderBase(BaseModel):
     product_id: int
@@ -69,7 +108,11 @@ class OrderCreate(OrderBase):
 class Order(OrderBase):
     id: int
     user_id: int
-    amount: float
+    amount_minor: int
+    currency: str
+    pay_currency: Optional[str] = None
+    pay_amount: Optional[Decimal] = None
+    rate: Optional[Decimal] = None
     status: str
     created_at: datetime
     
@@ -82,7 +125,47 @@ class DashboardResponse(BaseModel):
     games: List[Game]
     apps: List[App]
     last_viewed: Optional[Product]
+    recent_views: List[Product] = []
+    recommended: List[Product] = []
     all_products: List[Product]
+    # Pass to /api/catalog/delta?since= to fetch only later catalog changes
+    catalog_version: int
+
+# Per-user part of the dashboard, refreshed without the catalog
+class UserStateResponse(BaseModel):
+    user: User
+    last_viewed: Optional[Product]
+    recent_views: List[Product] = []
+    recommended: List[Product] = []
+    orders: List[Order] = []
+
+class CatalogDelta(BaseModel):
+    version: int
+    # True: too much changed (or unknown version), reload /api/dashboard
+    reset: bool
+    # Upserts; rows with is_active false are removed by the client
+    games: List[Game] = []
+    apps: List[App] = []
+    products: List[Product] = []
+
+# Broadcasts
+class BroadcastCreate(BaseModel):
+    text: str
+
+class Broadcast(BroadcastCreate):
+    id: int
+    status: str
+    last_user_id: int
+    sent: int
+    blocked: int
+    failed: int
+    elapsed_seconds: float
+    messages_per_second: float
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
 
 # View history
 class ViewHistoryBase(BaseModel):
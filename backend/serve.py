@@ -0,0 +1,132 @@
+from typing import Optional, Tuple
+import logging
+import multiprocessing
+import os
+import signal
+
+import uvicorn
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+# "auto" picks uvloop / httptools when installed (uvicorn[standard]) and falls back to asyncio / h11
+UVICORN_LOOP = os.getenv("UVICORN_LOOP", "auto")
+UVICORN_HTTP = os.getenv("UVICORN_HTTP", "auto")
+GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30"))
+RUN_BOT = os.getenv("RUN_BOT", "false").lower() == "true"
+
+# Postgres max_connections: "auto" asks the server, a number overrides it
+DB_MAX_CONNECTIONS = os.getenv("DB_MAX_CONNECTIONS", "auto")
+DB_MAX_CONNECTIONS_FALLBACK = 100
+# Left for other clients (psql, migrations, cron)
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "10"))
+# "budget": split the connections between workers; "fixed": use DB_POOL_SIZE / DB_MAX_OVERFLOW as set
+DB_POOL_POLICY = os.getenv("DB_POOL_POLICY", "budget")
+# Share of a worker's connections kept open in the pool; the rest is burst overflow
+DB_POOL_WARM_FRACTION = float(os.getenv("DB_POOL_WARM_FRACTION", "0.67"))
+BOT_DB_CONNECTIONS = int(os.getenv("BOT_DB_CONNECTIONS", "2"))
+# Connections per worker outside the pool: the order feed LISTEN connection
+WORKER_EXTRA_CONNECTIONS = 1
+
+def database_max_connections() -> int:
+    """Connections the database accepts from ordinary roles: max_connections minus superuser slots"""
+    if DB_MAX_CONNECTIONS != "auto":
+        return int(DB_MAX_CONNECTIONS)
+    load_dotenv()
+    url = os.getenv("DATABASE_URL", "")
+    if not url.startswith("postgresql"):
+        return DB_MAX_CONNECTIONS_FALLBACK
+    probe = create_engine(url, poolclass=NullPool)
+    try:
+        with probe.connect() as conn:
+            total = int(conn.execute(text("SHOW max_connections")).scalar())
+            superuser = int(conn.execute(text("SHOW superuser_reserved_connections")).scalar())
+        return total - superuser
+    except Exception as e:
+        logger.warning(f"Could not read max_connections ({e}); assuming {DB_MAX_CONNECTIONS_FALLBACK}")
+        return DB_MAX_CONNECTIONS_FALLBACK
+    finally:
+        probe.dispose()
+
+def pool_budget(workers: int, run_bot: bool = RUN_BOT, max_connections: Optional[int] = None) -> Tuple[int, int]:
+    """Split the connection budget into (pool_size, max_overflow) per worker"""
+    if max_connections is None:
+        max_connections = database_max_connections()
+    available = max_connections - DB_RESERVED_CONNECTIONS - (BOT_DB_CONNECTIONS if run_bot else 0)
+    per_worker = available // workers - WORKER_EXTRA_CONNECTIONS
+    if DB_POOL_POLICY == "fixed":
+        pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+        max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+        if pool_size + max_overflow > per_worker:
+            logger.warning(
+                f"DB pool {pool_size}+{max_overflow} x {workers} workers exceeds {max_connections} connections; "
+                "checkouts may fail under load"
+            )
+        return pool_size, max_overflow
+    if per_worker < 1:
+        raise SystemExit(
+            f"{workers} workers do not fit into {max_connections} connections; "
+            "lower WEB_CONCURRENCY or raise max_connections"
+        )
+    # Keep part of the share warm in the pool and allow bursts up to the full share
+    pool_size = max(1, min(per_worker, round(per_worker * DB_POOL_WARM_FRACTION)))
+    return pool_size, per_worker - pool_size
+
+def _run_bot(pool_size: int):
+    # Runs in a fresh (spawned) process, so the pool settings apply before database.py is imported
+    os.environ["DB_POOL_SIZE"] = str(pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = "0"
+    from settings import settings
+    from telegram_bot import run_bot
+
+    # SIGHUP reloads the settings instead of killing the bot
+    settings.install_signal_handler()
+    run_bot()
+
+def _forward_sighup(signum, frame):
+    # Each worker (and the bot) re-reads its own settings; the master has none to reload
+    for child in multiprocessing.active_children():
+        os.kill(child.pid, signal.SIGHUP)
+
+def serve(workers: int = WEB_CONCURRENCY):
+    pool_size, max_overflow = pool_budget(workers)
+    # Workers inherit the environment and read it in database.py
+    os.environ["DB_POOL_SIZE"] = str(pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = str(max_overflow)
+    logger.info(f"Serving with {workers} workers, DB pool {pool_size}+{max_overflow} per worker")
+
+    bot_process = None
+    if RUN_BOT:
+        bot_process = multiprocessing.get_context("spawn").Process(
+            target=_run_bot, args=(BOT_DB_CONNECTIONS,), name="telegram-bot"
+        )
+        bot_process.start()
+    if hasattr(signal, "SIGHUP"):
+        # With one worker uvicorn serves in this process and the app's own handler replaces this one
+        signal.signal(signal.SIGHUP, _forward_sighup)
+
+    try:
+        uvicorn.run(
+            "main:app",
+            host=HOST,
+            port=PORT,
+            workers=workers,
+            loop=UVICORN_LOOP,
+            http=UVICORN_HTTP,
+            proxy_headers=True,
+            timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+        )
+    finally:
+        if bot_process is not None:
+            # SIGTERM lets run_polling stop cleanly
+            bot_process.terminate()
+            bot_process.join(GRACEFUL_SHUTDOWN_SECONDS)
+
+if __name__ == "__main__":
+    serve()
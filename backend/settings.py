@@ -0,0 +1,102 @@
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+import signal
+
+from pydantic import BaseModel, ValidationError
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic_settings.sources import SettingsError
+
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# Settings file (.env format); re-read on SIGHUP and POST /api/admin/settings/reload
+SETTINGS_FILE = os.getenv("SETTINGS_FILE", ".env")
+
+class BankDetails(BaseModel):
+    """Where bank transfer orders are paid to"""
+    bank_name: str
+    card_number: str
+    account_holder: str
+    phone: Optional[str] = None
+
+class Settings(BaseSettings):
+    """Settings that change without a redeploy.
+
+    Nested fields use "__": BANK_DETAILS__CARD_NUMBER=...; PAYMENT_METHODS is
+    a JSON object {code: name}. The file wins over the environment: the
+    process environment is fixed at start, the file can be edited and re-read.
+    """
+    model_config = SettingsConfigDict(env_nested_delimiter="__", extra="ignore")
+
+    bank_details: BankDetails = BankDetails(
+        bank_name="Тинькофф",
+        card_number="5536 9137 7373 9191",
+        account_holder="Иван Иванов",
+        phone="+7 (999) 123-45-67",
+    )
+    # Enabled payment methods and their names in the group notification
+    payment_methods: Dict[str, str] = {
+        "ton": "TON",
+        "usdt": "USDT (TRC20)",
+        "bank_transfer": "Перевод по реквизитам",
+    }
+
+    @classmethod
+    def settings_customise_sources(cls, settings_cls, init_settings, env_settings, dotenv_settings, file_secret_settings):
+        return init_settings, dotenv_settings, env_settings, file_secret_settings
+
+class SettingsHolder:
+    """Current settings plus their ready-to-serve forms; reload() swaps them in"""
+
+    def __init__(self, path: Optional[str] = SETTINGS_FILE):
+        self.path = path
+        self._apply(self._read())
+
+    def _read(self) -> Settings:
+        return Settings(_env_file=self.path if self.path and os.path.exists(self.path) else None)
+
+    def _apply(self, current: Settings):
+        # Each reference is consistent on its own; handlers read them without locking
+        self.bank_details: dict = current.bank_details.model_dump(exclude_none=True)
+        self.payment_methods_json: bytes = dumps(
+            [{"code": code, "name": name} for code, name in current.payment_methods.items()]
+        )
+        self.current = current
+
+    def reload(self) -> bool:
+        """Re-read the file and the environment; a bad file keeps the previous settings"""
+        try:
+            current = self._read()
+        except (ValidationError, SettingsError) as e:
+            logger.error(f"Settings reload failed, keeping the previous settings: {e}")
+            return False
+        self._apply(current)
+        logger.info(f"Settings reloaded from {self.path}")
+        return True
+
+    def changed_fields(self, previous: Settings) -> List[str]:
+        """Names of the fields that changed, without their values"""
+        return [name for name in Settings.model_fields if getattr(previous, name) != getattr(self.current, name)]
+
+    def install_signal_handler(self):
+        """Reload on SIGHUP; call from the thread running the event loop (lifespan), or the main thread without one"""
+        if not hasattr(signal, "SIGHUP"):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        try:
+            if loop is not None:
+                loop.add_signal_handler(signal.SIGHUP, self.reload)
+            else:
+                # The bot process, before run_polling starts its loop
+                signal.signal(signal.SIGHUP, lambda signum, frame: self.reload())
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Not the main thread (TestClient) or no signals on this platform
+            logger.info("SIGHUP settings reload is not available here")
+
+settings = SettingsHolder()
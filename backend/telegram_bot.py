@@ -1,9 +1,12 @@
 import os
+from typing import Optional
 from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models import User, Order, Product
+from vault import get_delivery_data
+from settings import settings
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -19,20 +22,28 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     user = update.effective_user
     
-    # Save user to database
+    # Save user to database; the connection goes back to the pool before the reply is sent
     db = SessionLocal()
-    existing_user = db.query(User).filter(User.telegram_id == str(user.id)).first()
-    
-    if not existing_user:
-        new_user = User(
-            telegram_id=str(user.id),
-            username=user.username,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            is_admin=(user.id == ADMIN_ID)
-        )
-        db.add(new_user)
-        db.commit()
+    try:
+        existing_user = db.query(User).filter(User.telegram_id == str(user.id)).first()
+        
+        if not existing_user:
+            new_user = User(
+                telegram_id=str(user.id),
+                username=user.username,
+                first_name=user.first_name,
+                last_name=user.last_name,
+                is_admin=(user.id == ADMIN_ID)
+            )
+            db.add(new_user)
+            db.commit()
+        elif existing_user.is_blocked:
+            # Came back after blocking the bot: include in broadcasts again
+            existing_user.is_blocked = False
+            existing_user.blocked_at = None
+            db.commit()
+    finally:
+        db.close()
     
     # Send mini app link
     keyboard = [[
@@ -44,24 +55,24 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-async def send_order_notification(order: Order, product: Product, user: User):
-    """Send order notification to group"""
+async def send_order_notification(order: Order, product: Product, user: User, warning: Optional[str] = None):
+    """Send order notification to group; `warning` marks an order the fraud scorer found suspicious"""
     try:
-        payment_methods = {
-            "ton": "TON",
-            "usdt": "USDT",
-            "bank_transfer": "Перевод по реквизитам"
-        }
+        payment_methods = settings.current.payment_methods
+        # Locked at checkout (pricing.py)
+        crypto_amount = f" ({order.pay_amount.normalize():f} {order.pay_currency} по курсу {order.rate.normalize():f})" if order.pay_amount is not None else ""
         
         message = f"""
 🛒 НОВЫЙ ЗАКАЗ #{order.id}
 
 👤 Покупатель: {user.first_name} {user.last_name or ''} (@{user.username or 'N/A'})
 📦 Товар: {product.name}
-💰 Сумма: {order.amount} руб.
+💰 Сумма: {order.amount} руб.{crypto_amount}
 💳 Способ оплаты: {payment_methods.get(order.payment_method, order.payment_method)}
 🕐 Время: {order.created_at.strftime('%d.%m.%Y %H:%M')}
         """
+        if warning:
+            message += f"\n⚠️ Подозрительный заказ: {warning}"
         
         # Create keyboard for admin actions
         keyboard = []
@@ -101,49 +112,51 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     data = query.data
     db = SessionLocal()
-    
-    if data.startswith("confirm_"):
-        order_id = int(data.split("_")[1])
-        order = db.query(Order).filter(Order.id == order_id).first()
+    try:
+        if data.startswith("confirm_"):
+            order_id = int(data.split("_")[1])
+            order = db.query(Order).filter(Order.id == order_id).first()
         
-        if order:
-            order.status = "paid"
-            db.commit()
+            if order:
+                order.status = "paid"
+                db.commit()
             
-            # Send product to user
-            product = db.query(Product).filter(Product.id == order.product_id).first()
-            try:
-                await bot.send_message(
-                    chat_id=order.user.telegram_id,
-                    text=f"✅ Оплата подтверждена!\n\nВаш товар:\n{product.delivery_data}"
-                )
+                # Send product to user
+                try:
+                    delivery_data = get_delivery_data(db, order.product_id)
+                    await bot.send_message(
+                        chat_id=order.user.telegram_id,
+                        text=f"✅ Оплата подтверждена!\n\nВаш товар:\n{delivery_data}"
+                    )
                 
-                # Update message in group
-                await query.edit_message_caption(
-                    caption=query.message.caption + "\n\n✅ Оплата подтверждена, товар отправлен"
-                )
-            except Exception as e:
-                logger.error(f"Failed to send product: {e}")
+                    # Update message in group
+                    await query.edit_message_caption(
+                        caption=query.message.caption + "\n\n✅ Оплата подтверждена, товар отправлен"
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to send product: {e}")
     
-    elif data.startswith("reject_"):
-        order_id = int(data.split("_")[1])
-        order = db.query(Order).filter(Order.id == order_id).first()
+        elif data.startswith("reject_"):
+            order_id = int(data.split("_")[1])
+            order = db.query(Order).filter(Order.id == order_id).first()
         
-        if order:
-            order.status = "cancelled"
-            db.commit()
+            if order:
+                order.status = "cancelled"
+                db.commit()
             
-            try:
-                await bot.send_message(
-                    chat_id=order.user.telegram_id,
-                    text="❌ Ваш заказ был отклонён. Свяжитесь с поддержкой для уточнения деталей."
-                )
+                try:
+                    await bot.send_message(
+                        chat_id=order.user.telegram_id,
+                        text="❌ Ваш заказ был отклонён. Свяжитесь с поддержкой для уточнения деталей."
+                    )
                 
-                await query.edit_message_caption(
-                    caption=query.message.caption + "\n\n❌ Заказ отклонён"
-                )
-            except Exception as e:
-                logger.error(f"Failed to send rejection: {e}")
+                    await query.edit_message_caption(
+                        caption=query.message.caption + "\n\n❌ Заказ отклонён"
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to send rejection: {e}")
+    finally:
+        db.close()
 
 def run_bot():
     """Run the Telegram bot"""
@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+import logging
+import os
+import sys
+import threading
+import time
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from sqlalchemy import inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from models import ProductSecret
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated Fernet keys; the first encrypts, all decrypt (prepend a new key to rotate)
+VAULT_KEY = os.getenv("VAULT_KEY", "")
+VAULT_CACHE_SIZE = int(os.getenv("VAULT_CACHE_SIZE", "256"))
+VAULT_CACHE_TTL = float(os.getenv("VAULT_CACHE_TTL", "300"))
+
+class VaultError(Exception):
+    pass
+
+_fernet: Optional[MultiFernet] = None
+
+def _cipher() -> MultiFernet:
+    global _fernet
+    if _fernet is None:
+        keys = [key.strip() for key in VAULT_KEY.split(",") if key.strip()]
+        if not keys:
+            raise VaultError("VAULT_KEY is not set; generate one with `python vault.py generate-key`")
+        _fernet = MultiFernet([Fernet(key) for key in keys])
+    return _fernet
+
+def encrypt(plaintext: str) -> str:
+    return _cipher().encrypt(plaintext.encode("utf-8")).decode("ascii")
+
+def decrypt(ciphertext: str) -> str:
+    try:
+        return _cipher().decrypt(ciphertext.encode("ascii")).decode("utf-8")
+    except InvalidToken:
+        raise VaultError("Delivery data cannot be decrypted with the configured VAULT_KEY")
+
+class SecretCache:
+    """Small LRU of decrypted delivery data, so repeated deliveries of one product skip decryption"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # product_id -> (expires_at, plaintext)
+        self._entries: "OrderedDict[int, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, product_id: int) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[product_id]
+                return None
+            self._entries.move_to_end(product_id)
+            return entry[1]
+
+    def put(self, product_id: int, plaintext: str):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[product_id] = (time.monotonic() + self.ttl, plaintext)
+            self._entries.move_to_end(product_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, product_id: int):
+        with self._lock:
+            self._entries.pop(product_id, None)
+
+secret_cache = SecretCache(VAULT_CACHE_SIZE, VAULT_CACHE_TTL)
+
+def store_secret(db: Session, product_id: int, plaintext: str):
+    """Encrypt and upsert a product's delivery data; the caller commits"""
+    db.merge(ProductSecret(product_id=product_id, ciphertext=encrypt(plaintext)))
+    secret_cache.discard(product_id)
+
+def store_secrets(db: Session, secrets: Iterable[Tuple[int, str]]):
+    """Insert delivery data for freshly created products in one statement; the caller commits"""
+    rows = [{"product_id": product_id, "ciphertext": encrypt(plaintext)} for product_id, plaintext in secrets]
+    if rows:
+        db.execute(ProductSecret.__table__.insert(), rows)
+
+def get_delivery_data(db: Session, product_id: int) -> Optional[str]:
+    """Decrypt a product's delivery data at delivery time"""
+    plaintext = secret_cache.get(product_id)
+    if plaintext is not None:
+        return plaintext
+    ciphertext = db.scalar(select(ProductSecret.ciphertext).where(ProductSecret.product_id == product_id))
+    if ciphertext is None:
+        return None
+    plaintext = decrypt(ciphertext)
+    secret_cache.put(product_id, plaintext)
+    return plaintext
+
+def migrate_plaintext_secrets(engine: Engine) -> int:
+    """Move products.delivery_data of an existing database into product_secrets and drop the column"""
+    if "delivery_data" not in {column["name"] for column in inspect(engine).get_columns("products")}:
+        return 0
+    ProductSecret.__table__.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        existing = set(conn.scalars(select(ProductSecret.product_id)))
+        rows = [
+            {"product_id": product_id, "ciphertext": encrypt(plaintext)}
+            for product_id, plaintext in conn.execute(
+                text("SELECT id, delivery_data FROM products WHERE delivery_data IS NOT NULL")
+            )
+            if product_id not in existing
+        ]
+        if rows:
+            conn.execute(ProductSecret.__table__.insert(), rows)
+        conn.execute(text("ALTER TABLE products DROP COLUMN delivery_data"))
+    logger.info(f"Moved delivery data of {len(rows)} products into the vault")
+    return len(rows)
+
+# Usage:
+#   python vault.py generate-key   print a new VAULT_KEY
+#   python vault.py migrate        move plaintext products.delivery_data into product_secrets
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "generate-key":
+        print(Fernet.generate_key().decode("ascii"))
+    elif command == "migrate":
+        from database import engine
+
+        migrate_plaintext_secrets(engine)
+    else:
+        print("Usage: python vault.py generate-key | migrate")
+        sys.exit(1)
@@ -0,0 +1,285 @@
+"""Handler latency, DB queries and Bot API sends of ``backend/telegram_bot.py``.
+
+Feeds synthetic updates to the bot ``Application`` with the Bot API replaced
+by an in-process fake: a ``/start`` flood (new and returning users) and a
+confirm / reject callback storm over pending bank-transfer orders, double
+taps included. Updates are generated from a seed, so runs are comparable::
+
+    python benchmarks/bot_load.py --starts 5000 --callbacks 2000 --concurrency 1 8
+
+Uses a throwaway SQLite database unless DATABASE_URL is set; a PostgreSQL
+database given there gets benchmark users and orders written into it.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+TOKEN = "123456:BENCHMARK"
+ADMIN_ID = 1000
+ORDER_GROUP_ID = -100500
+FIRST_USER_ID = 10_000_000
+
+_database_file = None
+if "DATABASE_URL" not in os.environ:
+    _database_file = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+    os.environ["DATABASE_URL"] = f"sqlite:///{_database_file}"
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", TOKEN)
+os.environ.setdefault("ADMIN_ID", str(ADMIN_ID))
+os.environ.setdefault("ORDER_GROUP_ID", str(ORDER_GROUP_ID))
+if not os.getenv("VAULT_KEY"):
+    from cryptography.fernet import Fernet
+
+    os.environ["VAULT_KEY"] = Fernet.generate_key().decode("ascii")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sqlalchemy import event, func, select  # noqa: E402
+from telegram import Bot, Update  # noqa: E402
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+
+import telegram_bot  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import Order, Product, User  # noqa: E402
+from partitions import ensure_partitions  # noqa: E402
+from vault import store_secret  # noqa: E402
+
+# Bot API methods that deliver something to a chat
+SEND_METHODS = {"sendMessage", "sendPhoto", "editMessageCaption", "editMessageText", "answerCallbackQuery"}
+
+class FakeBotAPI(BaseRequest):
+    """Answers Bot API calls in-process with canned results, optionally after a delay"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data is not None else {}
+        if api_method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        elif api_method in ("sendMessage", "sendPhoto", "editMessageCaption", "editMessageText"):
+            self._message_id += 1
+            result = {
+                "message_id": params.get("message_id", self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text") or params.get("caption") or "",
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+    def sends(self) -> int:
+        return sum(count for method, count in self.calls.items() if method in SEND_METHODS)
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "User", "username": f"user{user_id}"}
+
+def start_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+def callback_update(update_id: int, action: str, order_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(ADMIN_ID),
+            "chat_instance": "benchmark",
+            "data": f"{action}_{order_id}",
+            "message": {
+                "message_id": order_id,
+                "date": int(time.time()),
+                "chat": {"id": ORDER_GROUP_ID, "type": "supergroup", "title": "Orders"},
+                "caption": f"🛒 НОВЫЙ ЗАКАЗ #{order_id}",
+            },
+        },
+    }
+
+def start_flood(rng: random.Random, count: int, returning: float) -> list:
+    """/start from new users, with a share of repeats from users already seen"""
+    updates = []
+    seen = []
+    for update_id in range(1, count + 1):
+        if seen and rng.random() < returning:
+            user_id = rng.choice(seen)
+        else:
+            user_id = FIRST_USER_ID + len(seen)
+            seen.append(user_id)
+        updates.append(start_update(update_id, user_id))
+    return updates
+
+def callback_storm(rng: random.Random, count: int, order_ids: list, double_taps: float) -> list:
+    """Confirm / reject presses on pending orders; some are pressed twice"""
+    updates = []
+    orders = order_ids[:]
+    rng.shuffle(orders)
+    update_id = 1_000_000
+    for order_id in orders:
+        if len(updates) >= count:
+            break
+        action = "confirm" if rng.random() < 0.8 else "reject"
+        for _ in range(2 if rng.random() < double_taps else 1):
+            update_id += 1
+            updates.append(callback_update(update_id, action, order_id))
+    return updates[:count]
+
+def seed_orders(count: int) -> list:
+    """One buyer, one product with delivery data and `count` pending bank-transfer orders"""
+    db = SessionLocal()
+    try:
+        buyer = db.query(User).filter(User.telegram_id == str(FIRST_USER_ID - 1)).first()
+        if buyer is None:
+            buyer = User(telegram_id=str(FIRST_USER_ID - 1), first_name="Buyer")
+            db.add(buyer)
+        product = Product(name="Benchmark product", description="", image_url="", price=100, is_active=True)
+        db.add(product)
+        db.flush()
+        store_secret(db, product.id, "login:password")
+        # Explicit ids: SQLite cannot generate them for the partitioned orders table
+        first_id = (db.scalar(select(func.max(Order.id))) or 0) + 1
+        now = datetime.now(timezone.utc)
+        db.execute(Order.__table__.insert(), [
+            {
+                "id": order_id, "user_id": buyer.id, "product_id": product.id, "payment_method": "bank_transfer",
+                "amount_minor": 10000, "currency": "RUB", "status": "pending", "created_at": now,
+            }
+            for order_id in range(first_id, first_id + count)
+        ])
+        db.commit()
+        return list(range(first_id, first_id + count))
+    finally:
+        db.close()
+
+class PoolExhausted(Exception):
+    pass
+
+def pool_capacity() -> int:
+    return engine.pool.size() + getattr(engine.pool, "_max_overflow", 0)
+
+async def run(application: Application, api: FakeBotAPI, queries: QueryCounter, updates: list, concurrency: int):
+    parsed = [Update.de_json(data, application.bot) for data in updates]
+    latencies = []
+    queue = iter(parsed)
+    api.calls.clear()
+    queries.count = 0
+    gc.collect()
+    held_before = engine.pool.checkedout()
+
+    async def worker():
+        for update in queue:
+            # A handler that leaves its session open keeps a connection; once the pool is empty the
+            # next checkout blocks the event loop for the pool timeout, so stop here instead
+            if engine.pool.checkedout() >= pool_capacity() - concurrency:
+                raise PoolExhausted(f"{engine.pool.checkedout()} connections held after {len(latencies)} updates")
+            started = time.perf_counter()
+            await application.process_update(update)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return {
+        "updates/s": len(parsed) / elapsed,
+        "p50 ms": percentile(0.5),
+        "p95 ms": percentile(0.95),
+        "p99 ms": percentile(0.99),
+        "queries/update": queries.count / len(parsed),
+        "sends/s": api.sends() / elapsed,
+        # Connections still checked out once the updates are handled: sessions the handlers did not close
+        "leaked conns": engine.pool.checkedout() - held_before,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--starts", type=int, default=2000, help="/start updates")
+    parser.add_argument("--returning", type=float, default=0.3, help="share of /start from known users")
+    parser.add_argument("--callbacks", type=int, default=1000, help="confirm / reject updates")
+    parser.add_argument("--double-taps", type=float, default=0.1, help="share of buttons pressed twice")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8], help="updates in flight")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="fake Bot API delay, ms")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    ensure_partitions(engine)
+
+    api = FakeBotAPI(args.api_latency / 1000)
+    application = Application.builder().token(TOKEN).request(api).get_updates_request(FakeBotAPI()).build()
+    application.add_handler(CommandHandler("start", telegram_bot.start))
+    application.add_handler(CallbackQueryHandler(telegram_bot.button_callback))
+    # Handlers also send through the module-level bot
+    telegram_bot.bot = Bot(token=TOKEN, request=api)
+    await telegram_bot.bot.initialize()
+    await application.initialize()
+    queries = QueryCounter()
+
+    columns = ["updates/s", "p50 ms", "p95 ms", "p99 ms", "queries/update", "sends/s", "leaked conns"]
+    print(f"{'scenario':<10} {'conc':>4} " + " ".join(f"{column:>14}" for column in columns))
+    try:
+        for concurrency in args.concurrency:
+            rng = random.Random(args.seed)
+            scenarios = [("start", start_flood(rng, args.starts, args.returning))]
+            order_ids = seed_orders(args.callbacks)
+            scenarios.append(("callbacks", callback_storm(rng, args.callbacks, order_ids, args.double_taps)))
+            for name, updates in scenarios:
+                try:
+                    result = await run(application, api, queries, updates, concurrency)
+                except PoolExhausted as e:
+                    print(f"{name:<10} {concurrency:>4} pool exhausted: {e}")
+                    continue
+                print(f"{name:<10} {concurrency:>4} " + " ".join(f"{result[column]:>14.2f}" for column in columns))
+    finally:
+        await application.shutdown()
+        await telegram_bot.bot.shutdown()
+        engine.dispose()
+        if _database_file:
+            os.unlink(_database_file)
+
+if __name__ == "__main__":
+    asyncio.run(main())
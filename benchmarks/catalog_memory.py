@@ -0,0 +1,90 @@
+"""Memory and listing latency of the in-memory catalog.
+
+Compares the original list-of-dicts store with ``api/catalog.py`` after
+every listing has been served once, so the cached JSON is counted too::
+
+    python benchmarks/catalog_memory.py --sizes 10000 100000 1000000
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+from catalog import Catalog, ACTIVE_APPS, ACTIVE_GAMES, ALL_PRODUCTS, view_key  # noqa: E402
+
+GAMES = 50
+APPS = 20
+IMAGES = ["https://via.placeholder.com/300?text=%d" % i for i in range(100)]
+
+def product_rows(count):
+    for i in range(1, count + 1):
+        row = {
+            "id": i,
+            "name": "Product %d" % i,
+            "description": "Stock account #%d" % i,
+            "price": float(100 + i % 5000),
+            "image_url": IMAGES[i % len(IMAGES)],
+            "delivery_data": "login_%d:password_%d" % (i, i),
+            "is_active": i % 10 != 0,
+        }
+        if i % 3:
+            row["game_id"] = i % GAMES + 1
+        else:
+            row["app_id"] = i % APPS + 1
+        yield row
+
+def rendered_catalog(count):
+    """The catalog as it sits in a serving process: every listing already encoded once"""
+    catalog = Catalog(products=product_rows(count))
+    for key in [ACTIVE_GAMES, ACTIVE_APPS, ALL_PRODUCTS]:
+        catalog.listing_json(key)
+    for game_id in range(1, GAMES + 1):
+        catalog.listing_json(view_key("game", game_id))
+    for app_id in range(1, APPS + 1):
+        catalog.listing_json(view_key("app", app_id))
+    return catalog
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    store = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return store, size
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def run(count):
+    dicts, dict_bytes = measure(lambda: list(product_rows(count)))
+    _, record_bytes = measure(lambda: Catalog(products=product_rows(count)))
+    catalog, catalog_bytes = measure(lambda: rendered_catalog(count))
+
+    game_id = 7
+    dict_all = timed(lambda: [p for p in dicts if p.get("is_active", True)])
+    dict_game = timed(lambda: [p for p in dicts if p.get("game_id") == game_id and p.get("is_active", True)])
+    cold_all = timed(lambda: (catalog._invalidate(ALL_PRODUCTS), catalog.listing_json(ALL_PRODUCTS)), repeat=1)
+    warm_all = timed(lambda: catalog.listing_json(ALL_PRODUCTS))
+    warm_game = timed(lambda: catalog.listing_json(view_key("game", game_id)))
+
+    print(
+        f"{count:>9} | dict {dict_bytes / count:7.0f} B/product | records {record_bytes / count:7.0f} B/product, with listings {catalog_bytes / count:7.0f} B/product"
+        f" | all: dict {dict_all:8.2f} ms, catalog cold {cold_all:8.2f} ms, warm {warm_all:6.3f} ms"
+        f" | game: dict {dict_game:8.2f} ms, catalog warm {warm_game:6.3f} ms"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size)
@@ -0,0 +1,164 @@
+"""Checkout latency: the old three-round-trip order insert against ``backend/checkout.py``.
+
+A flash sale: many buyers ordering the same product at once. Each path is run
+with several threads of checkouts; reported are checkouts per second, latency
+percentiles and statements per checkout::
+
+    python benchmarks/checkout_latency.py --checkouts 2000 --concurrency 1 8 --rtt 0.5
+
+``--rtt`` adds a simulated network round trip (ms) to every statement and
+every COMMIT, which is where the paths differ on a real network. Against
+PostgreSQL (DATABASE_URL) the prepared and unprepared fast paths are both
+measured; with the default throwaway SQLite database only the unprepared one.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_database_file = None
+if "DATABASE_URL" not in os.environ:
+    _database_file = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+    os.environ["DATABASE_URL"] = f"sqlite:///{_database_file}"
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+import checkout  # noqa: E402
+from cache import checkout_products  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import Order, Product, User  # noqa: E402
+from pricing import CURRENCY  # noqa: E402
+
+FIRST_USER_ID = 20_000_000
+
+class RoundTrips:
+    """Counts statements and COMMITs, sleeping `rtt` seconds for each like a network round trip would"""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._round_trip)
+        # After the commit, so SQLite's write lock is not held through the simulated trip
+        event.listen(Session, "after_commit", self._round_trip)
+
+    def _round_trip(self, *args):
+        with self._lock:
+            self.count += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+def create_schema():
+    Base.metadata.create_all(engine)
+    if engine.dialect.name == "postgresql":
+        from partitions import ensure_partitions
+
+        ensure_partitions(engine)
+
+def seed(buyers: int) -> tuple:
+    """`buyers` users and the one product on sale"""
+    db = SessionLocal()
+    try:
+        product = Product(name="Flash sale product", description="", image_url="", price=499, is_active=True)
+        db.add(product)
+        existing = {
+            telegram_id for (telegram_id,) in
+            db.query(User.telegram_id).filter(User.telegram_id >= str(FIRST_USER_ID)).all()
+        }
+        db.add_all(
+            User(telegram_id=str(FIRST_USER_ID + number), first_name="Buyer")
+            for number in range(buyers) if str(FIRST_USER_ID + number) not in existing
+        )
+        db.commit()
+        user_ids = [user_id for (user_id,) in db.query(User.id).filter(User.telegram_id >= str(FIRST_USER_ID)).all()]
+        return product.id, user_ids
+    finally:
+        db.close()
+
+def legacy_checkout(user_id: int, product_id: int):
+    """What create_order did before checkout.py: look up, insert and commit, refresh"""
+    db = SessionLocal()
+    try:
+        product = db.query(Product).filter(Product.id == product_id).first()
+        order = Order(
+            user_id=user_id, product_id=product_id, payment_method="bank_transfer",
+            amount_minor=product.price_minor, currency=CURRENCY, status="pending",
+        )
+        db.add(order)
+        db.commit()
+        db.refresh(order)
+        return order.id
+    finally:
+        db.close()
+
+def fast_checkout(user_id: int, product_id: int):
+    db = SessionLocal()
+    try:
+        connection = db.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+        _, order, _ = checkout.place_order(connection, user_id, product_id, "bank_transfer", lambda price_minor: None)
+        return order.id
+    finally:
+        db.close()
+
+def run(path, product_id: int, user_ids: list, checkouts: int, concurrency: int, round_trips: RoundTrips) -> dict:
+    latencies = []
+
+    def one(number: int):
+        started = time.perf_counter()
+        path(user_ids[number % len(user_ids)], product_id)
+        latencies.append(time.perf_counter() - started)
+
+    round_trips.count = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(checkouts)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return {
+        "checkouts/s": checkouts / elapsed,
+        "p50 ms": percentile(0.5),
+        "p95 ms": percentile(0.95),
+        "p99 ms": percentile(0.99),
+        "trips/checkout": round_trips.count / checkouts,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--checkouts", type=int, default=2000)
+    parser.add_argument("--buyers", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8], help="checkouts in flight")
+    parser.add_argument("--rtt", type=float, default=0.5, help="simulated round trip per statement / COMMIT, ms")
+    args = parser.parse_args()
+
+    create_schema()
+    product_id, user_ids = seed(args.buyers)
+    round_trips = RoundTrips(args.rtt / 1000)
+    paths = [("legacy", legacy_checkout, True), ("fast", fast_checkout, False)]
+    if engine.dialect.name == "postgresql":
+        paths.append(("prepared", fast_checkout, True))
+
+    columns = ["checkouts/s", "p50 ms", "p95 ms", "p99 ms", "trips/checkout"]
+    print(f"{'path':<10} {'conc':>4} " + " ".join(f"{column:>14}" for column in columns))
+    try:
+        for concurrency in args.concurrency:
+            for name, path, prepared in paths:
+                checkout.CHECKOUT_PREPARED = prepared
+                checkout_products.invalidate([product_id])
+                # Warm-up outside the measurement: pool connections, the cached product, PREPARE
+                run(path, product_id, user_ids, concurrency * 2, concurrency, round_trips)
+                result = run(path, product_id, user_ids, args.checkouts, concurrency, round_trips)
+                print(f"{name:<10} {concurrency:>4} " + " ".join(f"{result[column]:>14.2f}" for column in columns))
+    finally:
+        engine.dispose()
+        if _database_file:
+            os.unlink(_database_file)
+
+if __name__ == "__main__":
+    main()
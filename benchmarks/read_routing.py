@@ -0,0 +1,96 @@
+"""Read routing of ``backend/database.py`` on two databases: a primary and a replica.
+
+The replica is a copy taken before the run that never catches up, the worst
+case of replication lag. Reports which database served the user reads, and
+whether a user still sees their own new order when the next request lands on
+another worker (the in-process pin is gone, only the pin cookie is left)::
+
+    python benchmarks/read_routing.py --reads 200
+
+Uses two throwaway SQLite databases; DATABASE_URL / REPLICA_DATABASE_URLS
+are ignored so nothing is written to a real database.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from collections import Counter
+
+_directory = tempfile.mkdtemp()
+_primary_file = os.path.join(_directory, "primary.db")
+_replica_file = os.path.join(_directory, "replica.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_primary_file}"
+os.environ["REPLICA_DATABASE_URLS"] = f"sqlite:///{_replica_file}"
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCHMARK")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+import database  # noqa: E402
+from database import Base, SessionLocal, engine, replica_engines  # noqa: E402
+from models import Product, User  # noqa: E402
+
+USER_TOKEN = "7001"
+
+def seed():
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        db.add(User(telegram_id=USER_TOKEN, first_name="Reader"))
+        product = Product(name="Routed product", description="", image_url="", price=100, is_active=True)
+        db.add(product)
+        db.commit()
+        product_id = product.id
+    finally:
+        db.close()
+    engine.dispose()
+    replica_engines[0].dispose()
+    # The replica as of now; later writes reach only the primary
+    shutil.copyfile(_primary_file, _replica_file)
+    return product_id
+
+def count_queries(served: Counter):
+    for name, db_engine in (("primary", engine), ("replica", replica_engines[0])):
+        event.listen(db_engine, "before_cursor_execute", lambda *args, name=name: served.update([name]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reads", type=int, default=200, help="/api/me/state reads before the order")
+    args = parser.parse_args()
+
+    product_id = seed()
+    import main as app_module
+
+    served = Counter()
+    headers = {"Authorization": f"Bearer {USER_TOKEN}"}
+    try:
+        with TestClient(app_module.app) as client:
+            count_queries(served)
+            for _ in range(args.reads):
+                client.get("/api/me/state", headers=headers).raise_for_status()
+            before = dict(served)
+            print(f"reads without own writes: {before.get('replica', 0)} replica / {before.get('primary', 0)} primary queries")
+
+            response = client.post("/api/orders", json={"product_id": product_id, "payment_method": "bank_transfer"}, headers=headers)
+            response.raise_for_status()
+            order_id = response.json()["order_id"]
+
+            # The next request on another worker: no pin in its memory
+            database._sticky_until.clear()
+            with_cookie = [order["id"] for order in client.get("/api/me/state", headers=headers).json()["orders"]]
+            client.cookies.clear()
+            without_cookie = [order["id"] for order in client.get("/api/me/state", headers=headers).json()["orders"]]
+
+            print(f"own order #{order_id} on another worker, with the pin cookie: {'seen' if order_id in with_cookie else 'MISSING'}")
+            print(f"own order #{order_id} on another worker, without it (stale replica): {'seen' if order_id in without_cookie else 'not seen'}")
+    finally:
+        engine.dispose()
+        replica_engines[0].dispose()
+        shutil.rmtree(_directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Serialization time and bytes on the wire for catalog listings.
+
+Compares FastAPI's default encoding path (``jsonable_encoder`` + stdlib json),
+orjson, the cached encoded listing of ``api/catalog.py`` and the raw / gzip /
+brotli sizes of the result::
+
+    python benchmarks/serialization.py --sizes 1000 10000 100000
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from catalog import Catalog, ALL_PRODUCTS  # noqa: E402
+from compression import BROTLI_QUALITY, GZIP_LEVEL, brotli  # noqa: E402
+from responses import dumps, iter_json_array  # noqa: E402
+
+from catalog_memory import product_rows  # noqa: E402
+
+def timed(func, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def stdlib_path(rows):
+    # What JSONResponse does for a handler returning a list of dicts
+    return json.dumps(jsonable_encoder(rows), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def run(size, repeat):
+    catalog = Catalog(products=list(product_rows(size)))
+    rows = catalog.listing(ALL_PRODUCTS)
+    catalog.listing_json(ALL_PRODUCTS)
+
+    results = [
+        ("jsonable_encoder + json", *timed(lambda: stdlib_path(rows), repeat)),
+        ("orjson", *timed(lambda: dumps(rows), repeat)),
+        ("streamed array", *timed(lambda: b"".join(iter_json_array(rows)), repeat)),
+        ("cached bytes", *timed(lambda: catalog.listing_json(ALL_PRODUCTS), repeat)),
+    ]
+    print(f"\n{size} products")
+    for name, seconds, _ in results:
+        print(f"  {name:<26} {seconds * 1000:9.2f} ms")
+
+    body = results[1][2]
+    sizes = [("raw", len(body), 0.0)]
+    seconds, compressed = timed(lambda: gzip.compress(body, GZIP_LEVEL), repeat)
+    sizes.append((f"gzip -{GZIP_LEVEL}", len(compressed), seconds))
+    if brotli is not None:
+        seconds, compressed = timed(lambda: brotli.compress(body, quality=BROTLI_QUALITY), repeat)
+        sizes.append((f"brotli q{BROTLI_QUALITY}", len(compressed), seconds))
+    for name, length, seconds in sizes:
+        print(f"  {name:<26} {length / 1024:9.1f} KiB  {seconds * 1000:8.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.repeat)
+
+if __name__ == "__main__":
+    main()
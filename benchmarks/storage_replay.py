@@ -0,0 +1,72 @@
+"""Startup replay time of the in-memory engine's storage (``api/storage.py``).
+
+Writes N orders through the journal, then measures load time from a snapshot
+and from the journal alone::
+
+    python benchmarks/storage_replay.py --orders 1000000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+from storage import Storage  # noqa: E402
+
+def make_order(order_id):
+    return {
+        "id": order_id,
+        "user_id": "123456789",
+        "user_name": "Пользователь",
+        "product_id": order_id % 500,
+        "product_name": "Пакет Jade x10000",
+        "payment_method": "ton",
+        "amount": 2500.0,
+        "status": "pending",
+        "created_at": "2026-10-19T12:00:00.123456",
+    }
+
+def write(path, count, snapshot):
+    orders = {}
+    storage = Storage(path, state=lambda: {"orders": orders}, snapshot_every=count + 1)
+    storage.load()
+    started = time.perf_counter()
+    for order_id in range(1, count + 1):
+        order = make_order(order_id)
+        orders[order_id] = order
+        storage.put("orders", order_id, order)
+    storage.flush()
+    elapsed = time.perf_counter() - started
+    if snapshot:
+        storage.snapshot()
+    storage.close()
+    return elapsed
+
+def load(path):
+    storage = Storage(path, state=dict)
+    started = time.perf_counter()
+    tables = storage.load()
+    elapsed = time.perf_counter() - started
+    storage.close()
+    return len(tables.get("orders", {})), elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    for snapshot in (True, False):
+        path = tempfile.mkdtemp(prefix="storage-bench-")
+        try:
+            write_time = write(path, args.orders, snapshot)
+            loaded, load_time = load(path)
+            source = "snapshot" if snapshot else "journal "
+            print(
+                f"{source}: wrote {args.orders} orders in {write_time:.2f}s "
+                f"({args.orders / write_time:,.0f}/s), loaded {loaded} in {load_time:.3f}s"
+            )
+        finally:
+            shutil.rmtree(path)
@@ -1,4 +1,4 @@
-import { useState } from 'react'
+import { useState, useEffect } from 'react'
 import { useTelegram } from '../hooks/useTelegram'
 import axios from 'axios'
 
@@ -147,11 +147,121 @@ const AppManager = () => {
   )
 }
 
+const ORDER_STATUS_LABELS = {
+  pending: 'Ожидает оплаты',
+  held: 'На проверке',
+  paid: 'Оплачен',
+  completed: 'Выполнен',
+  cancelled: 'Отменен',
+  expired: 'Просрочен',
+}
+
 const OrderManager = () => {
+  const { user, webApp } = useTelegram()
+  const [orders, setOrders] = useState([])
+  const [connected, setConnected] = useState(false)
+  const token = `Bearer ${webApp?.initData || user?.telegram_id}`
+
+  useEffect(() => {
+    if (!user) return
+
+    let source = null
+    let retry = null
+    let closed = false
+
+    // Live feed: a snapshot of recent orders once, then only changed orders.
+    // Every connection takes a fresh single-use ticket, so the token never goes into a URL
+    const connect = async () => {
+      try {
+        const response = await axios.post('/api/admin/orders/stream-ticket', {}, {
+          headers: {
+            Authorization: token
+          }
+        })
+        if (closed) return
+        source = new EventSource(`/api/admin/orders/stream?ticket=${encodeURIComponent(response.data.ticket)}`)
+      } catch (error) {
+        console.error('Error opening order feed:', error)
+        retry = setTimeout(connect, 5000)
+        return
+      }
+
+      source.onopen = () => setConnected(true)
+      source.onerror = () => {
+        // The ticket is spent: reconnect with a new one instead of letting EventSource retry the old URL
+        setConnected(false)
+        source.close()
+        retry = setTimeout(connect, 3000)
+      }
+
+      source.addEventListener('snapshot', (event) => {
+        const snapshot = JSON.parse(event.data)
+        setOrders(snapshot.sort((a, b) => b.id - a.id))
+      })
+
+      source.addEventListener('order', (event) => {
+        const order = JSON.parse(event.data)
+        setOrders(current => [order, ...current.filter(o => o.id !== order.id)].sort((a, b) => b.id - a.id))
+      })
+    }
+
+    connect()
+
+    return () => {
+      closed = true
+      clearTimeout(retry)
+      if (source) source.close()
+    }
+  }, [user])
+
+  const handleComplete = async (orderId) => {
+    try {
+      await axios.put(`/api/admin/orders/${orderId}/complete`, {}, {
+        headers: {
+          Authorization: token
+        }
+      })
+      // The updated order arrives through the feed
+    } catch (error) {
+      console.error('Error completing order:', error)
+    }
+  }
+
   return (
     <div>
-      <h3 className="text-xl font-bold dark:text-white mb-4">Заказы</h3>
-      {/* Order management implementation */}
+      <div className="flex justify-between items-center mb-4">
+        <h3 className="text-xl font-bold dark:text-white">Заказы</h3>
+        <span className={`text-sm ${connected ? 'text-green-500' : 'text-gray-400'}`}>
+          {connected ? '● онлайн' : '○ переподключение...'}
+        </span>
+      </div>
+
+      {orders.length === 0 ? (
+        <p className="text-gray-500 dark:text-gray-400">Заказов пока нет</p>
+      ) : (
+        <div className="space-y-3">
+          {orders.map(order => (
+            <div key={order.id} className="bg-gray-50 dark:bg-gray-700 p-4 rounded-xl flex justify-between items-center">
+              <div>
+                <div className="font-semibold dark:text-white">
+                  Заказ #{order.id} {order.product_name || `товар #${order.product_id}`}
+                </div>
+                <div className="text-sm text-gray-500 dark:text-gray-400">
+                  {(order.amount_minor / 100).toFixed(2)} ₽ · {order.payment_method} · {ORDER_STATUS_LABELS[order.status] || order.status}
+                </div>
+              </div>
+              {(order.status === 'pending' || order.status === 'paid') && (
+                <button
+                  onClick={() => handleComplete(order.id)}
+                  className="bg-green-500 text-white px-4 py-2 rounded-lg hover:bg-green-600"
+                >
+                  Выполнить
+                </button>
+              )}
+            </div>
+          ))}
+        </div>
+      )}
     </div>
   )
 }
@@ -4,21 +4,47 @@ import GameCard from './GameCard'
 import ProductCard from './ProductCard'
 import axios from 'axios'
 
+// Apply catalog delta rows: upsert by id, drop deactivated ones
+const mergeById = (items = [], changes = []) => {
+  const byId = new Map(items.map(item => [item.id, item]))
+  changes.forEach(item => {
+    if (item.is_active === false) {
+      byId.delete(item.id)
+    } else {
+      byId.set(item.id, item)
+    }
+  })
+  return Array.from(byId.values())
+}
+
 const Dashboard = () => {
   const { user, webApp } = useTelegram()
   const [dashboardData, setDashboardData] = useState(null)
   const [loading, setLoading] = useState(true)
 
+  const authHeaders = () => ({
+    Authorization: `Bearer ${webApp?.initData || user?.telegram_id}`
+  })
+
   useEffect(() => {
     fetchDashboard()
   }, [])
 
+  // Coming back to the Mini App pulls only what changed in the catalog meanwhile
+  useEffect(() => {
+    const onVisibilityChange = () => {
+      if (document.visibilityState === 'visible') {
+        fetchCatalogDelta()
+      }
+    }
+    document.addEventListener('visibilitychange', onVisibilityChange)
+    return () => document.removeEventListener('visibilitychange', onVisibilityChange)
+  }, [dashboardData?.catalog_version])
+
   const fetchDashboard = async () => {
     try {
       const response = await axios.get('/api/dashboard', {
-        headers: {
-          Authorization: `Bearer ${webApp?.initData || user?.telegram_id}`
-        }
+        headers: authHeaders()
       })
       setDashboardData(response.data)
     } catch (error) {
@@ -28,14 +54,50 @@ const Dashboard = () => {
     }
   }
 
+  // Profile, history and orders only; the catalog stays as it is
+  const fetchUserState = async () => {
+    try {
+      const response = await axios.get('/api/me/state', {
+        headers: authHeaders()
+      })
+      const { last_viewed, recent_views, recommended } = response.data
+      setDashboardData(data => ({ ...data, last_viewed, recent_views, recommended }))
+    } catch (error) {
+      console.error('Error fetching user state:', error)
+    }
+  }
+
+  const fetchCatalogDelta = async () => {
+    if (!dashboardData?.catalog_version) {
+      return
+    }
+    try {
+      const response = await axios.get('/api/catalog/delta', {
+        params: { since: dashboardData.catalog_version }
+      })
+      const delta = response.data
+      if (delta.reset) {
+        fetchDashboard()
+        return
+      }
+      setDashboardData(data => ({
+        ...data,
+        games: mergeById(data.games, delta.games),
+        apps: mergeById(data.apps, delta.apps),
+        all_products: mergeById(data.all_products, delta.products),
+        catalog_version: delta.version
+      }))
+    } catch (error) {
+      console.error('Error fetching catalog changes:', error)
+    }
+  }
+
   const handleDeleteViewHistory = async (productId) => {
     try {
       await axios.delete(`/api/view-history/${productId}`, {
-        headers: {
-          Authorization: `Bearer ${webApp?.initData || user?.telegram_id}`
-        }
+        headers: authHeaders()
       })
-      fetchDashboard()
+      fetchUserState()
     } catch (error) {
       console.error('Error deleting view history:', error)
     }
@@ -149,6 +149,11 @@ const PaymentModal = ({ product, onClose }) => {
                   <h3 className="text-xl font-bold dark:text-white mb-4">
                     Открываю оплату...
                   </h3>
+                  {orderData.crypto_amount && (
+                    <p className="text-2xl font-bold dark:text-white mb-2">
+                      {orderData.crypto_amount} {orderData.crypto_currency}
+                    </p>
+                  )}
                   <p className="text-gray-600 dark:text-gray-400 mb-6">
                     Если оплата не открылась автоматически, нажмите кнопку ниже
                   </p>
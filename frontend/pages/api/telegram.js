@@ -1,19 +1,28 @@
-// Прокси для Telegram API
+// Прокси для Telegram API через Python-шлюз (/api/bot/batch): пул соединений, пакеты, дедупликация.
+// Тело: { method, data } - один вызов, ответ Bot API как раньше; { calls: [{ method, params }] } - пакет, { results }
+const GATEWAY_URL = process.env.BOT_GATEWAY_URL || `${process.env.NEXT_PUBLIC_API_URL || ''}/api/bot/batch`
+
 export default async function handler(req, res) {
   if (req.method === 'POST') {
-    const { method, data } = req.body
-    
+    const { method, data, calls } = req.body
+    const batch = calls || [{ method, params: data || {} }]
+
     try {
-      const response = await fetch(`https://api.telegram.org/bot${process.env.TELEGRAM_BOT_TOKEN}/${method}`, {
+      const response = await fetch(GATEWAY_URL, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'X-Gateway-Secret': process.env.BOT_GATEWAY_SECRET || '',
         },
-        body: JSON.stringify(data)
+        body: JSON.stringify({ calls: batch })
       })
-      
+
       const result = await response.json()
-      res.status(200).json(result)
+      if (!response.ok) {
+        res.status(response.status).json(result)
+      } else {
+        res.status(200).json(calls ? result : result.results[0])
+      }
     } catch (error) {
       res.status(500).json({ error: error.message })
     }
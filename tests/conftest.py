@@ -0,0 +1,18 @@
+"""Tests run from the repository root: pip install pytest, then python -m pytest tests
+
+backend/ modules import each other by plain name, so backend/ goes on
+sys.path; api/ modules are imported as the api package (api.storage,
+api.ids) because several of them share a name with a backend module.
+Nothing here talks to PostgreSQL or Telegram.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TEST")
+
+for path in (ROOT, os.path.join(ROOT, "backend")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import pytest
+
+import fraud
+from fraud import FLAG, HOLD, OK, FeatureStore, UserFeatures, assess
+
+NOW = 1_700_000_000.0
+
+@pytest.fixture(autouse=True)
+def frozen_time(monkeypatch):
+    clock = SimpleNamespace(time=lambda: NOW, monotonic=lambda: clock.monotonic_now, monotonic_now=100.0)
+    monkeypatch.setattr(fraud, "time", clock)
+    monkeypatch.setattr(fraud, "FRAUD_VELOCITY_WINDOW_MINUTES", 10)
+    monkeypatch.setattr(fraud, "FRAUD_MAX_ORDERS_PER_WINDOW", 5)
+    monkeypatch.setattr(fraud, "FRAUD_MAX_UNPAID", 3)
+    monkeypatch.setattr(fraud, "FRAUD_NEW_ACCOUNT_MINUTES", 10)
+    monkeypatch.setattr(fraud, "FRAUD_FLAG_SCORE", 2)
+    monkeypatch.setattr(fraud, "FRAUD_HOLD_SCORE", 3)
+    return clock
+
+def features(orders=(), account_age_minutes=None):
+    user = UserFeatures(
+        loaded_at=100.0,
+        account_created=NOW - account_age_minutes * 60 if account_age_minutes is not None else None,
+    )
+    for order_id, status, age_minutes in orders:
+        user.apply(order_id, status, NOW - age_minutes * 60)
+    return user
+
+def test_established_user_is_ok():
+    verdict = assess(features([(1, "paid", 1)], account_age_minutes=60 * 24), NOW)
+    assert (verdict.action, verdict.score, verdict.reasons) == (OK, 0, ())
+
+def test_velocity_flags():
+    orders = [(n, "paid", 1) for n in range(6)] + [(99, "paid", 11)]
+    verdict = assess(features(orders), NOW)
+    assert (verdict.action, verdict.score) == (FLAG, 2)
+    assert verdict.reasons == ("6 заказов за 10 мин",)
+
+def test_unpaid_orders_and_new_account_hold():
+    orders = [(n, "pending", 60) for n in range(3)] + [(3, "held", 60)]
+    verdict = assess(features(orders, account_age_minutes=5), NOW)
+    assert (verdict.action, verdict.score) == (HOLD, 3)
+    assert len(verdict.reasons) == 2
+
+def test_applying_an_event_twice_changes_nothing():
+    user = features([(1, "pending", 1)])
+    user.apply(1, "pending", NOW - 60)
+    assert user.velocity(NOW) == 1 and user.unpaid == {1}
+    user.apply(1, "paid", NOW - 60)
+    assert user.unpaid == set()
+
+def test_orders_leave_the_velocity_window():
+    user = features([(1, "paid", 9)])
+    assert user.velocity(NOW) == 1
+    assert user.velocity(NOW + 61) == 0
+    assert user.recent == {}
+
+def test_feature_store_expires_and_evicts(frozen_time):
+    store = FeatureStore(max_users=2, ttl=60)
+    for user_id in (1, 2):
+        store.put(user_id, UserFeatures(loaded_at=100.0))
+    store.get(1)
+    store.put(3, UserFeatures(loaded_at=100.0))
+    assert store.get(2) is None and len(store) == 2
+    frozen_time.monotonic_now = 160.0
+    assert store.get(1) is None
+
+def test_feature_store_applies_events_of_known_users_only():
+    store = FeatureStore(max_users=10, ttl=60)
+    store.put(1, UserFeatures(loaded_at=100.0))
+    store.apply_event({"id": 7, "user_id": 1, "status": "pending", "created_at": "2023-11-14T22:13:00+00:00"})
+    store.apply_event({"id": 8, "user_id": 2, "status": "pending"})
+    assert store.get(1).unpaid == {7}
+    assert store.get(2) is None
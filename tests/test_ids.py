@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+from api import ids
+from api.ids import MAX_SEQUENCE, MAX_WORKER_ID, SEQUENCE_BITS, WORKER_BITS, IdGenerator
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=ids.EPOCH_MS / 1000 + 1000.0)
+    monkeypatch.setattr(ids, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+def parts(issued_id):
+    return (
+        issued_id >> (WORKER_BITS + SEQUENCE_BITS),
+        (issued_id >> SEQUENCE_BITS) & MAX_WORKER_ID,
+        issued_id & MAX_SEQUENCE,
+    )
+
+def test_id_layout(clock):
+    assert parts(IdGenerator(5).next_id()) == (1_000_000, 5, 0)
+
+def test_ids_increase_within_a_millisecond(clock):
+    generator = IdGenerator(1)
+    issued = [generator.next_id() for _ in range(MAX_SEQUENCE + 2)]
+    assert issued == sorted(set(issued))
+    # The sequence ran out: the timestamp moves ahead of the clock
+    assert parts(issued[-1]) == (1_000_001, 1, 0)
+
+def test_ids_increase_when_the_clock_goes_back(clock):
+    generator = IdGenerator(1)
+    first = generator.next_id()
+    clock.now -= 5
+    assert generator.next_id() > first
+
+def test_advance_past(clock):
+    generator = IdGenerator(1)
+    issued_elsewhere = IdGenerator(1).next_id() + (10 << (WORKER_BITS + SEQUENCE_BITS))
+    generator.advance_past(issued_elsewhere)
+    assert generator.next_id() > issued_elsewhere
+
+def test_ids_are_safe_javascript_integers():
+    assert IdGenerator(MAX_WORKER_ID).next_id() < 2 ** 53
+
+@pytest.mark.parametrize("worker_id", [-1, MAX_WORKER_ID + 1])
+def test_worker_id_out_of_range(worker_id):
+    with pytest.raises(ValueError):
+        IdGenerator(worker_id)
+
+def test_leased_worker_ids_are_distinct(tmp_path, monkeypatch):
+    monkeypatch.setattr(ids, "_leases", [])
+    leased = [ids.lease_worker_id(str(tmp_path)) for _ in range(3)]
+    assert leased == [0, 1, 2]
+    ids._leases.pop(1).close()
+    assert ids.lease_worker_id(str(tmp_path)) == 1
+    for lease in ids._leases:
+        lease.close()
+
+def test_shared_worker_id_is_rejected(monkeypatch):
+    monkeypatch.setenv("WORKER_ID", "3")
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    with pytest.raises(RuntimeError):
+        ids._worker_id_from_env()
+
+def test_several_workers_without_storage_are_rejected(monkeypatch):
+    monkeypatch.delenv("WORKER_ID", raising=False)
+    monkeypatch.delenv("STORAGE_PATH", raising=False)
+    monkeypatch.setenv("WEB_CONCURRENCY", "2")
+    with pytest.raises(RuntimeError):
+        ids._worker_id_from_env()
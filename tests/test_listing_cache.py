@@ -0,0 +1,123 @@
+from types import SimpleNamespace
+import threading
+import time
+
+import pytest
+
+import cache
+from cache import ListingCache, NeighbourTable, listing_key, product_listing_keys
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+@pytest.fixture
+def listings(clock):
+    return ListingCache(max_entries=3, ttl=30, settle=2)
+
+KEY = listing_key("game", 1)
+
+def test_put_then_get_counts_hits_and_misses(listings, clock):
+    assert listings.get(KEY) is None
+    listings.put(KEY, b"[1]", loaded_at=clock.now)
+    assert listings.get(KEY) == b"[1]"
+    assert listings.stats() == {"entries": 1, "hits": 1, "misses": 1, "hit_ratio": 0.5}
+
+def test_entry_expires_after_ttl(listings, clock):
+    listings.put(KEY, b"[1]", loaded_at=clock.now)
+    clock.now += 29.9
+    assert listings.get(KEY) == b"[1]"
+    clock.now += 0.1
+    assert listings.get(KEY) is None
+    assert listings.stats()["entries"] == 0
+
+def test_invalidate_drops_entry(listings, clock):
+    listings.put(KEY, b"[1]", loaded_at=clock.now)
+    other = listing_key("app", 1)
+    listings.put(other, b"[2]", loaded_at=clock.now)
+    clock.now += 10
+    listings.invalidate([KEY])
+    assert listings.get(KEY) is None
+    assert listings.get(other) == b"[2]"
+
+def test_fill_started_before_invalidation_is_not_kept(listings, clock):
+    loaded_at = clock.now
+    clock.now += 1
+    listings.invalidate([KEY])
+    listings.put(KEY, b"[old]", loaded_at=loaded_at)
+    assert listings.get(KEY) is None
+
+def test_fill_inside_settle_window_is_not_kept(listings, clock):
+    listings.invalidate([KEY])
+    clock.now += 2
+    listings.put(KEY, b"[maybe stale]", loaded_at=clock.now)
+    assert listings.get(KEY) is None
+    clock.now += 0.01
+    listings.put(KEY, b"[fresh]", loaded_at=clock.now)
+    assert listings.get(KEY) == b"[fresh]"
+
+def test_least_recently_used_entry_is_evicted(listings, clock):
+    keys = [listing_key("game", n) for n in range(4)]
+    for key in keys[:3]:
+        listings.put(key, b"[]", loaded_at=clock.now)
+    listings.get(keys[0])
+    listings.put(keys[3], b"[]", loaded_at=clock.now)
+    assert listings.get(keys[1]) is None
+    assert listings.get(keys[0]) == b"[]"
+
+def test_invalidation_marks_are_pruned_past_the_ttl(listings, clock):
+    listings.invalidate([listing_key("game", n) for n in range(4)])
+    clock.now += 31
+    listings.invalidate([KEY])
+    assert set(listings._invalidated_at) == {KEY}
+
+def test_product_listing_keys():
+    keys = product_listing_keys([(1, None), (None, 2), (1, 2)])
+    assert sorted(keys) == [("app", 2), ("game", 1)]
+
+def test_neighbour_table_refreshes_in_the_background(clock):
+    table = NeighbourTable(ttl=60)
+    table.load({1: (2, 3)})
+    clock.now += 61
+    started, release = threading.Event(), threading.Event()
+
+    def slow_loader():
+        started.set()
+        release.wait(5)
+        return {1: (4,)}
+
+    table.refresh_if_stale(slow_loader)
+    assert started.wait(5)
+    # The old map is served while the reload runs, and only one reload runs
+    assert table.recommend([1], 10) == [2, 3]
+    table.refresh_if_stale(lambda: pytest.fail("second refresh started"))
+    release.set()
+    for _ in range(500):
+        if not table._refreshing:
+            break
+        time.sleep(0.01)
+    assert table.recommend([1], 10) == [4]
+    assert not table.is_stale()
+
+def test_failed_neighbour_refresh_keeps_the_map(clock):
+    table = NeighbourTable(ttl=60)
+    table.load({1: (2,)})
+    clock.now += 61
+
+    def failing_loader():
+        raise RuntimeError("database is down")
+
+    table._refresh(failing_loader)
+    assert table.recommend([1], 10) == [2]
+    assert not table.is_stale()
+    clock.now += 6
+    assert table.is_stale()
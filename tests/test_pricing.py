@@ -0,0 +1,67 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+import pricing
+from pricing import PricingError, RateSource, RateTable, StubRateSource, from_minor, parse_rates, to_minor
+
+class FailingSource(RateSource):
+    def fetch(self):
+        raise OSError("rates.json is missing")
+
+@pytest.mark.parametrize("amount, minor", [
+    (100, 10000),
+    ("99.99", 9999),
+    ("0.005", 1),
+    ("0.004", 0),
+    (1.1, 110),
+])
+def test_to_minor(amount, minor):
+    assert to_minor(amount) == minor
+
+@pytest.mark.parametrize("amount", ["abc", "NaN", "Infinity"])
+def test_to_minor_rejects_non_amounts(amount):
+    with pytest.raises(ValueError):
+        to_minor(amount)
+
+def test_from_minor():
+    assert from_minor(12345) == Decimal("123.45")
+    assert str(from_minor(100)) == "1.00"
+    assert from_minor(None) is None
+
+def test_parse_rates():
+    assert parse_rates(" ton = 250 ,USDT=95.5,") == {"TON": Decimal("250"), "USDT": Decimal("95.5")}
+
+def test_quote_rounds_up_to_the_coin_step():
+    table = RateTable(StubRateSource({"TON": Decimal("300"), "USDT": Decimal("95")}), ttl=60, interval=60)
+    assert table.refresh()
+    ton = table.quote("ton", 10000)
+    assert (ton.currency, ton.amount, ton.rate) == ("TON", Decimal("0.3334"), Decimal("300"))
+    assert table.quote("usdt", 10000).amount == Decimal("1.06")
+
+def test_quote_without_rates_raises():
+    table = RateTable(FailingSource(), ttl=60, interval=60)
+    assert not table.refresh()
+    with pytest.raises(PricingError):
+        table.quote("ton", 10000)
+
+def test_failed_refresh_keeps_rates_until_the_ttl(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(pricing, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    table = RateTable(StubRateSource({"TON": Decimal("250")}), ttl=60, interval=60)
+    assert table.refresh()
+    table.source = FailingSource()
+    now[0] = 30
+    assert not table.refresh()
+    assert table.rate("TON")[0] == Decimal("250")
+    now[0] = 61
+    assert table.rate("TON") is None
+
+@pytest.mark.parametrize("rate", ["0", "-1", "NaN"])
+def test_refresh_rejects_bad_rates(rate):
+    table = RateTable(StubRateSource({"TON": Decimal("250")}), ttl=60, interval=60)
+    assert table.refresh()
+    table.source = StubRateSource({"TON": Decimal(rate)})
+    assert not table.refresh()
+    assert table.rate("TON")[0] == Decimal("250")
@@ -0,0 +1,53 @@
+"""backend/ and api/ are deployed separately (api/ alone on Vercel), so each
+keeps its own copy of these modules. The copies must not drift: the code has
+to match, only comments and docstrings (English vs Russian) may differ.
+"""
+import ast
+import os
+
+import pytest
+
+from conftest import ROOT
+
+def _strip_docstrings(tree: ast.AST) -> ast.AST:
+    for node in ast.walk(tree):
+        body = getattr(node, "body", None)
+        if (
+            isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef))
+            and body
+            and isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Constant)
+            and isinstance(body[0].value.value, str)
+        ):
+            node.body = body[1:] or [ast.Pass()]
+    return tree
+
+def _parse(directory: str, module: str) -> ast.Module:
+    with open(os.path.join(ROOT, directory, f"{module}.py"), encoding="utf-8") as f:
+        return _strip_docstrings(ast.parse(f.read()))
+
+def _dump(node: ast.AST) -> str:
+    return ast.dump(node, include_attributes=False)
+
+@pytest.mark.parametrize("module", ["compression", "ratelimit", "responses"])
+def test_copies_match(module):
+    assert _dump(_parse("backend", module)) == _dump(_parse("api", module))
+
+def _top_level(tree: ast.Module) -> dict:
+    return {node.name: node for node in tree.body if isinstance(node, (ast.ClassDef, ast.FunctionDef))}
+
+def _class_fields(node: ast.ClassDef) -> dict:
+    return {
+        item.target.id: _dump(item)
+        for item in node.body
+        if isinstance(item, ast.AnnAssign) and isinstance(item.target, ast.Name)
+    }
+
+def test_settings_share_behaviour_and_defaults():
+    backend, api = _top_level(_parse("backend", "settings")), _top_level(_parse("api", "settings"))
+    for name in ("BankDetails", "SettingsHolder"):
+        assert _dump(backend[name]) == _dump(api[name]), name
+    # api/ has extra fields (it has no separate config module); the shared ones must agree
+    backend_fields, api_fields = _class_fields(backend["Settings"]), _class_fields(api["Settings"])
+    for name, field in backend_fields.items():
+        assert api_fields.get(name) == field, name
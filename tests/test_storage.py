@@ -0,0 +1,120 @@
+import marshal
+import os
+import threading
+
+import pytest
+
+from api.storage import Storage
+
+@pytest.fixture
+def open_storage(tmp_path):
+    opened = []
+
+    def open_storage(**kwargs):
+        tables = {}
+        storage = Storage(str(tmp_path), lambda: tables, **kwargs)
+        tables.update(storage.load())
+        opened.append(storage)
+        return storage, tables
+
+    yield open_storage
+    for storage in opened:
+        if not storage._closed:
+            storage.close()
+
+def write(storage, tables, table, key, record):
+    if record is None:
+        tables.setdefault(table, {}).pop(key, None)
+    else:
+        tables.setdefault(table, {})[key] = record
+    storage.put(table, key, record)
+
+def journals(path):
+    return sorted(name for name in os.listdir(path) if name.startswith("journal."))
+
+def test_changes_survive_a_restart(open_storage):
+    storage, tables = open_storage()
+    write(storage, tables, "orders", 1, {"status": "pending"})
+    write(storage, tables, "orders", 2, {"status": "pending"})
+    write(storage, tables, "orders", 1, {"status": "paid"})
+    write(storage, tables, "orders", 2, None)
+    storage.close()
+
+    _, reloaded = open_storage()
+    assert reloaded == {"orders": {1: {"status": "paid"}}}
+
+def test_torn_tail_is_truncated(open_storage, tmp_path):
+    storage, tables = open_storage()
+    write(storage, tables, "orders", 1, {"status": "pending"})
+    storage.flush()
+    write(storage, tables, "orders", 2, {"status": "pending"})
+    storage.close()
+    journal_path = tmp_path / journals(tmp_path)[-1]
+    size = journal_path.stat().st_size
+    with open(journal_path, "r+b") as f:
+        f.truncate(size - 3)
+
+    _, reloaded = open_storage()
+    assert reloaded == {"orders": {1: {"status": "pending"}}}
+    assert journal_path.stat().st_size < size - 3
+
+def test_corrupt_frame_stops_replay(open_storage, tmp_path):
+    storage, tables = open_storage()
+    write(storage, tables, "orders", 1, {"status": "pending"})
+    storage.flush()
+    write(storage, tables, "orders", 2, {"status": "pending"})
+    storage.close()
+    journal_path = tmp_path / journals(tmp_path)[-1]
+    data = bytearray(journal_path.read_bytes())
+    data[-2] ^= 0xFF
+    journal_path.write_bytes(bytes(data))
+
+    _, reloaded = open_storage()
+    assert reloaded == {"orders": {1: {"status": "pending"}}}
+
+def test_snapshot_replaces_old_journals(open_storage, tmp_path):
+    storage, tables = open_storage(snapshot_every=3)
+    for key in range(5):
+        write(storage, tables, "products", key, {"name": f"product {key}"})
+    storage.close()
+
+    assert (tmp_path / "snapshot.bin").exists()
+    assert len(journals(tmp_path)) == 1
+    _, reloaded = open_storage()
+    assert reloaded == {"products": {key: {"name": f"product {key}"} for key in range(5)}}
+
+def test_snapshot_is_taken_off_the_writing_thread(tmp_path):
+    tables = {}
+    running = threading.Event()
+    release = threading.Event()
+    snapshot_threads = []
+
+    def state():
+        snapshot_threads.append(threading.current_thread())
+        running.set()
+        release.wait(5)
+        return tables
+
+    storage = Storage(str(tmp_path), state, snapshot_every=2)
+    storage.load()
+    for key in range(2):
+        write(storage, tables, "products", key, {"name": f"product {key}"})
+    assert running.wait(5)
+    # The snapshot is still in progress: later writes neither block nor start a second one
+    for key in range(2, 7):
+        write(storage, tables, "products", key, {"name": f"product {key}"})
+    release.set()
+    storage.close()
+
+    assert snapshot_threads and threading.current_thread() not in snapshot_threads
+    assert len(snapshot_threads) == 1
+    reloaded = Storage(str(tmp_path), dict)
+    assert reloaded.load() == {"products": {key: {"name": f"product {key}"} for key in range(7)}}
+    reloaded.close()
+
+def test_legacy_snapshot_is_loaded(open_storage, tmp_path):
+    snapshot = {"segment": 0, "tables": {"orders": {1: {"status": "paid"}}}}
+    (tmp_path / "snapshot.bin").write_bytes(marshal.dumps(snapshot))
+
+    _, reloaded = open_storage()
+    assert reloaded == {"orders": {1: {"status": "paid"}}}